@@ -0,0 +1,128 @@
+"""
+Bytes-in/bytes-out benchmark of the Connection frame codec.
+
+Usage: python -m benchmarks.connection [frames_count] [image_bytes_count]
+"""
+
+import asyncio
+import base64
+import os
+import sys
+import time
+
+from helpers.connection import (
+    Connection,
+)
+
+
+class _NullWriter(object):
+    __slots__ = ()
+
+    def close(self) -> None:
+        pass
+
+
+def _build_raw_data(
+    message_id: int,
+    image_bytes_count: int,
+) -> dict:
+    return {
+        'id': message_id,
+        'image_base64_encoded_text_list': [
+            base64.b64encode(
+                os.urandom(
+                    image_bytes_count,
+                ),
+            ).decode(),
+        ],
+        'text': 'Benchmark message',
+        'type': 'message',
+    }
+
+
+async def _run(
+    frames_count: int,
+    image_bytes_count: int,
+) -> None:
+    raw_data_list = [
+        _build_raw_data(
+            message_id,
+            image_bytes_count,
+        )
+        for message_id in range(frames_count)
+    ]
+
+    start_time = time.perf_counter()
+
+    frame_bytes_list = [
+        Connection.encode_raw_data(
+            raw_data,
+        )
+        for raw_data in raw_data_list
+    ]
+
+    encode_duration = time.perf_counter() - start_time
+
+    bytes_count = sum(
+        map(
+            len,
+            frame_bytes_list,
+        ),
+    )
+
+    reader = asyncio.StreamReader(
+        limit=bytes_count + 1,
+    )
+
+    for frame_bytes in frame_bytes_list:
+        reader.feed_data(
+            frame_bytes,
+        )
+
+    reader.feed_eof()
+
+    connection = Connection(
+        reader,
+        _NullWriter(),  # noqa
+    )
+
+    start_time = time.perf_counter()
+
+    for _ in range(frames_count):
+        raw_data = await connection.read_raw_data()
+
+        assert raw_data is not None
+
+    decode_duration = time.perf_counter() - start_time
+
+    megabytes_count = bytes_count / (1024 * 1024)
+
+    print(
+        f'Frames: {frames_count}, total: {megabytes_count:.1f} MiB',
+    )
+
+    print(
+        f'Encode: {megabytes_count / encode_duration:.1f} MiB/s'
+        f', {frames_count / encode_duration:.1f} frames/s',
+    )
+
+    print(
+        f'Decode: {megabytes_count / decode_duration:.1f} MiB/s'
+        f', {frames_count / decode_duration:.1f} frames/s',
+    )
+
+
+def main() -> None:
+    frames_count = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    image_bytes_count = int(sys.argv[2]) if len(sys.argv) > 2 else 1024 * 1024
+
+    asyncio.run(
+        _run(
+            frames_count,
+            image_bytes_count,
+        ),
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,213 @@
+"""
+Frames per second and round-trip latency through a Connection pair over a
+socket pair, on the default selector event loop and on uvloop if installed.
+
+Usage: python -m benchmarks.event_loop [frames_count] [round_trips_count]
+"""
+
+import asyncio
+import socket
+import sys
+import time
+import typing
+
+try:
+    import uvloop
+except ImportError:  # optional dependency
+    uvloop = None
+
+from helpers.connection import (
+    Connection,
+)
+
+
+async def _create_connection_pair() -> tuple[Connection, Connection]:
+    left_socket, right_socket = socket.socketpair()
+
+    left_reader, left_writer = await asyncio.open_connection(
+        sock=left_socket,
+    )
+
+    right_reader, right_writer = await asyncio.open_connection(
+        sock=right_socket,
+    )
+
+    left_connection = Connection(
+        left_reader,
+        left_writer,
+    )
+
+    right_connection = Connection(
+        right_reader,
+        right_writer,
+    )
+
+    # Hellos are consumed by read_raw_data(), so the handshake completes with
+    # the first frames read below
+
+    for connection in (
+        left_connection,
+        right_connection,
+    ):
+        await connection.send_hello_raw_data_async()
+
+    return left_connection, right_connection
+
+
+async def _measure_frames_per_second(
+    frames_count: int,
+) -> float:
+    sender_connection, receiver_connection = await _create_connection_pair()
+
+    async def receive() -> None:
+        for _ in range(frames_count):
+            raw_data = await receiver_connection.read_raw_data()
+
+            assert raw_data is not None
+
+    start_time = time.perf_counter()
+
+    receiving_task = asyncio.create_task(
+        receive(),
+    )
+
+    for message_id in range(frames_count):
+        await sender_connection.send_raw_data_async(
+            {
+                'id': message_id,
+                'text': 'Benchmark message',
+                'type': 'message',
+            },
+        )
+
+    await receiving_task
+
+    duration = time.perf_counter() - start_time
+
+    sender_connection.close()
+    receiver_connection.close()
+
+    return frames_count / duration
+
+
+async def _measure_round_trip_latency(
+    round_trips_count: int,
+) -> list[float]:
+    client_connection, server_connection = await _create_connection_pair()
+
+    async def echo() -> None:
+        while True:
+            raw_data = await server_connection.read_raw_data()
+
+            if raw_data is None:
+                return
+
+            await server_connection.send_raw_data_async(
+                {
+                    'message_id': raw_data['id'],
+                    'type': 'ack',
+                },
+            )
+
+    echoing_task = asyncio.create_task(
+        echo(),
+    )
+
+    latencies: list[float] = []
+
+    for message_id in range(round_trips_count):
+        start_time = time.perf_counter()
+
+        await client_connection.send_raw_data_async(
+            {
+                'id': message_id,
+                'text': 'Benchmark message',
+                'type': 'message',
+            },
+        )
+
+        raw_data = await client_connection.read_raw_data()
+
+        assert raw_data is not None
+
+        latencies.append(
+            time.perf_counter() - start_time,
+        )
+
+    echoing_task.cancel()
+
+    client_connection.close()
+    server_connection.close()
+
+    latencies.sort()
+
+    return latencies
+
+
+async def _run(
+    frames_count: int,
+    round_trips_count: int,
+) -> None:
+    frames_per_second = await _measure_frames_per_second(
+        frames_count,
+    )
+
+    # Loop overhead is well below the millisecond buckets of
+    # LatencyHistogram, so exact percentiles of the sorted samples are shown
+
+    latencies = await _measure_round_trip_latency(
+        round_trips_count,
+    )
+
+    latency_percentile_text = '/'.join(
+        f'{latencies[len(latencies) * latency_percentile // 100] * 1000:.3f}'  # ms
+        for latency_percentile in (50, 95, 99)
+    )
+
+    print(
+        f'  {frames_per_second:.0f} frames/s'
+        f', round trip p50/p95/p99: {latency_percentile_text} ms',
+    )
+
+
+def main() -> None:
+    frames_count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    round_trips_count = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+
+    event_loop_factory_by_name_map: dict[
+        str, typing.Callable[[], asyncio.AbstractEventLoop]
+    ] = {
+        'asyncio': asyncio.SelectorEventLoop,
+    }
+
+    if uvloop is not None:
+        event_loop_factory_by_name_map['uvloop'] = uvloop.new_event_loop
+    else:
+        print(
+            'uvloop is not installed, measuring the default loop only',
+        )
+
+    print(
+        f'Frames: {frames_count}, round trips: {round_trips_count}',
+    )
+
+    for event_loop_name, event_loop_factory in (
+        event_loop_factory_by_name_map.items()
+    ):
+        print(
+            f'{event_loop_name}:',
+        )
+
+        with asyncio.Runner(
+            loop_factory=event_loop_factory,
+        ) as runner:
+            runner.run(
+                _run(
+                    frames_count,
+                    round_trips_count,
+                ),
+            )
+
+
+if __name__ == '__main__':
+    main()
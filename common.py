@@ -10,3 +10,5 @@ class Constants(object):
 
     class Path(object):
         DataDirectory = './data/'
+
+        AttachmentDirectory = DataDirectory + 'attachments/'
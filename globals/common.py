@@ -1,13 +1,114 @@
+import asyncio
+import os
+import typing
+
+from helpers.networking_loop import (
+    NetworkingLoop,
+)
+
+from helpers.timer_service import (
+    TimerService,
+)
+
+from helpers.token_bucket import (
+    TokenBucket,
+)
+
+
 __all__ = ('g_common_globals',)
 
 
+# Outbound bytes per second of all connections together; 0 means unlimited
+_OUTBOUND_RATE_BYTES_PER_SECOND = float(
+    os.getenv(
+        'OUTBOUND_RATE_BYTES_PER_SECOND',
+        0,
+    ),
+)
+
+# Bytes that may be sent at once after an idle period
+_OUTBOUND_BURST_BYTES_COUNT = int(
+    os.getenv(
+        'OUTBOUND_BURST_BYTES_COUNT',
+        256 * 1024,  # B
+    ),
+)
+
+
 class CommonGlobals(object):
-    __slots__ = ()
+    __slots__ = (
+        '__networking_loop',
+        '__outbound_token_bucket',
+        '__timer_service_by_event_loop_map',
+    )
 
     def __init__(self) -> None:
         super().__init__()
 
-        pass
+        # Runs the data connections when they are kept off the GUI loop
+
+        self.__networking_loop: NetworkingLoop | None = None
+
+        self.__outbound_token_bucket = TokenBucket(
+            _OUTBOUND_RATE_BYTES_PER_SECOND,
+            _OUTBOUND_BURST_BYTES_COUNT,
+        )
+
+        # The GUI loop and the networking loop each have their own timers;
+        # both live as long as the application does
+
+        self.__timer_service_by_event_loop_map: (
+            dict[asyncio.AbstractEventLoop, TimerService]
+        ) = {}
+
+    def get_networking_loop(self) -> NetworkingLoop | None:
+        return self.__networking_loop
+
+    def get_outbound_token_bucket(self) -> TokenBucket:
+        return self.__outbound_token_bucket
+
+    def get_timer_service(self) -> TimerService:
+        """Returns the timer service of the running event loop."""
+        event_loop = asyncio.get_running_loop()
+
+        timer_service_by_event_loop_map = self.__timer_service_by_event_loop_map
+
+        timer_service = timer_service_by_event_loop_map.get(
+            event_loop,
+        )
+
+        if timer_service is None:
+            timer_service = timer_service_by_event_loop_map[event_loop] = (
+                TimerService(
+                    event_loop,
+                )
+            )
+
+        return timer_service
+
+    def start_networking_loop(
+        self,
+        event_loop_factory: typing.Callable[[], asyncio.AbstractEventLoop] = (
+            asyncio.new_event_loop
+        ),
+    ) -> None:
+        assert self.__networking_loop is None, None
+
+        networking_loop = self.__networking_loop = NetworkingLoop(
+            event_loop_factory,
+        )
+
+        networking_loop.start()
+
+    def stop_networking_loop(self) -> None:
+        networking_loop = self.__networking_loop
+
+        if networking_loop is None:
+            return
+
+        networking_loop.stop()
+
+        self.__networking_loop = None
 
 
 g_common_globals = CommonGlobals()
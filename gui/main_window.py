@@ -1,12 +1,20 @@
 import asyncio
-import codecs
+import binascii
+import functools
+import hashlib
 import io
 import logging
 import os
+import time
 import traceback
 import typing
 import uuid
 
+from base64 import (
+    b64decode,
+    b64encode,
+)
+
 from collections import (
     defaultdict,
 )
@@ -23,7 +31,6 @@ from ipaddress import (
 )
 
 import i2plib  # noqa
-import orjson
 
 from PySide6.QtCore import (
     Qt,
@@ -47,6 +54,10 @@ from common import (
     Constants,
 )
 
+from globals.common import (
+    g_common_globals,
+)
+
 from globals.i2p import (
     g_i2p_globals,
 )
@@ -59,16 +70,52 @@ from gui.text_edit.message import (
     MessageTextEdit,
 )
 
+from helpers.attachment_store import (
+    AttachmentStore,
+)
+
+from helpers.config_store import (
+    ConfigStore,
+)
+
 from helpers.connection import (
     Connection,
 )
 
+from helpers.debouncer import (
+    Debouncer,
+)
+
+from helpers.frame import (
+    AckFrame,
+    AttachmentAckFrame,
+    AttachmentChunkFrame,
+    FrameError,
+    MessageFrame,
+    PingFrame,
+    SelectiveAckFrame,
+    decode_frame,
+)
+
 from helpers.i2p_sam_session import (
     I2PSAMSession,
 )
 
-from utils.json import (
-    JsonUtils,
+from helpers.reconnect_backoff import (
+    ReconnectBackoff,
+)
+
+from helpers.retransmission_scheduler import (
+    RetransmissionScheduler,
+)
+
+from helpers.task_supervisor import (
+    RestartPolicy,
+    TaskSupervisor,
+)
+
+from utils.async_ import (
+    create_task_with_exceptions_logging,
 )
 
 from utils.qt import (
@@ -84,6 +131,29 @@ _CONFIG_FILE_NAME = os.getenv('CONFIG_FILE_NAME', 'config.json')
 
 _CONFIG_FILE_PATH = Constants.Path.DataDirectory + _CONFIG_FILE_NAME
 
+_ATTACHMENT_CHUNK_BYTES_COUNT = 64 * 1024  # B
+
+# Bytes of an attachment that may be sent ahead of the remote acknowledgement
+_ATTACHMENT_WINDOW_BYTES_COUNT = 1024 * 1024  # B
+
+_MAX_ATTACHMENT_BYTES_COUNT = 64 * 1024 * 1024  # B
+
+# Messages that may be sent ahead of the remote acknowledgements
+_MAX_IN_FLIGHT_MESSAGES_COUNT = 16
+
+# Messages received within this window are acknowledged by a single frame,
+# unless that many of them arrive sooner
+_DELAYED_ACK_TIMEOUT = 0.2  # s
+
+_MAX_DELAYED_ACK_MESSAGES_COUNT = 32
+
+# Selective acknowledgement ranges beyond this count are left for later frames
+_MAX_SELECTIVE_ACK_RANGES_COUNT = 64
+
+# SAM handshakes for an edited address or port start once it has not been
+# changed for this long, so that no round trips are made for half-typed values
+_RECONFIGURATION_DEBOUNCE_DELAY = 0.5  # s
+
 
 logger = logging.getLogger(
     __name__,
@@ -93,13 +163,25 @@ logger = logging.getLogger(
 class MainWindow(QMainWindow):
     __slots__ = (
         '__config_raw_data',
+        '__config_store',
         '__conversation_text_edit',
-        '__last_remote_i2p_node_ping_timestamp_ms',
+        '__data_connection_task_supervisor',
         '__local_i2p_node_address',
         '__local_i2p_node_address_key_label',
         '__local_i2p_node_address_value_label',
+        '__local_i2p_node_attachment_acked_offset_by_id_map',
+        '__local_i2p_node_attachment_bytes_by_id_map',
+        '__local_i2p_node_attachment_sending_event',
         '__local_i2p_node_destination',
         '__local_i2p_node_message_raw_data_by_id_map',
+        '__local_i2p_node_message_retransmission_scheduler',
+        '__local_i2p_node_message_sending_event',
+        '__local_i2p_node_outbound_traffic_key_label',
+        '__local_i2p_node_outbound_traffic_value_label',
+        '__local_i2p_node_sam_session_data_connection_metrics_key_label',
+        '__local_i2p_node_sam_session_data_connection_metrics_value_label',
+        '__local_i2p_node_sam_session_data_connection_tasks_key_label',
+        '__local_i2p_node_sam_session_data_connection_tasks_value_label',
         '__local_i2p_node_pending_message_raw_data_by_id_map',
         '__local_i2p_node_sam_ip_address',
         '__local_i2p_node_sam_ip_address_line_edit',
@@ -110,10 +192,18 @@ class MainWindow(QMainWindow):
         '__local_i2p_node_sam_session',
         '__local_i2p_node_sam_session_control_connection',
         '__local_i2p_node_sam_session_creation_event',
+        '__local_i2p_node_sam_session_data_connection_election_condition',
+        '__local_i2p_node_sam_session_established_incoming_data_connection',
+        '__local_i2p_node_sam_session_established_outgoing_data_connection',
+        '__local_i2p_node_sam_session_incoming_data_connection_reconnect_backoff',
         '__local_i2p_node_sam_session_incoming_data_connection_status_key_label',
         '__local_i2p_node_sam_session_incoming_data_connection_status_value_label',
+        '__local_i2p_node_sam_session_outgoing_data_connection_creation_task',
+        '__local_i2p_node_sam_session_outgoing_data_connection_reconnect_backoff',
         '__local_i2p_node_sam_session_outgoing_data_connection_status_key_label',
         '__local_i2p_node_sam_session_outgoing_data_connection_status_value_label',
+        '__local_i2p_node_sam_session_reconfiguration_debouncer',
+        '__local_i2p_node_sam_session_reconnect_backoff',
         '__local_i2p_node_sam_session_status_key_label',
         '__local_i2p_node_sam_session_status_raw',
         '__local_i2p_node_sam_session_status_value_label',
@@ -122,10 +212,14 @@ class MainWindow(QMainWindow):
         '__message_text_edit',
         '__remote_i2p_node_address_line_edit',
         '__remote_i2p_node_address_raw',
+        '__remote_i2p_node_address_reconfiguration_debouncer',
+        '__remote_i2p_node_attachment_store',
         '__remote_i2p_node_message_raw_data_by_id_map',
         '__remote_i2p_node_status_key_label',
         '__remote_i2p_node_status_raw',
         '__remote_i2p_node_status_value_label',
+        '__remote_i2p_node_delayed_ack_task_by_connection_map',
+        '__remote_i2p_node_unacked_messages_count_by_connection_map',
     )
 
     def __init__(
@@ -137,11 +231,12 @@ class MainWindow(QMainWindow):
             'Secure Messenger',
         )
 
-        config_raw_data: dict = JsonUtils.read_if_exists(
+        config_store = ConfigStore(
             _CONFIG_FILE_PATH,
-            default=(dict),
         )
 
+        config_raw_data = config_store.get_raw_data()
+
         local_i2p_node_destination_raw = config_raw_data.get(
             'local_i2p_node_destination_raw',
         )
@@ -376,6 +471,56 @@ class MainWindow(QMainWindow):
 
         remote_i2p_node_status_value_label.setStyleSheet('color: red')
 
+        local_i2p_node_outbound_traffic_key_label = QtUtils.create_label(
+            alignment=(Qt.AlignmentFlag.AlignLeft),
+            label_text=('Исходящий трафик'),
+        )
+
+        local_i2p_node_outbound_traffic_value_label = QtUtils.create_label(
+            alignment=(Qt.AlignmentFlag.AlignLeft),
+            label_text=(
+                self.__get_local_i2p_node_outbound_traffic_text()
+            ),
+        )
+
+        local_i2p_node_sam_session_data_connection_metrics_key_label = (
+            QtUtils.create_label(
+                alignment=(Qt.AlignmentFlag.AlignLeft),
+                label_text=('Канал данных'),
+            )
+        )
+
+        local_i2p_node_sam_session_data_connection_metrics_value_label = (
+            QtUtils.create_label(
+                alignment=(Qt.AlignmentFlag.AlignLeft),
+                label_text=(
+                    self.__get_local_i2p_node_sam_session_data_connection_metrics_text(
+                        None,
+                    )
+                ),
+            )
+        )
+
+        data_connection_task_supervisor = TaskSupervisor()
+
+        local_i2p_node_sam_session_data_connection_tasks_key_label = (
+            QtUtils.create_label(
+                alignment=(Qt.AlignmentFlag.AlignLeft),
+                label_text=('Задачи каналов данных'),
+            )
+        )
+
+        local_i2p_node_sam_session_data_connection_tasks_value_label = (
+            QtUtils.create_label(
+                alignment=(Qt.AlignmentFlag.AlignLeft),
+                label_text=(
+                    self.__get_local_i2p_node_sam_session_data_connection_tasks_text(
+                        data_connection_task_supervisor,
+                    )
+                ),
+            )
+        )
+
         info_layout.addWidget(
             local_i2p_node_address_key_label,
             0,
@@ -456,6 +601,54 @@ class MainWindow(QMainWindow):
             1,
         )
 
+        info_layout.addWidget(
+            local_i2p_node_outbound_traffic_key_label,
+            5,
+            0,
+            1,
+            1,
+        )
+
+        info_layout.addWidget(
+            local_i2p_node_outbound_traffic_value_label,
+            5,
+            1,
+            1,
+            1,
+        )
+
+        info_layout.addWidget(
+            local_i2p_node_sam_session_data_connection_metrics_key_label,
+            6,
+            0,
+            1,
+            1,
+        )
+
+        info_layout.addWidget(
+            local_i2p_node_sam_session_data_connection_metrics_value_label,
+            6,
+            1,
+            1,
+            1,
+        )
+
+        info_layout.addWidget(
+            local_i2p_node_sam_session_data_connection_tasks_key_label,
+            7,
+            0,
+            1,
+            1,
+        )
+
+        info_layout.addWidget(
+            local_i2p_node_sam_session_data_connection_tasks_value_label,
+            7,
+            1,
+            1,
+            1,
+        )
+
         window_layout.addLayout(
             info_layout,
         )
@@ -466,6 +659,10 @@ class MainWindow(QMainWindow):
 
         conversation_text_edit = ConversationTextEdit()
 
+        conversation_text_edit.set_attachment_bytes_getter(
+            self.__get_attachment_bytes,
+        )
+
         conversation_text_edit.setPlaceholderText(
             'Диалог с собеседником',
         )
@@ -564,9 +761,13 @@ class MainWindow(QMainWindow):
 
         self.__config_raw_data = config_raw_data
 
+        self.__config_store = config_store
+
         self.__conversation_text_edit = conversation_text_edit
 
-        self.__last_remote_i2p_node_ping_timestamp_ms = None
+        # Runs the loops of every established data connection
+
+        self.__data_connection_task_supervisor = data_connection_task_supervisor
 
         self.__local_i2p_node_address = local_i2p_node_address
 
@@ -574,10 +775,51 @@ class MainWindow(QMainWindow):
 
         self.__local_i2p_node_address_value_label = local_i2p_node_address_value_label
 
+        self.__local_i2p_node_attachment_acked_offset_by_id_map: dict[str, int] = {}
+
+        # Content-addressed (SHA-256) bytes of own attachments; received ones
+        # are streamed to the attachment store instead
+
+        self.__local_i2p_node_attachment_bytes_by_id_map: dict[str, bytes] = {}
+
+        self.__local_i2p_node_attachment_sending_event = asyncio.Event()
+
         self.__local_i2p_node_destination = local_i2p_node_destination
 
         self.__local_i2p_node_message_raw_data_by_id_map: dict[int, dict] = {}
 
+        self.__local_i2p_node_message_retransmission_scheduler = (
+            RetransmissionScheduler(
+                _MAX_IN_FLIGHT_MESSAGES_COUNT,
+            )
+        )
+
+        self.__local_i2p_node_message_sending_event = asyncio.Event()
+
+        self.__local_i2p_node_outbound_traffic_key_label = (
+            local_i2p_node_outbound_traffic_key_label
+        )
+
+        self.__local_i2p_node_outbound_traffic_value_label = (
+            local_i2p_node_outbound_traffic_value_label
+        )
+
+        self.__local_i2p_node_sam_session_data_connection_metrics_key_label = (
+            local_i2p_node_sam_session_data_connection_metrics_key_label
+        )
+
+        self.__local_i2p_node_sam_session_data_connection_metrics_value_label = (
+            local_i2p_node_sam_session_data_connection_metrics_value_label
+        )
+
+        self.__local_i2p_node_sam_session_data_connection_tasks_key_label = (
+            local_i2p_node_sam_session_data_connection_tasks_key_label
+        )
+
+        self.__local_i2p_node_sam_session_data_connection_tasks_value_label = (
+            local_i2p_node_sam_session_data_connection_tasks_value_label
+        )
+
         self.__local_i2p_node_pending_message_raw_data_by_id_map: (  # TODO: __local_i2p_node_pending_message_id_set
             dict[int, dict]
         ) = {}
@@ -602,6 +844,27 @@ class MainWindow(QMainWindow):
 
         self.__local_i2p_node_sam_session_creation_event = asyncio.Event()
 
+        # Notified whenever a data connection is established or lost, so that
+        # the sending loops of the standby connection can take over
+
+        self.__local_i2p_node_sam_session_data_connection_election_condition = (
+            asyncio.Condition()
+        )
+
+        self.__local_i2p_node_sam_session_established_incoming_data_connection: (
+            Connection | None
+        ) = None
+
+        self.__local_i2p_node_sam_session_established_outgoing_data_connection: (
+            Connection | None
+        ) = None
+
+        self.__local_i2p_node_sam_session_incoming_data_connection_reconnect_backoff = (
+            ReconnectBackoff(
+                'incoming data connection',
+            )
+        )
+
         self.__local_i2p_node_sam_session_incoming_data_connection_status_key_label = (
             local_i2p_node_sam_session_incoming_data_connection_status_key_label
         )
@@ -610,6 +873,16 @@ class MainWindow(QMainWindow):
             local_i2p_node_sam_session_incoming_data_connection_status_value_label
         )
 
+        self.__local_i2p_node_sam_session_outgoing_data_connection_creation_task: (
+            asyncio.Task | None
+        ) = None
+
+        self.__local_i2p_node_sam_session_outgoing_data_connection_reconnect_backoff = (
+            ReconnectBackoff(
+                'outgoing data connection',
+            )
+        )
+
         self.__local_i2p_node_sam_session_outgoing_data_connection_status_key_label = (
             local_i2p_node_sam_session_outgoing_data_connection_status_key_label
         )
@@ -618,6 +891,15 @@ class MainWindow(QMainWindow):
             local_i2p_node_sam_session_outgoing_data_connection_status_value_label
         )
 
+        self.__local_i2p_node_sam_session_reconfiguration_debouncer = Debouncer(
+            'SAM session reconfiguration',
+            _RECONFIGURATION_DEBOUNCE_DELAY,
+        )
+
+        self.__local_i2p_node_sam_session_reconnect_backoff = ReconnectBackoff(
+            'SAM session',
+        )
+
         self.__local_i2p_node_sam_session_status_key_label = (
             local_i2p_node_sam_session_status_key_label
         )
@@ -640,6 +922,15 @@ class MainWindow(QMainWindow):
 
         self.__remote_i2p_node_address_raw: str | None = None
 
+        self.__remote_i2p_node_address_reconfiguration_debouncer = Debouncer(
+            'remote I2P node address reconfiguration',
+            _RECONFIGURATION_DEBOUNCE_DELAY,
+        )
+
+        self.__remote_i2p_node_attachment_store = AttachmentStore(
+            Constants.Path.AttachmentDirectory,
+        )
+
         self.__remote_i2p_node_message_raw_data_by_id_map: dict[int, dict] = {}
 
         self.__remote_i2p_node_status_key_label = remote_i2p_node_status_key_label
@@ -648,6 +939,17 @@ class MainWindow(QMainWindow):
 
         self.__remote_i2p_node_status_value_label = remote_i2p_node_status_value_label
 
+        self.__remote_i2p_node_delayed_ack_task_by_connection_map: (
+            dict[Connection, asyncio.Task]
+        ) = {}
+
+        # Received messages not yet covered by a selective ACK, per connection;
+        # an entry exists while a delayed ACK is scheduled
+
+        self.__remote_i2p_node_unacked_messages_count_by_connection_map: (
+            dict[Connection, int]
+        ) = {}
+
         asyncio.create_task(
             self.__on_local_i2p_node_sam_ip_address_line_edit_text_changed_ex()
         )
@@ -662,9 +964,19 @@ class MainWindow(QMainWindow):
 
         self.__update_local_i2p_node_address()
 
+    def fini(
+        self,
+    ) -> None:
+        """Writes config changes still waiting for their batch; called once the application is quitting."""
+        self.__config_store.close()
+
     async def start_local_i2p_node_sam_session_incoming_data_connection_creation_loop(
         self,
     ) -> None:
+        reconnect_backoff = (
+            self.__local_i2p_node_sam_session_incoming_data_connection_reconnect_backoff
+        )
+
         while True:
             if self.__local_i2p_node_sam_session_control_connection is None:
                 await self.__local_i2p_node_sam_session_creation_event.wait()
@@ -684,11 +996,7 @@ class MainWindow(QMainWindow):
                         local_i2p_node_sam_port
                     )
             ):
-                await (  # TODO: make this better
-                    asyncio.sleep(
-                        1.0,  # s
-                    )
-                )
+                await reconnect_backoff.wait()
 
                 continue
 
@@ -710,11 +1018,7 @@ class MainWindow(QMainWindow):
                     new_incoming_data_connection_status_text='Прервано',
                 )
 
-                await (  # TODO: make this better
-                    asyncio.sleep(
-                        1.0,  # s
-                    )
-                )
+                await reconnect_backoff.wait()
 
                 continue
 
@@ -748,11 +1052,7 @@ class MainWindow(QMainWindow):
 
                 await local_i2p_node_sam_session.close_incoming_data_connection()
 
-                await (  # TODO: make this better
-                    asyncio.sleep(
-                        1.0,  # s
-                    )
-                )
+                await reconnect_backoff.wait()
 
                 continue
 
@@ -770,11 +1070,7 @@ class MainWindow(QMainWindow):
 
                 await local_i2p_node_sam_session.close_incoming_data_connection()
 
-                await (  # TODO: make this better
-                    asyncio.sleep(
-                        1.0,  # s
-                    )
-                )
+                await reconnect_backoff.wait()
 
                 continue
 
@@ -788,59 +1084,86 @@ class MainWindow(QMainWindow):
 
                 await local_i2p_node_sam_session.close_incoming_data_connection()
 
-                await (  # TODO: make this better
-                    asyncio.sleep(
-                        1.0,  # s
-                    )
-                )
+                await reconnect_backoff.wait()
 
                 continue
 
-            local_i2p_node_sam_session.update_incoming_data_connection_status(
-                new_incoming_data_connection_status_color='green',
-                new_incoming_data_connection_status_text='Создано',
+            await local_i2p_node_sam_session_incoming_data_connection.send_hello_raw_data_async()
+
+            reconnect_backoff.reset()
+
+            self.__local_i2p_node_sam_session_established_incoming_data_connection = (
+                local_i2p_node_sam_session_incoming_data_connection
             )
 
-            tasks = (
-                asyncio.ensure_future(
-                    self.__start_local_i2p_node_sam_session_data_connection_pinging_loop(
-                        local_i2p_node_sam_session_incoming_data_connection,
-                    )
-                ),
-                asyncio.ensure_future(
-                    self.__start_local_i2p_node_sam_session_data_connection_sending_loop(
-                        local_i2p_node_sam_session_incoming_data_connection,
-                    )
-                ),
-                asyncio.ensure_future(
-                    self.__start_local_i2p_node_sam_session_data_connection_receiving_loop(
-                        local_i2p_node_sam_session_incoming_data_connection,
-                    )
+            await self.__update_local_i2p_node_sam_session_data_connection_election()
+
+            # The group ends once the connection is broken or one of its
+            # loops has failed for good, and none of them outlives it
+
+            await self.__data_connection_task_supervisor.run_group(
+                'incoming data connection',
+                (
+                    (
+                        'pinging',
+                        functools.partial(
+                            self.__start_local_i2p_node_sam_session_data_connection_pinging_loop,
+                            local_i2p_node_sam_session_incoming_data_connection,
+                        ),
+                        RestartPolicy.Never,
+                    ),
+                    (
+                        'sending',
+                        functools.partial(
+                            self.__start_local_i2p_node_sam_session_data_connection_sending_loop,
+                            local_i2p_node_sam_session_incoming_data_connection,
+                        ),
+                        RestartPolicy.OnFailure,
+                    ),
+                    (
+                        'attachment sending',
+                        functools.partial(
+                            self.__start_local_i2p_node_sam_session_data_connection_attachment_sending_loop,
+                            local_i2p_node_sam_session_incoming_data_connection,
+                        ),
+                        RestartPolicy.OnFailure,
+                    ),
+                    (
+                        'receiving',
+                        functools.partial(
+                            self.__start_local_i2p_node_sam_session_data_connection_receiving_loop,
+                            local_i2p_node_sam_session_incoming_data_connection,
+                        ),
+                        RestartPolicy.Never,
+                    ),
                 ),
             )
 
-            try:
-                await asyncio.gather(
-                    *tasks,
-                )
-            except BrokenPipeError:
-                for task in tasks:
-                    task.cancel()
+            self.__local_i2p_node_sam_session_established_incoming_data_connection = None
 
-                await local_i2p_node_sam_session.close_incoming_data_connection()
+            logger.info(
+                'Incoming data connection has ended, metrics: %r',
+                local_i2p_node_sam_session_incoming_data_connection.get_metrics(),
+            )
+
+            self.__cancel_remote_i2p_node_delayed_ack(
+                local_i2p_node_sam_session_incoming_data_connection,
+            )
+
+            await local_i2p_node_sam_session.close_incoming_data_connection()
 
+            await self.__update_local_i2p_node_sam_session_data_connection_election()
+
+            if (
+                local_i2p_node_sam_session_incoming_data_connection.get_protocol_error_text()
+                is None
+            ):
                 local_i2p_node_sam_session.update_incoming_data_connection_status(
                     new_incoming_data_connection_status_color='red',
                     new_incoming_data_connection_status_text='Прервано',
                 )
 
-                await (  # TODO: make this better
-                    asyncio.sleep(
-                        1.0,  # s
-                    )
-                )
-
-                continue
+            await reconnect_backoff.wait()
 
     @staticmethod
     async def __send_ack_raw_data(
@@ -853,260 +1176,608 @@ class MainWindow(QMainWindow):
         }
         await connection.send_raw_data_async(raw_data)
 
-    @staticmethod
-    async def __send_message_raw_data(
+    async def __send_selective_ack_raw_data(
+        self,
         connection: (Connection),
-        message_id: int,
-        message_raw_data: (dict),
     ) -> None:
-        raw_data = message_raw_data.copy()
+        # Message IDs are sequential, so every received message is covered by
+        # the cumulative ID, below which all were received, and ranges above it
 
-        raw_data.update(
-            {'id': (message_id), 'type': ('message')},
-        )
+        cumulative_message_id = -1
 
-        await connection.send_raw_data_async(raw_data)
+        message_id_range_list: list[list[int]] = []
 
-    @staticmethod
-    async def __start_local_i2p_node_sam_session_data_connection_pinging_loop(
-        connection: (Connection),
-    ) -> None:
-        while True:
-            await connection.send_raw_data_async({'type': 'ping'})
+        for message_id in sorted(
+            self.__remote_i2p_node_message_raw_data_by_id_map,
+        ):
+            if not message_id_range_list:
+                if message_id == cumulative_message_id + 1:
+                    cumulative_message_id = message_id
 
-            await asyncio.sleep(
-                5.0,  # s
-            )
+                    continue
+            elif message_id == message_id_range_list[-1][1] + 1:
+                message_id_range_list[-1][1] = message_id
 
-    async def __start_local_i2p_node_sam_session_data_connection_sending_loop(
+                continue
+
+            if len(message_id_range_list) < _MAX_SELECTIVE_ACK_RANGES_COUNT:
+                message_id_range_list.append(
+                    [message_id, message_id],
+                )
+            else:
+                break
+
+        raw_data = {
+            'cumulative_message_id': (cumulative_message_id),
+            'range_list': (message_id_range_list),
+            'type': ('selective_ack'),
+        }
+        await connection.send_raw_data_async(raw_data)
+
+    async def __send_delayed_selective_ack_raw_data(
         self,
         connection: (Connection),
     ) -> None:
-        local_i2p_node_pending_message_raw_data_by_id_map = (
-            self.__local_i2p_node_pending_message_raw_data_by_id_map
+        await g_common_globals.get_timer_service().sleep(
+            _DELAYED_ACK_TIMEOUT,
         )
 
-        while True:
-            for pending_message_id in sorted(
-                local_i2p_node_pending_message_raw_data_by_id_map,
-            ):
-                pending_message_raw_data = (
-                    local_i2p_node_pending_message_raw_data_by_id_map[
-                        pending_message_id
-                    ]
-                )
+        self.__remote_i2p_node_delayed_ack_task_by_connection_map.pop(
+            connection,
+            None,
+        )
 
-                await self.__send_message_raw_data(
-                    connection, pending_message_id, pending_message_raw_data
-                )
+        self.__remote_i2p_node_unacked_messages_count_by_connection_map.pop(
+            connection,
+            None,
+        )
 
-            await asyncio.sleep(
-                5.0,  # s
+        try:
+            await self.__send_selective_ack_raw_data(
+                connection,
             )
+        except BrokenPipeError:
+            # The receiving loop notices the closed connection by itself
 
-    async def __start_local_i2p_node_sam_session_data_connection_receiving_loop(
+            pass
+
+    async def __schedule_selective_ack_raw_data(
         self,
         connection: (Connection),
     ) -> None:
-        local_i2p_node_pending_message_raw_data_by_id_map = (
-            self.__local_i2p_node_pending_message_raw_data_by_id_map
+        remote_i2p_node_unacked_messages_count_by_connection_map = (
+            self.__remote_i2p_node_unacked_messages_count_by_connection_map
         )
 
-        remote_i2p_node_message_raw_data_by_id_map = (
-            self.__remote_i2p_node_message_raw_data_by_id_map
+        unacked_messages_count = (
+            remote_i2p_node_unacked_messages_count_by_connection_map.get(
+                connection,
+                0,
+            )
+            + 1
         )
 
-        while True:
-            raw_data = await connection.read_raw_data()
-
-            if raw_data is None:
-                # Connection was closed
-
-                raise (BrokenPipeError)
+        if unacked_messages_count >= _MAX_DELAYED_ACK_MESSAGES_COUNT:
+            self.__cancel_remote_i2p_node_delayed_ack(
+                connection,
+            )
 
-            raw_data_type: str | None = raw_data.pop(
-                'type',
-                None,
+            await self.__send_selective_ack_raw_data(
+                connection,
             )
 
-            if raw_data_type is None:
-                logger.warning(
-                    f': Raw data without type: {raw_data}',
-                )
+            return
 
-                continue
+        remote_i2p_node_unacked_messages_count_by_connection_map[connection] = (
+            unacked_messages_count
+        )
 
-            if raw_data_type == 'ack':
-                ack_raw_data = raw_data
+        if unacked_messages_count == 1:
+            (
+                self.__remote_i2p_node_delayed_ack_task_by_connection_map[connection]
+            ) = create_task_with_exceptions_logging(
+                self.__send_delayed_selective_ack_raw_data(
+                    connection,
+                ),
+            )
 
-                message_id: int | None = ack_raw_data.pop(
-                    'message_id',
-                    None,
-                )
+    def __cancel_remote_i2p_node_delayed_ack(
+        self,
+        connection: (Connection),
+    ) -> None:
+        # Called once an ACK has been sent otherwise, and once the connection
+        # is gone: the delayed ACK runs outside of the task group of the
+        # connection and must not outlive it; the remote node resends anything
+        # it would have covered
+
+        delayed_ack_task = (
+            self.__remote_i2p_node_delayed_ack_task_by_connection_map.pop(
+                connection,
+                None,
+            )
+        )
 
-                if message_id is None:
-                    logger.warning(
-                        f': ACK raw data without message ID field: {ack_raw_data}',
-                    )
+        if delayed_ack_task is not None:
+            delayed_ack_task.cancel()
 
-                    continue
-                elif type(message_id) is not int:
-                    logger.warning(
-                        ': ACK raw data have incorrect message ID field type'
-                        f': {ack_raw_data}',
-                    )
+        self.__remote_i2p_node_unacked_messages_count_by_connection_map.pop(
+            connection,
+            None,
+        )
 
-                    continue
+    @staticmethod
+    async def __send_attachment_ack_raw_data(
+        connection: (Connection),
+        attachment_id: str,
+        offset: int,
+        is_rejected: bool = False,
+    ) -> None:
+        raw_data = {
+            'attachment_id': (attachment_id),
+            'offset': (offset),
+            'type': ('attachment_ack'),
+        }
+        if is_rejected:
+            (raw_data['is_rejected']) = True
+        await connection.send_raw_data_async(raw_data)
 
-                (
-                    local_i2p_node_pending_message_raw_data_by_id_map.pop(
-                        message_id,
-                        None,
+    async def __send_message_raw_data(
+        self,
+        connection: (Connection),
+        message_id: int,
+        message_raw_data: (dict),
+    ) -> bool:
+        raw_data = message_raw_data.copy()
+
+        attachment_id_list: list[str] | None = raw_data.pop(
+            'attachment_id_list',
+            None,
+        )
+
+        if attachment_id_list is not None:
+            local_i2p_node_attachment_bytes_by_id_map = (
+                self.__local_i2p_node_attachment_bytes_by_id_map
+            )
+
+            if connection.is_attachment_chunks_supported():
+                # Attachment chunks are sent by the attachment sending loop;
+                # the message itself follows once all of them are acknowledged
+
+                if not self.__is_local_i2p_node_message_attachment_list_delivered(
+                    attachment_id_list,
+                ):
+                    return False
+
+                (raw_data['attachment_id_list']) = attachment_id_list
+            else:
+                # Peers without binary frames expect Base64-encoded images inline
+
+                (raw_data['image_base64_encoded_text_list']) = [
+                    b64encode(
+                        local_i2p_node_attachment_bytes_by_id_map[attachment_id],
+                    ).decode()
+                    for attachment_id in attachment_id_list
+                ]
+
+        raw_data.update(
+            {'id': (message_id), 'type': ('message')},
+        )
+
+        await connection.send_raw_data_async(raw_data)
+
+        return True
+
+    @staticmethod
+    async def __start_local_i2p_node_sam_session_data_connection_pinging_loop(
+        connection: (Connection),
+    ) -> None:
+        # Pings are sent only while the remote node is silent, and a node that
+        # stops answering them breaks the connection
+
+        await connection.start_heartbeat_loop()
+
+    async def __start_local_i2p_node_sam_session_data_connection_attachment_sending_loop(
+        self,
+        connection: (Connection),
+    ) -> None:
+        local_i2p_node_attachment_bytes_by_id_map = (
+            self.__local_i2p_node_attachment_bytes_by_id_map
+        )
+
+        local_i2p_node_attachment_acked_offset_by_id_map = (
+            self.__local_i2p_node_attachment_acked_offset_by_id_map
+        )
+
+        local_i2p_node_attachment_sending_event = (
+            self.__local_i2p_node_attachment_sending_event
+        )
+
+        local_i2p_node_pending_message_raw_data_by_id_map = (
+            self.__local_i2p_node_pending_message_raw_data_by_id_map
+        )
+
+        # Offsets already sent over this connection; they run at most one
+        # window ahead of the acknowledged ones
+
+        attachment_sent_offset_by_id_map: dict[str, int] = {}
+
+        await connection.wait_for_handshake_async()
+
+        while True:
+            if await self.__wait_for_local_i2p_node_sam_session_data_connection_election(
+                connection,
+            ):
+                # Chunks sent before the connection went standby may have
+                # been lost: resume from the acknowledged offsets
+
+                attachment_sent_offset_by_id_map.clear()
+
+            local_i2p_node_attachment_sending_event.clear()
+
+            attachment_unacked_bytes_count = 0
+
+            if connection.is_attachment_chunks_supported():
+                for pending_message_id in sorted(
+                    local_i2p_node_pending_message_raw_data_by_id_map,
+                ):
+                    pending_message_raw_data = (
+                        local_i2p_node_pending_message_raw_data_by_id_map.get(
+                            pending_message_id,
+                        )
                     )
+
+                    if pending_message_raw_data is None:
+                        continue
+
+                    for attachment_id in pending_message_raw_data.get(
+                        'attachment_id_list',
+                        (),
+                    ):
+                        attachment_bytes = (
+                            local_i2p_node_attachment_bytes_by_id_map.get(
+                                attachment_id,
+                            )
+                        )
+
+                        if attachment_bytes is None:
+                            # Rejected while an earlier chunk was being sent
+
+                            continue
+
+                        attachment_acked_offset = (
+                            local_i2p_node_attachment_acked_offset_by_id_map.get(
+                                attachment_id,
+                                0,
+                            )
+                        )
+
+                        attachment_window_end_offset = min(
+                            attachment_acked_offset + _ATTACHMENT_WINDOW_BYTES_COUNT,
+                            len(attachment_bytes),
+                        )
+
+                        attachment_offset = max(
+                            attachment_acked_offset,
+                            attachment_sent_offset_by_id_map.get(
+                                attachment_id,
+                                0,
+                            ),
+                        )
+
+                        while attachment_offset < attachment_window_end_offset:
+                            attachment_offset = (
+                                await connection.send_attachment_chunk_async(
+                                    attachment_id,
+                                    'png',
+                                    attachment_bytes,
+                                    attachment_offset,
+                                    _ATTACHMENT_CHUNK_BYTES_COUNT,
+                                )
+                            )
+
+                        (
+                            attachment_sent_offset_by_id_map[attachment_id]
+                        ) = attachment_offset
+
+                        attachment_unacked_bytes_count += (
+                            attachment_offset - attachment_acked_offset
+                        )
+
+            if not attachment_unacked_bytes_count:
+                # Nothing in flight: wait for a new attachment or an election
+
+                await local_i2p_node_attachment_sending_event.wait()
+            elif not await g_common_globals.get_timer_service().wait_for_event(
+                local_i2p_node_attachment_sending_event,
+                connection.get_acknowledgement_timeout(
+                    attachment_unacked_bytes_count,
+                ),
+            ):
+                # Nothing was acknowledged in time for the chunks in flight to
+                # have arrived, so they were likely lost: resume from the
+                # acknowledged offsets. Every acknowledgement restarts the wait
+
+                attachment_sent_offset_by_id_map.clear()
+
+    async def __start_local_i2p_node_sam_session_data_connection_sending_loop(
+        self,
+        connection: (Connection),
+    ) -> None:
+        local_i2p_node_message_retransmission_scheduler = (
+            self.__local_i2p_node_message_retransmission_scheduler
+        )
+
+        local_i2p_node_message_sending_event = (
+            self.__local_i2p_node_message_sending_event
+        )
+
+        local_i2p_node_pending_message_raw_data_by_id_map = (
+            self.__local_i2p_node_pending_message_raw_data_by_id_map
+        )
+
+        outbound_token_bucket = g_common_globals.get_outbound_token_bucket()
+
+        rtt_estimator = connection.get_rtt_estimator()
+
+        # Whether attachments go inline or as chunks depends on the features
+        # negotiated by the handshake
+
+        await connection.wait_for_handshake_async()
+
+        is_active = False
+
+        while True:
+            if (
+                await self.__wait_for_local_i2p_node_sam_session_data_connection_election(
+                    connection,
                 )
+                or not is_active
+            ):
+                # Attempts made over another connection say nothing about
+                # this one, so everything pending is sent right away
 
-                self.__update_conversation()
-            elif raw_data_type == 'ping':
-                self.__last_remote_i2p_node_ping_timestamp_ms = (
-                    TimeUtils.get_aware_current_timestamp_ms()
+                local_i2p_node_message_retransmission_scheduler.clear()
+
+                is_active = True
+
+            local_i2p_node_message_sending_event.clear()
+
+            retransmission_timeout = rtt_estimator.get_retransmission_timeout()
+            max_retransmission_timeout = rtt_estimator.get_max_retransmission_timeout()
+
+            for pending_message_id in (
+                local_i2p_node_message_retransmission_scheduler.get_due_message_ids(
+                    sorted(
+                        local_i2p_node_pending_message_raw_data_by_id_map,
+                    ),
+                    retransmission_timeout,
+                    max_retransmission_timeout,
+                    time.monotonic(),
                 )
-            elif raw_data_type == 'message':
-                message_raw_data = raw_data
+            ):
+                # Nothing is queued while the outbound traffic is over its
+                # limit: the message would only wait behind the earlier
+                # traffic and likely time out once again
 
-                message_id: int | None = message_raw_data.pop(
-                    'id',
-                    None,
+                await outbound_token_bucket.wait_for_tokens(
+                    0,
                 )
 
-                if message_id is None:
-                    logger.warning(
-                        f': Message raw data without ID field: {message_raw_data}',
+                pending_message_raw_data = (
+                    local_i2p_node_pending_message_raw_data_by_id_map.get(
+                        pending_message_id,
                     )
+                )
+
+                if pending_message_raw_data is None:
+                    # Acknowledged while an earlier message was being sent
 
                     continue
-                elif type(message_id) is not int:
-                    logger.warning(
-                        ': Message raw data have incorrect ID field type'
-                        f': {message_raw_data}',
+
+                if await self.__send_message_raw_data(
+                    connection, pending_message_id, pending_message_raw_data
+                ):
+                    local_i2p_node_message_retransmission_scheduler.on_sent(
+                        pending_message_id,
+                        time.monotonic(),
                     )
 
-                    continue
-                # TODO: check message_id >= 0
+            # Sleep until the earliest retransmission is due, or until a new
+            # message, an acknowledgement or a failover wakes the loop up
 
-                if self.__local_i2p_node_sam_session_control_connection is not None:
-                    local_i2p_node_sam_session = self.__local_i2p_node_sam_session
+            next_due_time = (
+                local_i2p_node_message_retransmission_scheduler.get_next_due_time(
+                    retransmission_timeout,
+                    max_retransmission_timeout,
+                )
+            )
 
-                    for data_connection in (
-                        local_i2p_node_sam_session.get_incoming_data_connection(),
-                        local_i2p_node_sam_session.get_outgoing_data_connection(),
-                    ):
-                        if data_connection is not None:
-                            await self.__send_ack_raw_data(
-                                data_connection, message_id
-                            )
+            await g_common_globals.get_timer_service().wait_for_event(
+                local_i2p_node_message_sending_event,
+                None
+                if next_due_time is None
+                else max(
+                    next_due_time - time.monotonic(),
+                    0.0,
+                ),
+            )
 
-                            break
+    async def __start_local_i2p_node_sam_session_data_connection_receiving_loop(
+        self,
+        connection: (Connection),
+    ) -> None:
+        remote_i2p_node_message_raw_data_by_id_map = (
+            self.__remote_i2p_node_message_raw_data_by_id_map
+        )
 
-                if message_id in remote_i2p_node_message_raw_data_by_id_map:
-                    continue
+        remote_i2p_node_attachment_store = self.__remote_i2p_node_attachment_store
 
-                message_image_base64_encoded_text_list: list[str] | None = (
-                    message_raw_data.pop(
-                        'image_base64_encoded_text_list',
-                        None,
-                    )
-                )
+        while True:
+            raw_data = await connection.read_raw_data()
 
-                if message_image_base64_encoded_text_list is not None:
-                    if type(message_image_base64_encoded_text_list) is not list:
-                        logger.warning(
-                            ': Message raw data has incorrect image base64 encoded text list field type'
-                            f': {message_image_base64_encoded_text_list}',
-                        )
+            if raw_data is None:
+                # Connection was closed
 
-                        continue
-                    elif not (message_image_base64_encoded_text_list):
-                        message_image_base64_encoded_text_list = None
-                    else:
-                        is_message_image_base64_encoded_text_list_valid = True
-
-                        for (
-                            message_image_base64_encoded_text
-                        ) in message_image_base64_encoded_text_list:
-                            if type(message_image_base64_encoded_text) is not str:
-                                logger.warning(
-                                    ': Message raw data has incorrect image base64 encoded text field type'
-                                    f': {message_image_base64_encoded_text}',
-                                )
+                raise (BrokenPipeError)
 
-                                is_message_image_base64_encoded_text_list_valid = False
+            if isinstance(raw_data, AttachmentChunkFrame):
+                # Binary frames are parsed and checked by the connection
+                # itself, while JSON ones claiming to be attachment chunks are
+                # rejected by decode_frame()
 
-                                break
-                            elif not (message_image_base64_encoded_text):
-                                logger.warning(
-                                    ': Message raw data has empty image base64 encoded text'
-                                    f': {message_image_base64_encoded_text_list}',
-                                )
+                await self.__on_remote_i2p_node_attachment_chunk_frame(
+                    connection,
+                    raw_data,
+                )
 
-                                is_message_image_base64_encoded_text_list_valid = False
+                continue
 
-                                break
+            try:
+                frame = decode_frame(
+                    raw_data,
+                )
+            except FrameError as exception:
+                logger.warning(
+                    f': Incorrect raw data: {exception}',
+                )
 
-                        if not is_message_image_base64_encoded_text_list_valid:
-                            continue
+                continue
+
+            if isinstance(frame, PingFrame):
+                # Answered by the connection itself, which also keeps track of
+                # the remote node being alive
+
+                continue
 
-                message_text: str | None = message_raw_data.pop(
-                    'text',
-                    None,
+            if isinstance(frame, AckFrame):
+                self.__on_local_i2p_node_message_acked(
+                    connection,
+                    frame.get_message_id(),
                 )
 
-                if message_text is not None:
-                    if type(message_text) is not str:
+                self.__update_conversation()
+            elif isinstance(frame, SelectiveAckFrame):
+                self.__on_local_i2p_node_selective_ack_frame(
+                    connection,
+                    frame,
+                )
+            elif isinstance(frame, AttachmentAckFrame):
+                await self.__on_local_i2p_node_attachment_ack_frame(
+                    frame,
+                )
+            elif isinstance(frame, MessageFrame):
+                message_id = frame.get_message_id()
+
+                message_attachment_id_list = frame.get_attachment_id_list()
+
+                if message_attachment_id_list is not None:
+                    # The remote node sends a message only once all of its
+                    # attachments were acknowledged; if any is missing anyway
+                    # (e.g. this node was restarted), the message is left
+                    # unacknowledged and the transfer is restarted
+
+                    message_missing_attachment_id_list = [
+                        message_attachment_id
+                        for message_attachment_id in message_attachment_id_list
+                        if not remote_i2p_node_attachment_store.contains(
+                            message_attachment_id,
+                        )
+                    ]
+
+                    if message_missing_attachment_id_list:
                         logger.warning(
-                            ': Message raw data has incorrect text field type'
-                            f': {message_text}',
+                            ': Message raw data references missing attachments'
+                            f': {message_missing_attachment_id_list}',
                         )
 
+                        for message_missing_attachment_id in (
+                            message_missing_attachment_id_list
+                        ):
+                            await self.__send_attachment_ack_raw_data(
+                                connection,
+                                message_missing_attachment_id,
+                                self.__get_remote_i2p_node_attachment_received_bytes_count(
+                                    message_missing_attachment_id,
+                                ),
+                            )
+
                         continue
-                    elif not (message_text):
-                        message_text = None
 
-                if not (
-                    message_text is not None
-                    or message_image_base64_encoded_text_list is not None
-                ):
-                    logger.warning(
-                        ': Message raw data has no content',
+                is_selective_acks_supported = connection.is_selective_acks_supported()
+
+                if not is_selective_acks_supported:
+                    await self.__send_ack_raw_data(
+                        connection, message_id
                     )
 
+                if message_id in remote_i2p_node_message_raw_data_by_id_map:
+                    # The ACK was lost, so the message is acknowledged again
+
+                    if is_selective_acks_supported:
+                        await self.__schedule_selective_ack_raw_data(
+                            connection,
+                        )
+
                     continue
 
-                if message_raw_data:
-                    logger.warning(
-                        f'Message raw data has extra fields: {message_raw_data}',
+                message_image_base64_encoded_text_list = (
+                    frame.get_image_base64_encoded_text_list()
+                )
+
+                if message_image_base64_encoded_text_list is not None:
+                    # Inline images of older peers are converted into
+                    # attachments once, on arrival. Decoding, hashing and
+                    # writing megabytes of them would freeze the GUI, so it
+                    # happens in a worker thread
+
+                    legacy_message_attachment_id_list = (
+                        await asyncio.get_running_loop().run_in_executor(
+                            None,
+                            self.__write_legacy_message_images,
+                            remote_i2p_node_attachment_store,
+                            message_image_base64_encoded_text_list,
+                        )
                     )
 
+                    if legacy_message_attachment_id_list is None:
+                        continue
+
+                    message_attachment_id_list = (
+                        message_attachment_id_list or []
+                    ) + legacy_message_attachment_id_list
+
                 message_raw_data = {
                     'timestamp_ms': (TimeUtils.get_aware_current_timestamp_ms())
                 }
 
+                message_text = frame.get_text()
+
                 if message_text is not None:
                     (message_raw_data['text']) = message_text
 
-                if message_image_base64_encoded_text_list is not None:
+                if message_attachment_id_list is not None:
                     (
-                        message_raw_data['image_base64_encoded_text_list']
-                    ) = message_image_base64_encoded_text_list
+                        message_raw_data['attachment_id_list']
+                    ) = message_attachment_id_list
 
                 (
                     remote_i2p_node_message_raw_data_by_id_map[message_id]
                 ) = message_raw_data
 
+                if is_selective_acks_supported:
+                    await self.__schedule_selective_ack_raw_data(
+                        connection,
+                    )
+
                 self.__update_conversation()
 
     async def start_local_i2p_node_sam_session_outgoing_data_connection_creation_loop(
         self,
     ) -> None:
+        reconnect_backoff = (
+            self.__local_i2p_node_sam_session_outgoing_data_connection_reconnect_backoff
+        )
+
         while True:
             if self.__local_i2p_node_sam_session_control_connection is None:
                 await self.__local_i2p_node_sam_session_creation_event.wait()
@@ -1121,89 +1792,145 @@ class MainWindow(QMainWindow):
 
             local_i2p_node_sam_session = self.__local_i2p_node_sam_session
 
-            if not (
-                    await local_i2p_node_sam_session.create_outgoing_data_connection(
-                        local_i2p_node_sam_ip_address,
-                        local_i2p_node_sam_port,
-                        remote_i2p_node_address_raw,
-                    )
-            ):
-                await (  # TODO: make this better
-                    asyncio.sleep(
-                        1.0,  # s
-                    )
+            # Run as a task of its own, so that an edit of the remote I2P node
+            # address can abandon the attempt without stopping this loop
+
+            outgoing_data_connection_creation_task = (
+                self.__local_i2p_node_sam_session_outgoing_data_connection_creation_task
+            ) = asyncio.create_task(
+                local_i2p_node_sam_session.create_outgoing_data_connection(
+                    local_i2p_node_sam_ip_address,
+                    local_i2p_node_sam_port,
+                    remote_i2p_node_address_raw,
+                ),
+            )
+
+            try:
+                is_outgoing_data_connection_created = (
+                    await outgoing_data_connection_creation_task
+                )
+            except asyncio.CancelledError:
+                if asyncio.current_task().cancelling():
+                    raise
+
+                # The remote I2P node address has changed, retry with the new one
+
+                continue
+            finally:
+                self.__local_i2p_node_sam_session_outgoing_data_connection_creation_task = (
+                    None
                 )
 
+            if not is_outgoing_data_connection_created:
+                await reconnect_backoff.wait()
+
                 continue
 
             local_i2p_node_sam_session_outgoing_data_connection = (
                 local_i2p_node_sam_session.get_outgoing_data_connection()
             )
 
-            tasks = (
-                asyncio.ensure_future(
-                    self.__start_local_i2p_node_sam_session_data_connection_pinging_loop(
-                        local_i2p_node_sam_session_outgoing_data_connection,
-                    )
-                ),
-                asyncio.ensure_future(
-                    self.__start_local_i2p_node_sam_session_data_connection_sending_loop(
-                        local_i2p_node_sam_session_outgoing_data_connection,
-                    )
-                ),
-                asyncio.ensure_future(
-                    self.__start_local_i2p_node_sam_session_data_connection_receiving_loop(
-                        local_i2p_node_sam_session_outgoing_data_connection,
-                    )
+            await local_i2p_node_sam_session_outgoing_data_connection.send_hello_raw_data_async()
+
+            reconnect_backoff.reset()
+
+            self.__local_i2p_node_sam_session_established_outgoing_data_connection = (
+                local_i2p_node_sam_session_outgoing_data_connection
+            )
+
+            await self.__update_local_i2p_node_sam_session_data_connection_election()
+
+            # The group ends once the connection is broken or one of its
+            # loops has failed for good, and none of them outlives it
+
+            await self.__data_connection_task_supervisor.run_group(
+                'outgoing data connection',
+                (
+                    (
+                        'pinging',
+                        functools.partial(
+                            self.__start_local_i2p_node_sam_session_data_connection_pinging_loop,
+                            local_i2p_node_sam_session_outgoing_data_connection,
+                        ),
+                        RestartPolicy.Never,
+                    ),
+                    (
+                        'sending',
+                        functools.partial(
+                            self.__start_local_i2p_node_sam_session_data_connection_sending_loop,
+                            local_i2p_node_sam_session_outgoing_data_connection,
+                        ),
+                        RestartPolicy.OnFailure,
+                    ),
+                    (
+                        'attachment sending',
+                        functools.partial(
+                            self.__start_local_i2p_node_sam_session_data_connection_attachment_sending_loop,
+                            local_i2p_node_sam_session_outgoing_data_connection,
+                        ),
+                        RestartPolicy.OnFailure,
+                    ),
+                    (
+                        'receiving',
+                        functools.partial(
+                            self.__start_local_i2p_node_sam_session_data_connection_receiving_loop,
+                            local_i2p_node_sam_session_outgoing_data_connection,
+                        ),
+                        RestartPolicy.Never,
+                    ),
                 ),
             )
 
-            try:
-                await asyncio.gather(
-                    *tasks,
-                )
-            except BrokenPipeError:
-                for task in tasks:
-                    task.cancel()
+            self.__local_i2p_node_sam_session_established_outgoing_data_connection = None
 
-                await local_i2p_node_sam_session.close_outgoing_data_connection()
+            logger.info(
+                'Outgoing data connection has ended, metrics: %r',
+                local_i2p_node_sam_session_outgoing_data_connection.get_metrics(),
+            )
 
+            self.__cancel_remote_i2p_node_delayed_ack(
+                local_i2p_node_sam_session_outgoing_data_connection,
+            )
+
+            await local_i2p_node_sam_session.close_outgoing_data_connection()
+
+            await self.__update_local_i2p_node_sam_session_data_connection_election()
+
+            if (
+                local_i2p_node_sam_session_outgoing_data_connection.get_protocol_error_text()
+                is None
+            ):
                 local_i2p_node_sam_session.update_outgoing_data_connection_status(
                     new_outgoing_data_connection_status_color='red',
                     new_outgoing_data_connection_status_text='Прервано',
                 )
 
-                await (  # TODO: make this better
-                    asyncio.sleep(
-                        1.0,  # s
-                    )
-                )
-
-                continue
+            await reconnect_backoff.wait()
 
     async def start_remote_i2p_node_status_update_loop(
         self,
     ) -> None:
         while True:
-            last_remote_i2p_node_ping_timestamp_ms = (
-                self.__last_remote_i2p_node_ping_timestamp_ms
+            active_data_connection = (
+                self.__get_local_i2p_node_sam_session_active_data_connection()
             )
 
             new_remote_i2p_node_status_color = 'red'
             new_remote_i2p_node_status_raw = 'Оффлайн'
 
-            if last_remote_i2p_node_ping_timestamp_ms is not None:
-                current_timestamp_ms = TimeUtils.get_aware_current_timestamp_ms()
+            if active_data_connection is not None:
+                # Time since anything was heard from the remote node; with the
+                # adaptive heartbeat an idle node pings only now and then
 
-                delta_time_ms = (
-                    current_timestamp_ms - last_remote_i2p_node_ping_timestamp_ms
+                delta_time_ms = round(
+                    (
+                        time.monotonic()
+                        - active_data_connection.get_last_received_time()
+                    )
+                    * 1000,  # ms
                 )
 
-                if (
-                        delta_time_ms <
-                        1000 *  # ms
-                        15      # s
-                ):
+                if delta_time_ms < 1000 * active_data_connection.get_idle_timeout():
                     new_remote_i2p_node_status_color = 'green'
 
                     if delta_time_ms < 1000:  # ms
@@ -1215,12 +1942,71 @@ class MainWindow(QMainWindow):
 
                         new_remote_i2p_node_status_raw = f'Онлайн ({delta_time_seconds} с)'
 
+                    rtt_histogram = active_data_connection.get_rtt_histogram()
+
+                    if rtt_histogram.get_samples_count():
+                        rtt_percentile_text = '/'.join(
+                            str(
+                                round(
+                                    rtt_histogram.get_percentile(
+                                        rtt_percentile,
+                                    )
+                                    * 1000,  # ms
+                                ),
+                            )
+                            for rtt_percentile in (50, 95, 99)
+                        )
+
+                        new_remote_i2p_node_status_raw += (
+                            f', RTT p50/p95/p99: {rtt_percentile_text} мс'
+                        )
+
             await self.__update_remote_i2p_node_status(
                 new_remote_i2p_node_status_raw,
                 color=(new_remote_i2p_node_status_color),
             )
 
-            await asyncio.sleep(
+            QtUtils.set_label_text(
+                self.__local_i2p_node_outbound_traffic_value_label,
+                self.__get_local_i2p_node_outbound_traffic_text(),
+            )
+
+            QtUtils.set_label_text(
+                self.__local_i2p_node_sam_session_data_connection_metrics_value_label,
+                self.__get_local_i2p_node_sam_session_data_connection_metrics_text(
+                    active_data_connection,
+                ),
+            )
+
+            QtUtils.set_label_text(
+                self.__local_i2p_node_sam_session_data_connection_tasks_value_label,
+                self.__get_local_i2p_node_sam_session_data_connection_tasks_text(
+                    self.__data_connection_task_supervisor,
+                ),
+            )
+
+            if (
+                active_data_connection is None
+                and not g_common_globals.get_outbound_token_bucket().get_rate()
+            ):
+                # Nothing on display changes until a data connection is
+                # elected, so the loop does not wake up meanwhile
+
+                data_connection_election_condition = (
+                    self.__local_i2p_node_sam_session_data_connection_election_condition
+                )
+
+                async with data_connection_election_condition:
+                    await data_connection_election_condition.wait_for(
+                        lambda: (
+                            self.__get_local_i2p_node_sam_session_active_data_connection()
+                            is not None
+                        ),
+                    )
+
+                continue
+
+            await g_common_globals.get_timer_service().sleep(
                 1.0,  # s
             )
 
@@ -1273,33 +2059,128 @@ class MainWindow(QMainWindow):
             sam_address=(local_i2p_node_sam_ip_address_and_port_pair),
         )
 
-        local_i2p_node_destination_raw = local_i2p_node_destination.private_key.base64
+        local_i2p_node_destination_raw = local_i2p_node_destination.private_key.base64
+
+        (
+            self.__config_raw_data['local_i2p_node_destination_raw']
+        ) = local_i2p_node_destination_raw
+
+        self.__config_store.save()
+
+        self.__update_local_i2p_node_address()
+
+        await self.__update_local_i2p_node_sam_session()
+
+    async def __close_local_i2p_node_sam_session_control_connection(
+        self,
+    ) -> None:
+        local_i2p_node_sam_session_control_connection = (
+            self.__local_i2p_node_sam_session_control_connection
+        )
+
+        if local_i2p_node_sam_session_control_connection is not None:
+            local_i2p_node_sam_session_control_connection.close()
+
+            self.__local_i2p_node_sam_session_control_connection = (
+                local_i2p_node_sam_session_control_connection  # noqa
+            ) = None
+
+        self.__local_i2p_node_sam_session_creation_event.clear()
+
+    @staticmethod
+    def __get_local_i2p_node_outbound_traffic_text() -> str:
+        outbound_token_bucket = g_common_globals.get_outbound_token_bucket()
+
+        outbound_traffic_text = (
+            f'{outbound_token_bucket.get_rate() / 1024:.1f} КиБ/с'  # KiB
+        )
+
+        rate_bytes_per_second = outbound_token_bucket.get_rate_bytes_per_second()
+
+        if not rate_bytes_per_second:
+            return outbound_traffic_text + ' (без ограничения)'
+
+        queue_delay_ms = round(
+            outbound_token_bucket.get_queue_delay() * 1000,  # ms
+        )
+
+        return (
+            outbound_traffic_text
+            + f' (ограничение {rate_bytes_per_second / 1024:.1f} КиБ/с),'  # KiB
+            + f' задержка очереди {queue_delay_ms} мс'
+        )
+
+    @staticmethod
+    def __get_local_i2p_node_sam_session_data_connection_metrics_text(
+        data_connection: (Connection | None),
+    ) -> str:
+        if data_connection is None:
+            return 'N/A'
+
+        metrics = data_connection.get_metrics()
+
+        send_queue_bytes_count = metrics['send_queue_bytes_count']
+
+        retransmission_timeout_ms = round(
+            metrics['retransmission_timeout'] * 1000,  # ms
+        )
+
+        data_connection_metrics_text = (
+            f'очередь {metrics["send_queue_depth"]} кадров'
+            f' ({send_queue_bytes_count / 1024:.1f} КиБ),'  # KiB
+            f' RTO {retransmission_timeout_ms} мс,'
+            f' кадров за запись {metrics["frames_per_flush"]:.1f}'
+        )
 
-        (
-            self.__config_raw_data['local_i2p_node_destination_raw']
-        ) = local_i2p_node_destination_raw
+        compression_codec_name = metrics['compression_codec_name']
 
-        self.__save_config()
+        if compression_codec_name is not None:
+            data_connection_metrics_text += (
+                f', сжатие {compression_codec_name}'
+                f' до {metrics["compression_ratio"]:.0%}'
+            )
 
-        self.__update_local_i2p_node_address()
+        return data_connection_metrics_text
 
-        await self.__update_local_i2p_node_sam_session()
+    @staticmethod
+    def __get_local_i2p_node_sam_session_data_connection_tasks_text(
+        data_connection_task_supervisor: (TaskSupervisor),
+    ) -> str:
+        return (
+            f'запущено {data_connection_task_supervisor.get_running_tasks_count()},'
+            f' перезапусков {data_connection_task_supervisor.get_restarts_count()}'
+        )
 
-    async def __close_local_i2p_node_sam_session_control_connection(
+    def __get_local_i2p_node_sam_session_active_data_connection(
         self,
-    ) -> None:
-        local_i2p_node_sam_session_control_connection = (
-            self.__local_i2p_node_sam_session_control_connection
+    ) -> Connection | None:
+        established_incoming_data_connection = (
+            self.__local_i2p_node_sam_session_established_incoming_data_connection
         )
 
-        if local_i2p_node_sam_session_control_connection is not None:
-            local_i2p_node_sam_session_control_connection.close()
+        established_outgoing_data_connection = (
+            self.__local_i2p_node_sam_session_established_outgoing_data_connection
+        )
 
-            self.__local_i2p_node_sam_session_control_connection = (
-                local_i2p_node_sam_session_control_connection  # noqa
-            ) = None
+        if established_incoming_data_connection is None:
+            return established_outgoing_data_connection
 
-        self.__local_i2p_node_sam_session_creation_event.clear()
+        if established_outgoing_data_connection is None:
+            return established_incoming_data_connection
+
+        # Both nodes see the same pair of streams, so both elect the one opened
+        # by the node with the smaller address; the other one only carries
+        # pings and stays a warm standby for failover
+
+        remote_i2p_node_address_raw = self.__remote_i2p_node_address_raw
+
+        if (
+            remote_i2p_node_address_raw is not None
+            and self.__local_i2p_node_address < remote_i2p_node_address_raw
+        ):
+            return established_outgoing_data_connection
+
+        return established_incoming_data_connection
 
     @staticmethod
     def __get_local_i2p_node_address(
@@ -1349,7 +2230,7 @@ class MainWindow(QMainWindow):
             self.__config_raw_data['local_i2p_node_sam_ip_address_raw']
         ) = new_local_i2p_node_sam_ip_address_raw
 
-        self.__save_config()
+        self.__config_store.save()
 
         new_local_i2p_node_sam_ip_address: IPv4Address | IPv6Address | None
 
@@ -1381,7 +2262,9 @@ class MainWindow(QMainWindow):
                 ' }',
             )
 
-        await self.update_local_i2p_node_destination()
+        self.__local_i2p_node_sam_session_reconfiguration_debouncer.schedule(
+            self.__reconfigure_local_i2p_node_sam_session,
+        )
 
     @asyncSlot()
     async def __on_local_i2p_node_sam_port_line_edit_text_changed(
@@ -1411,7 +2294,7 @@ class MainWindow(QMainWindow):
             self.__config_raw_data['local_i2p_node_sam_port_raw']
         ) = new_local_i2p_node_sam_port_raw
 
-        self.__save_config()
+        self.__config_store.save()
 
         new_local_i2p_node_sam_port: int | None
 
@@ -1449,7 +2332,9 @@ class MainWindow(QMainWindow):
                 ' }',
             )
 
-        await self.update_local_i2p_node_destination()
+        self.__local_i2p_node_sam_session_reconfiguration_debouncer.schedule(
+            self.__reconfigure_local_i2p_node_sam_session,
+        )
 
     @asyncSlot()
     async def __on_message_send_button_clicked(
@@ -1464,17 +2349,50 @@ class MainWindow(QMainWindow):
         if not (message_text or message_images):
             return
 
-        message_image_base64_encoded_text_list: list[str] | None
+        message_attachment_id_list: list[str] | None
 
         if message_images:
-            message_image_base64_encoded_text_list = [
-                QtUtils.get_image_base64_encoded_text(
+            local_i2p_node_attachment_bytes_by_id_map = (
+                self.__local_i2p_node_attachment_bytes_by_id_map
+            )
+
+            message_image_bytes_list = [
+                QtUtils.get_image_png_bytes(
                     message_image,
                 )
-                for message_image in (message_images)
+                for message_image in message_images
             ]
+
+            # The remote node rejects larger attachments, so the message is
+            # left in the editor rather than sent without them
+
+            if any(
+                len(message_image_bytes) > _MAX_ATTACHMENT_BYTES_COUNT
+                for message_image_bytes in message_image_bytes_list
+            ):
+                logger.warning(
+                    'Message image is larger than'
+                    f' {_MAX_ATTACHMENT_BYTES_COUNT} B, not sending',
+                )
+
+                return
+
+            message_attachment_id_list = []
+
+            for message_image_bytes in message_image_bytes_list:
+                message_attachment_id = hashlib.sha256(
+                    message_image_bytes,
+                ).hexdigest()
+
+                local_i2p_node_attachment_bytes_by_id_map[message_attachment_id] = (
+                    message_image_bytes
+                )
+
+                message_attachment_id_list.append(
+                    message_attachment_id,
+                )
         else:
-            message_image_base64_encoded_text_list = None
+            message_attachment_id_list = None
 
         local_i2p_node_message_raw_data_by_id_map = (
             self.__local_i2p_node_message_raw_data_by_id_map
@@ -1497,10 +2415,10 @@ class MainWindow(QMainWindow):
         if message_text:
             (pending_message_raw_data['text']) = message_text
 
-        if message_image_base64_encoded_text_list is not None:
+        if message_attachment_id_list is not None:
             (
-                pending_message_raw_data['image_base64_encoded_text_list']
-            ) = message_image_base64_encoded_text_list
+                pending_message_raw_data['attachment_id_list']
+            ) = message_attachment_id_list
 
         message_raw_data = pending_message_raw_data.copy()
 
@@ -1514,19 +2432,10 @@ class MainWindow(QMainWindow):
 
         self.__update_conversation()
 
-        if self.__local_i2p_node_sam_session_control_connection is not None:
-            local_i2p_node_sam_session = self.__local_i2p_node_sam_session
-
-            for data_connection in (
-                local_i2p_node_sam_session.get_incoming_data_connection(),
-                local_i2p_node_sam_session.get_outgoing_data_connection(),
-            ):
-                if data_connection is not None:
-                    await self.__send_message_raw_data(
-                        data_connection, message_id, pending_message_raw_data
-                    )
+        if message_attachment_id_list is not None:
+            self.__local_i2p_node_attachment_sending_event.set()
 
-                    break
+        self.__local_i2p_node_message_sending_event.set()
 
         message_text_edit.clear()
 
@@ -1560,7 +2469,7 @@ class MainWindow(QMainWindow):
             self.__config_raw_data['remote_i2p_node_address_raw']
         ) = new_remote_i2p_node_address_raw
 
-        self.__save_config()
+        self.__config_store.save()
 
         is_new_remote_i2p_node_address_raw_valid = self.__is_i2p_node_address_raw_valid(
             new_remote_i2p_node_address_raw,
@@ -1581,18 +2490,401 @@ class MainWindow(QMainWindow):
                 ' }',
             )
 
-        await self.__local_i2p_node_sam_session.close_outgoing_data_connection()
+        self.__remote_i2p_node_address_reconfiguration_debouncer.schedule(
+            self.__reconfigure_remote_i2p_node_address,
+        )
+
+    def __get_attachment_bytes(
+        self,
+        attachment_id: str,
+    ) -> bytes | None:
+        attachment_bytes = self.__local_i2p_node_attachment_bytes_by_id_map.get(
+            attachment_id,
+        )
+
+        if attachment_bytes is not None:
+            return attachment_bytes
+
+        if not AttachmentStore.is_attachment_id_valid(
+            attachment_id,
+        ):
+            return None
+
+        return self.__remote_i2p_node_attachment_store.read(
+            attachment_id,
+        )
+
+    async def __wait_for_local_i2p_node_sam_session_data_connection_election(
+        self,
+        connection: (Connection),
+    ) -> bool:
+        """Waits until the connection is the elected one; returns True if it had been a standby."""
+        if self.__get_local_i2p_node_sam_session_active_data_connection() is connection:
+            return False
+
+        data_connection_election_condition = (
+            self.__local_i2p_node_sam_session_data_connection_election_condition
+        )
+
+        async with data_connection_election_condition:
+            await data_connection_election_condition.wait_for(
+                lambda: (
+                    self.__get_local_i2p_node_sam_session_active_data_connection()
+                    is connection
+                ),
+            )
+
+        return True
+
+    def __get_remote_i2p_node_attachment_received_bytes_count(
+        self,
+        attachment_id: str,
+    ) -> int:
+        return self.__remote_i2p_node_attachment_store.get_received_bytes_count(
+            attachment_id,
+        )
+
+    def __is_local_i2p_node_message_attachment_list_delivered(
+        self,
+        attachment_id_list: list[str],
+    ) -> bool:
+        local_i2p_node_attachment_bytes_by_id_map = (
+            self.__local_i2p_node_attachment_bytes_by_id_map
+        )
+
+        local_i2p_node_attachment_acked_offset_by_id_map = (
+            self.__local_i2p_node_attachment_acked_offset_by_id_map
+        )
+
+        return all(
+            local_i2p_node_attachment_acked_offset_by_id_map.get(
+                attachment_id,
+                0,
+            )
+            >= len(local_i2p_node_attachment_bytes_by_id_map[attachment_id])
+            for attachment_id in attachment_id_list
+        )
+
+    async def __on_local_i2p_node_attachment_ack_frame(
+        self,
+        attachment_ack_frame: AttachmentAckFrame,
+    ) -> None:
+        attachment_id = attachment_ack_frame.get_attachment_id()
+
+        offset = attachment_ack_frame.get_offset()
+
+        attachment_bytes = self.__local_i2p_node_attachment_bytes_by_id_map.get(
+            attachment_id,
+        )
+
+        if attachment_bytes is None:
+            logger.warning(
+                f': Attachment ACK raw data for unknown attachment: {attachment_id}',
+            )
+
+            return
+
+        if attachment_ack_frame.is_rejected():
+            logger.warning(
+                f': Attachment {attachment_id} was rejected by the remote node',
+            )
+
+            self.__on_local_i2p_node_attachment_rejected(
+                attachment_id,
+            )
+
+            return
+
+        attachment_bytes_count = len(attachment_bytes)
+
+        # The remote offset may also go backwards (e.g. after the remote node
+        # was restarted), in which case the transfer resumes from there
+
+        (
+            self.__local_i2p_node_attachment_acked_offset_by_id_map[attachment_id]
+        ) = min(
+            max(
+                offset,
+                0,
+            ),
+            attachment_bytes_count,
+        )
+
+        self.__local_i2p_node_attachment_sending_event.set()
+
+        if offset < attachment_bytes_count:
+            return
+
+        # Messages whose attachments are all delivered can go out now
+
+        self.__local_i2p_node_message_sending_event.set()
+
+    def __on_local_i2p_node_attachment_rejected(
+        self,
+        attachment_id: str,
+    ) -> None:
+        # The attachment is left out of the pending messages, which then go
+        # out without it; a message with nothing else in it is given up on.
+        # Either way the conversation shows what was not delivered
+
+        local_i2p_node_message_raw_data_by_id_map = (
+            self.__local_i2p_node_message_raw_data_by_id_map
+        )
+
+        local_i2p_node_pending_message_raw_data_by_id_map = (
+            self.__local_i2p_node_pending_message_raw_data_by_id_map
+        )
+
+        for pending_message_id, pending_message_raw_data in list(
+            local_i2p_node_pending_message_raw_data_by_id_map.items(),
+        ):
+            pending_message_attachment_id_list = pending_message_raw_data.get(
+                'attachment_id_list',
+            )
+
+            if (
+                pending_message_attachment_id_list is None
+                or attachment_id not in pending_message_attachment_id_list
+            ):
+                continue
+
+            pending_message_attachment_id_list = [
+                pending_message_attachment_id
+                for pending_message_attachment_id in pending_message_attachment_id_list
+                if pending_message_attachment_id != attachment_id
+            ]
+
+            if pending_message_attachment_id_list:
+                (
+                    pending_message_raw_data['attachment_id_list']
+                ) = pending_message_attachment_id_list
+            else:
+                del pending_message_raw_data['attachment_id_list']
+
+            message_raw_data = local_i2p_node_message_raw_data_by_id_map.get(
+                pending_message_id,
+            )
+
+            if message_raw_data is not None:
+                message_raw_data.setdefault(
+                    'rejected_attachment_id_list',
+                    [],
+                ).append(
+                    attachment_id,
+                )
+
+            if not (
+                'text' in pending_message_raw_data
+                or pending_message_attachment_id_list
+            ):
+                del local_i2p_node_pending_message_raw_data_by_id_map[
+                    pending_message_id
+                ]
+
+                if message_raw_data is not None:
+                    (message_raw_data['is_rejected']) = True
+
+        # The remote node will not take the attachment, so there is no point
+        # in holding its bytes
+
+        self.__local_i2p_node_attachment_acked_offset_by_id_map.pop(
+            attachment_id,
+            None,
+        )
+
+        self.__local_i2p_node_attachment_bytes_by_id_map.pop(
+            attachment_id,
+            None,
+        )
+
+        self.__local_i2p_node_message_sending_event.set()
+
+        self.__update_conversation()
+
+    def __on_local_i2p_node_message_acked(
+        self,
+        connection: (Connection),
+        message_id: int,
+    ) -> None:
+        (
+            self.__local_i2p_node_pending_message_raw_data_by_id_map.pop(
+                message_id,
+                None,
+            )
+        )
+
+        rtt = self.__local_i2p_node_message_retransmission_scheduler.on_acked(
+            message_id,
+            time.monotonic(),
+        )
+
+        if rtt is not None:
+            connection.get_rtt_estimator().add_sample(
+                rtt,
+            )
+
+        # An in-flight slot was freed
+
+        self.__local_i2p_node_message_sending_event.set()
+
+    def __on_local_i2p_node_selective_ack_frame(
+        self,
+        connection: (Connection),
+        selective_ack_frame: SelectiveAckFrame,
+    ) -> None:
+        cumulative_message_id = selective_ack_frame.get_cumulative_message_id()
+
+        message_id_range_list = selective_ack_frame.get_message_id_range_list()
+
+        acked_message_ids = [
+            pending_message_id
+            for pending_message_id in (
+                self.__local_i2p_node_pending_message_raw_data_by_id_map
+            )
+            if pending_message_id <= cumulative_message_id
+            or any(
+                start_message_id <= pending_message_id <= end_message_id
+                for start_message_id, end_message_id in message_id_range_list
+            )
+        ]
+
+        if not acked_message_ids:
+            return
+
+        for acked_message_id in acked_message_ids:
+            self.__on_local_i2p_node_message_acked(
+                connection,
+                acked_message_id,
+            )
+
+        self.__update_conversation()
 
-    def __save_config(
+    async def __on_remote_i2p_node_attachment_chunk_frame(
         self,
+        connection: (Connection),
+        attachment_chunk_frame: AttachmentChunkFrame,
     ) -> None:
-        with codecs.open(_CONFIG_FILE_PATH, 'w', 'utf-8') as config_file:
-            config_file.write(
-                orjson.dumps(
-                    self.__config_raw_data,
-                ).decode()
+        attachment_id = attachment_chunk_frame.get_attachment_id()
+        attachment_bytes_count = attachment_chunk_frame.get_attachment_bytes_count()
+
+        remote_i2p_node_attachment_store = self.__remote_i2p_node_attachment_store
+
+        attachment_received_bytes_count: int
+
+        if remote_i2p_node_attachment_store.contains(
+            attachment_id,
+        ):
+            attachment_received_bytes_count = attachment_bytes_count
+        elif attachment_bytes_count > _MAX_ATTACHMENT_BYTES_COUNT:
+            logger.warning(
+                f': Attachment {attachment_id} is too large: {attachment_bytes_count} B',
+            )
+
+            # Otherwise the remote node would resend it for as long as the
+            # connection lives
+
+            await self.__send_attachment_ack_raw_data(
+                connection,
+                attachment_id,
+                0,
+                is_rejected=True,
+            )
+
+            return
+        else:
+            # Chunks go straight to disk, so only one chunk per connection is
+            # ever held in memory; the disk and the checksum of the complete
+            # attachment are kept off the GUI loop
+
+            attachment_received_bytes_count = (
+                await remote_i2p_node_attachment_store.write_chunk_async(
+                    attachment_id,
+                    attachment_bytes_count,
+                    attachment_chunk_frame.get_offset(),
+                    attachment_chunk_frame.get_data(),
+                )
             )
 
+        await self.__send_attachment_ack_raw_data(
+            connection,
+            attachment_id,
+            attachment_received_bytes_count,
+        )
+
+    @staticmethod
+    def __write_legacy_message_images(
+        attachment_store: AttachmentStore,
+        image_base64_encoded_text_list: list[str],
+    ) -> list[str] | None:
+        """Stores inline images as attachments; returns their IDs, or None if any image is incorrect."""
+        image_bytes_list: list[bytes] = []
+
+        for image_base64_encoded_text in image_base64_encoded_text_list:
+            try:
+                image_bytes = b64decode(
+                    image_base64_encoded_text,
+                    validate=True,
+                )
+            except binascii.Error:
+                logger.warning(
+                    ': Message raw data has incorrect image base64 encoded text'
+                    f': {image_base64_encoded_text[:64]}',
+                )
+
+                return None
+
+            image_bytes_list.append(
+                image_bytes,
+            )
+
+        attachment_id_list: list[str] = []
+
+        for image_bytes in image_bytes_list:
+            attachment_id = hashlib.sha256(
+                image_bytes,
+            ).hexdigest()
+
+            attachment_store.write(
+                attachment_id,
+                image_bytes,
+            )
+
+            attachment_id_list.append(
+                attachment_id,
+            )
+
+        return attachment_id_list
+
+    async def __reconfigure_local_i2p_node_sam_session(
+        self,
+    ) -> None:
+        # Data connections which failed at the old address or port are retried
+        # at once
+
+        self.__local_i2p_node_sam_session_incoming_data_connection_reconnect_backoff.wake()
+        self.__local_i2p_node_sam_session_outgoing_data_connection_reconnect_backoff.wake()
+
+        await self.update_local_i2p_node_destination()
+
+    async def __reconfigure_remote_i2p_node_address(
+        self,
+    ) -> None:
+        # A SAM handshake with the old address is abandoned
+
+        outgoing_data_connection_creation_task = (
+            self.__local_i2p_node_sam_session_outgoing_data_connection_creation_task
+        )
+
+        if outgoing_data_connection_creation_task is not None:
+            outgoing_data_connection_creation_task.cancel()
+
+        await self.__local_i2p_node_sam_session.close_outgoing_data_connection()
+
+        # Peers rejected or unreachable at the old address are retried at once
+
+        self.__local_i2p_node_sam_session_incoming_data_connection_reconnect_backoff.wake()
+        self.__local_i2p_node_sam_session_outgoing_data_connection_reconnect_backoff.wake()
+
     def __update_conversation(self) -> None:
         conversation_message_raw_data_list_by_time_map_by_date_map = defaultdict(lambda: defaultdict(list))
 
@@ -1714,7 +3006,9 @@ class MainWindow(QMainWindow):
 
                     if data['is_own']:
                         html.write('[Вы]')
-                        if data.get('is_delivered', False):
+                        if data.get('is_rejected', False):
+                            html.write('[❌ Отклонено собеседником]')
+                        elif data.get('is_delivered', False):
                             html.write('[✅ Доставлено]')
                         else:
                             html.write('[⌛ <i>Ожидание доставки...</i>]')
@@ -1729,15 +3023,20 @@ class MainWindow(QMainWindow):
 
                     html.write('                </div>')
 
-                    images = data.get('image_base64_encoded_text_list')
-                    if images is not None:
+                    attachment_ids = data.get('attachment_id_list')
+                    if attachment_ids is not None:
+                        rejected_attachment_ids = data.get('rejected_attachment_id_list', ())
                         html.write('                <div>')
-                        for img_idx, img_b64 in enumerate(images):
+                        for img_idx, attachment_id in enumerate(attachment_ids):
                             if img_idx:
                                 html.write('\n')
                             html.write(
                                 f'                    <div id="message_{message_idx}_image_{img_idx}">'
-                                + QtUtils.get_image_html_text(img_b64)
+                                + (
+                                    '[❌ <i>Изображение отклонено собеседником</i>]'
+                                    if attachment_id in rejected_attachment_ids
+                                    else QtUtils.get_attachment_image_html_text(attachment_id)
+                                )
                                 + '                    </div>'
                             )
                         html.write('                </div>')
@@ -1821,6 +3120,8 @@ class MainWindow(QMainWindow):
                 local_i2p_node_sam_port,
             )
 
+            reconnect_backoff = self.__local_i2p_node_sam_session_reconnect_backoff
+
             while True:
                 await self.__update_local_i2p_node_sam_session_status(
                     'Попытка создания...',
@@ -1851,9 +3152,7 @@ class MainWindow(QMainWindow):
                         color='red',
                     )
 
-                    await asyncio.sleep(
-                        1.0,  # s
-                    )
+                    await reconnect_backoff.wait()
 
                     continue
                 except Exception as exception:
@@ -1867,9 +3166,7 @@ class MainWindow(QMainWindow):
                         color='red',
                     )
 
-                    await asyncio.sleep(
-                        1.0,  # s
-                    )
+                    await reconnect_backoff.wait()
 
                     continue
 
@@ -1883,8 +3180,67 @@ class MainWindow(QMainWindow):
                 color='green',
             )
 
+            reconnect_backoff.reset()
+
             self.__local_i2p_node_sam_session_creation_event.set()
 
+            # Data connections which failed while there was no session may
+            # succeed now
+
+            self.__local_i2p_node_sam_session_incoming_data_connection_reconnect_backoff.wake()
+            self.__local_i2p_node_sam_session_outgoing_data_connection_reconnect_backoff.wake()
+
+    async def __update_local_i2p_node_sam_session_data_connection_election(
+        self,
+    ) -> None:
+        active_data_connection = (
+            self.__get_local_i2p_node_sam_session_active_data_connection()
+        )
+
+        local_i2p_node_sam_session = self.__local_i2p_node_sam_session
+
+        established_incoming_data_connection = (
+            self.__local_i2p_node_sam_session_established_incoming_data_connection
+        )
+
+        if established_incoming_data_connection is not None:
+            local_i2p_node_sam_session.update_incoming_data_connection_status(
+                new_incoming_data_connection_status_color='green',
+                new_incoming_data_connection_status_text=(
+                    'Создано, активно'
+                    if established_incoming_data_connection is active_data_connection
+                    else 'Создано, резерв'
+                ),
+            )
+
+        established_outgoing_data_connection = (
+            self.__local_i2p_node_sam_session_established_outgoing_data_connection
+        )
+
+        if established_outgoing_data_connection is not None:
+            local_i2p_node_sam_session.update_outgoing_data_connection_status(
+                new_outgoing_data_connection_status_color='green',
+                new_outgoing_data_connection_status_text=(
+                    'Создано, активно'
+                    if established_outgoing_data_connection is active_data_connection
+                    else 'Создано, резерв'
+                ),
+            )
+
+        data_connection_election_condition = (
+            self.__local_i2p_node_sam_session_data_connection_election_condition
+        )
+
+        async with data_connection_election_condition:
+            data_connection_election_condition.notify_all()
+
+        # Sending loops of a connection that has just become standby are woken
+        # up to notice it
+
+        self.__local_i2p_node_attachment_sending_event.set()
+
+        self.__local_i2p_node_message_sending_event.set()
+
     async def __update_local_i2p_node_sam_session_incoming_data_connection_status(
         self,
         color: str | None,
@@ -1,11 +1,15 @@
 import logging
+import typing
 
 from PySide6.QtCore import (
+    QByteArray,
     QMimeData,
+    QUrl,
 )
 
 from PySide6.QtGui import (
     QImage,
+    QTextDocument,
 )
 
 from PySide6.QtWidgets import (
@@ -23,6 +27,53 @@ logger = logging.getLogger(
 
 
 class ConversationTextEdit(QTextEdit):
+    __slots__ = (
+        '__get_attachment_bytes',
+    )
+
+    def __init__(self) -> None:
+        super().__init__()
+
+        self.__get_attachment_bytes: (
+            typing.Callable[[str], bytes | None] | None
+        ) = None
+
+    def set_attachment_bytes_getter(
+        self,
+        get_attachment_bytes: typing.Callable[[str], bytes | None],
+    ) -> None:
+        self.__get_attachment_bytes = get_attachment_bytes
+
+    def loadResource(self, type_: int, url: QUrl) -> typing.Any:
+        get_attachment_bytes = self.__get_attachment_bytes
+
+        if (
+            get_attachment_bytes is not None
+            and type_ == QTextDocument.ResourceType.ImageResource
+        ):
+            attachment_id = QtUtils.get_attachment_id(
+                url.toString(),
+            )
+
+            if attachment_id is not None:
+                attachment_bytes = get_attachment_bytes(
+                    attachment_id,
+                )
+
+                if attachment_bytes is not None:
+                    return QByteArray(
+                        attachment_bytes,
+                    )
+
+                logger.warning(
+                    f'Attachment with ID {attachment_id!r} was not found',
+                )
+
+        return super(ConversationTextEdit, self).loadResource(
+            type_,
+            url,
+        )
+
     def createMimeDataFromSelection(self) -> QMimeData:
         mime_data = QMimeData()
 
@@ -35,6 +86,7 @@ class ConversationTextEdit(QTextEdit):
 
         result_raw_data = QtUtils.parse_html(
             html_text,
+            get_attachment_bytes=self.__get_attachment_bytes,
         )
 
         images: list[QImage] | None = result_raw_data['images']
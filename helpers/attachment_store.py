@@ -0,0 +1,260 @@
+import asyncio
+import hashlib
+import logging
+import os
+import re
+
+from concurrent.futures import (
+    ThreadPoolExecutor,
+)
+
+
+logger = logging.getLogger(
+    __name__,
+)
+
+
+_ATTACHMENT_ID_PATTERN = re.compile(
+    r'[0-9a-f]{64}',
+)
+
+_PARTIAL_ATTACHMENT_FILE_NAME_SUFFIX = '.part'
+
+_READ_BLOCK_BYTES_COUNT = 1024 * 1024  # B
+
+
+class AttachmentStore(object):
+    """
+    Content-addressed on-disk storage of attachments received from the remote node.
+
+    Attachments are identified by the hex SHA-256 digest of their bytes. Chunks
+    are appended to a partial file, which is verified and renamed once complete,
+    so memory use does not depend on attachment sizes or count.
+    """
+
+    __slots__ = (
+        '__directory_path',
+        '__executor',
+    )
+
+    def __init__(
+        self,
+        directory_path: str,
+    ) -> None:
+        super(AttachmentStore, self).__init__()
+
+        os.makedirs(
+            directory_path,
+            exist_ok=True,
+        )
+
+        self.__directory_path = directory_path
+
+        # Chunks of one attachment may arrive over both data connections, so
+        # they are written by a single thread, in the order they arrived
+
+        self.__executor = ThreadPoolExecutor(
+            max_workers=1,
+            thread_name_prefix='AttachmentStoreThread',
+        )
+
+    def contains(
+        self,
+        attachment_id: str,
+    ) -> bool:
+        return os.path.exists(
+            self.__get_file_path(
+                attachment_id,
+            ),
+        )
+
+    def get_received_bytes_count(
+        self,
+        attachment_id: str,
+    ) -> int:
+        try:
+            return os.path.getsize(
+                self.__get_partial_file_path(
+                    attachment_id,
+                ),
+            )
+        except FileNotFoundError:
+            return 0
+
+    @staticmethod
+    def is_attachment_id_valid(
+        attachment_id: str,
+    ) -> bool:
+        return (
+            _ATTACHMENT_ID_PATTERN.fullmatch(
+                attachment_id,
+            )
+            is not None
+        )
+
+    def read(
+        self,
+        attachment_id: str,
+    ) -> bytes | None:
+        try:
+            with open(
+                self.__get_file_path(
+                    attachment_id,
+                ),
+                'rb',
+            ) as attachment_file:
+                return attachment_file.read()
+        except FileNotFoundError:
+            return None
+
+    def write(
+        self,
+        attachment_id: str,
+        attachment_bytes: bytes,
+    ) -> None:
+        partial_file_path = self.__get_partial_file_path(
+            attachment_id,
+        )
+
+        with open(
+            partial_file_path,
+            'wb',
+        ) as partial_attachment_file:
+            partial_attachment_file.write(
+                attachment_bytes,
+            )
+
+        os.replace(
+            partial_file_path,
+            self.__get_file_path(
+                attachment_id,
+            ),
+        )
+
+    async def write_chunk_async(
+        self,
+        attachment_id: str,
+        attachment_bytes_count: int,
+        offset: int,
+        chunk_bytes: bytes | memoryview,
+    ) -> int:
+        """Runs write_chunk() in the thread of the store, so that neither the disk nor the final checksum blocks the event loop."""
+        return await asyncio.get_running_loop().run_in_executor(
+            self.__executor,
+            self.write_chunk,
+            attachment_id,
+            attachment_bytes_count,
+            offset,
+            chunk_bytes,
+        )
+
+    def write_chunk(
+        self,
+        attachment_id: str,
+        attachment_bytes_count: int,
+        offset: int,
+        chunk_bytes: bytes | memoryview,
+    ) -> int:
+        """
+        Appends the chunk if it continues the received bytes; duplicates and chunks after a gap are dropped.
+
+        Returns the count of received bytes, i.e. the offset to resume the transfer from.
+        """
+        partial_file_path = self.__get_partial_file_path(
+            attachment_id,
+        )
+
+        received_bytes_count = self.get_received_bytes_count(
+            attachment_id,
+        )
+
+        if offset != received_bytes_count:
+            return received_bytes_count
+
+        with open(
+            partial_file_path,
+            'ab',
+        ) as partial_attachment_file:
+            partial_attachment_file.write(
+                chunk_bytes,
+            )
+
+        received_bytes_count += len(chunk_bytes)
+
+        if received_bytes_count < attachment_bytes_count:
+            return received_bytes_count
+
+        if self.__get_partial_file_digest_hex(
+            partial_file_path,
+        ) != attachment_id:
+            logger.warning(
+                f'Attachment {attachment_id} has incorrect checksum',
+            )
+
+            os.remove(
+                partial_file_path,
+            )
+
+            return 0
+
+        os.replace(
+            partial_file_path,
+            self.__get_file_path(
+                attachment_id,
+            ),
+        )
+
+        return received_bytes_count
+
+    @staticmethod
+    def __get_partial_file_digest_hex(
+        partial_file_path: str,
+    ) -> str:
+        attachment_hash = hashlib.sha256()
+
+        with open(
+            partial_file_path,
+            'rb',
+        ) as partial_attachment_file:
+            while True:
+                block_bytes = partial_attachment_file.read(
+                    _READ_BLOCK_BYTES_COUNT,
+                )
+
+                if not block_bytes:
+                    break
+
+                attachment_hash.update(
+                    block_bytes,
+                )
+
+        return attachment_hash.hexdigest()
+
+    def __get_file_path(
+        self,
+        attachment_id: str,
+    ) -> str:
+        # The ID comes from the remote node and becomes a file name
+
+        if not self.is_attachment_id_valid(
+            attachment_id,
+        ):
+            raise ValueError(
+                f'incorrect attachment ID: {attachment_id!r}',
+            )
+
+        return os.path.join(
+            self.__directory_path,
+            attachment_id,
+        )
+
+    def __get_partial_file_path(
+        self,
+        attachment_id: str,
+    ) -> str:
+        return (
+            self.__get_file_path(
+                attachment_id,
+            )
+            + _PARTIAL_ATTACHMENT_FILE_NAME_SUFFIX
+        )
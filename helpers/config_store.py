@@ -0,0 +1,180 @@
+import logging
+import os
+import traceback
+
+from concurrent.futures import (
+    Future,
+    ThreadPoolExecutor,
+)
+
+import orjson
+
+from globals.common import (
+    g_common_globals,
+)
+
+from helpers.timer_service import (
+    Timer,
+)
+
+from utils.json import (
+    JsonUtils,
+)
+
+
+logger = logging.getLogger(
+    __name__,
+)
+
+
+# Changes made within this window are written together
+_DEFAULT_WRITE_DELAY = 0.5  # s
+
+_TEMPORARY_CONFIG_FILE_NAME_SUFFIX = '.tmp'
+
+
+class ConfigStore(object):
+    """
+    Config raw data kept in memory and written to disk in batches, off the GUI thread.
+
+    A write goes to a temporary file, which is flushed to disk and then renamed
+    over the config file, so the config file is always either the old or the
+    new one, whenever the application is killed. Writes run one at a time in
+    a thread of their own, in the order the changes were made.
+    """
+
+    __slots__ = (
+        '__executor',
+        '__file_path',
+        '__is_dirty',
+        '__raw_data',
+        '__write_delay',
+        '__write_timer',
+    )
+
+    def __init__(
+        self,
+        file_path: str,
+        write_delay: float = _DEFAULT_WRITE_DELAY,
+    ) -> None:
+        super(ConfigStore, self).__init__()
+
+        self.__executor = ThreadPoolExecutor(
+            max_workers=1,
+            thread_name_prefix='ConfigStoreThread',
+        )
+
+        self.__file_path = file_path
+
+        self.__is_dirty = False
+
+        self.__raw_data: dict = JsonUtils.read_if_exists(
+            file_path,
+            default=(dict),
+        )
+
+        self.__write_delay = write_delay
+
+        self.__write_timer: Timer | None = None
+
+    def close(
+        self,
+    ) -> None:
+        """Writes changes not written yet and waits until all writes are done; safe to call without a running event loop."""
+        write_timer = self.__write_timer
+
+        if write_timer is not None:
+            write_timer.cancel()
+
+        self.__write()
+
+        self.__executor.shutdown(
+            wait=True,
+        )
+
+    def get_raw_data(
+        self,
+    ) -> dict:
+        """Returns the raw data itself, changes to which are written once save() is called."""
+        return self.__raw_data
+
+    def save(
+        self,
+    ) -> None:
+        self.__is_dirty = True
+
+        if self.__write_timer is not None:
+            return
+
+        self.__write_timer = g_common_globals.get_timer_service().call_later(
+            self.__write_delay,
+            self.__write,
+        )
+
+    def __write(
+        self,
+    ) -> None:
+        self.__write_timer = None
+
+        if not self.__is_dirty:
+            return
+
+        self.__is_dirty = False
+
+        # Serialized here, so that the raw data is not read while it changes
+
+        data = orjson.dumps(
+            self.__raw_data,
+        )
+
+        future = self.__executor.submit(
+            self.__write_file_atomically,
+            self.__file_path,
+            data,
+        )
+
+        future.add_done_callback(
+            self.__on_write_done,
+        )
+
+    @staticmethod
+    def __on_write_done(
+        future: Future,
+    ) -> None:
+        exception = future.exception()
+
+        if exception is not None:
+            logger.error(
+                'Could not write config: %s',
+                ''.join(
+                    traceback.format_exception(
+                        exception,
+                    ),
+                ),
+            )
+
+    @staticmethod
+    def __write_file_atomically(
+        file_path: str,
+        data: bytes,
+    ) -> None:
+        temporary_file_path = file_path + _TEMPORARY_CONFIG_FILE_NAME_SUFFIX
+
+        with open(
+            temporary_file_path,
+            'wb',
+        ) as temporary_config_file:
+            temporary_config_file.write(
+                data,
+            )
+
+            temporary_config_file.flush()
+
+            os.fsync(
+                temporary_config_file.fileno(),
+            )
+
+        os.replace(
+            temporary_file_path,
+            file_path,
+        )
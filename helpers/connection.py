@@ -1,10 +1,53 @@
 import asyncio
 import logging
+import mmap
+import os
+import random
 import struct
+import tempfile
+import time
 import typing
+import zlib
+
+from collections import (
+    deque,
+)
 
 import orjson
 
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
+from event import (
+    Event,
+)
+
+from globals.common import (
+    g_common_globals,
+)
+
+from helpers.frame import (
+    AttachmentChunkFrame,
+)
+
+from helpers.latency_histogram import (
+    LatencyHistogram,
+)
+
+from helpers.rtt_estimator import (
+    RTTEstimator,
+)
+
+from helpers.token_bucket import (
+    TokenBucket,
+)
+
+from utils.async_ import (
+    run_coroutine_threadsafe_with_exceptions_logging,
+)
+
 
 logger = logging.getLogger(
     __name__,
@@ -13,202 +56,2183 @@ logger = logging.getLogger(
 
 _DEFAULT_TIMEOUT = 15.0  # s
 
+# Peers with the adaptive heartbeat ping only after hearing nothing for this
+# long, unless they are waiting for a reply to their own traffic
+_IDLE_HEARTBEAT_INTERVAL = 10.0  # s
+
+# Share of the idle interval randomly cut off it, so that only one of two idle
+# peers pings and the other one just answers
+_IDLE_HEARTBEAT_INTERVAL_JITTER = 0.25
+
+# Unanswered pings, one retransmission timeout apart, before the remote peer is
+# considered dead
+_HEARTBEAT_PROBES_COUNT = 3
+
+# Peers that predate the adaptive heartbeat ping at this fixed interval and
+# expect to be pinged as often
+_LEGACY_HEARTBEAT_INTERVAL = 5.0  # s
+
+# Frames up to this size are read with a single readexactly() call; larger
+# ones are read in chunks so that the idle deadline is pushed forward while
+# the payload is still arriving
+_READ_CHUNK_BYTES_COUNT = 256 * 1024  # B
+
+# Frames larger than this are spooled into a temporary file instead of RAM
+_MAX_IN_MEMORY_FRAME_BYTES_COUNT = int(
+    os.getenv(
+        'MAX_IN_MEMORY_FRAME_BYTES_COUNT',
+        8 * 1024 * 1024,  # B
+    ),
+)
+
+# Frames larger than this are decompressed and parsed in a worker thread, so
+# that multi-megabyte messages do not stall the event loop, which also runs the
+# GUI; smaller ones are cheaper to decode inline than to hand over
+_MAX_INLINE_DECODING_FRAME_BYTES_COUNT = int(
+    os.getenv(
+        'MAX_INLINE_DECODING_FRAME_BYTES_COUNT',
+        256 * 1024,  # B
+    ),
+)
+
+# Raw data read ahead for a consumer on another loop; once that many wait,
+# the socket is not read until the consumer catches up
+_MAX_READ_AHEAD_RAW_DATA_COUNT = 64
+
+# Frames larger than this are rejected as a protocol error
+_MAX_FRAME_BYTES_COUNT = int(
+    os.getenv(
+        'MAX_FRAME_BYTES_COUNT',
+        256 * 1024 * 1024,  # B
+    ),
+)
+
+# Callers of send_raw_data_async() are suspended once this many bytes are
+# waiting in the send queue and resumed when it drains below the low mark
+_SEND_QUEUE_HIGH_WATERMARK_BYTES_COUNT = 1024 * 1024  # B
+_SEND_QUEUE_LOW_WATERMARK_BYTES_COUNT = 256 * 1024  # B
+
+# Upper bound of bytes handed to the transport by a single flush
+_FLUSH_BYTES_COUNT = 256 * 1024  # B
+
+# Send queue priorities, most urgent first. Each flush takes control frames
+# first, then text ones, and bulk ones last and only this many bytes of them,
+# so a control frame never waits for more than about one fragment
+_CONTROL_PRIORITY = 0
+_TEXT_PRIORITY = 1
+_BULK_PRIORITY = 2
+
+_PRIORITIES_COUNT = 3
+
+_MAX_BULK_FLUSH_BYTES_COUNT = 64 * 1024  # B
+
+# Throughput assumed for bytes waiting to be acknowledged while none has been
+# measured, or less than this, as is usual for a slow I2P tunnel
+_MIN_DRAIN_RATE_BYTES_PER_SECOND = 16 * 1024  # B/s
+
+_CONTROL_RAW_DATA_TYPES: frozenset[str] = frozenset(
+    (
+        'ack',
+        'attachment_ack',
+        'hello',
+        'ping',
+        'pong',
+        'selective_ack',
+    ),
+)
+
+# With fragmentation negotiated, larger frames are sent as a sequence of
+# fragment frames of at most this payload size
+_MAX_UNFRAGMENTED_FRAME_BYTES_COUNT = 128 * 1024  # B
+
+_FRAGMENT_BYTES_COUNT = 64 * 1024  # B
+
+_FRAME_HEADER_STRUCT = struct.Struct(
+    '!I',
+)
+
+# The high bit of the length prefix marks a compressed payload; frames are
+# capped far below 2 GiB, so it is never set by peers unaware of it
+_COMPRESSED_FRAME_FLAG = 0x80000000
+
+# The next bit marks a binary attachment frame instead of a JSON one
+_BINARY_FRAME_FLAG = 0x40000000
+
+# The next one marks a fragment of a larger frame. Its payload starts with
+# the fragment header byte: the flags of the whole frame shifted into the high
+# bits, and the low bit set on the last fragment
+_FRAGMENT_FRAME_FLAG = 0x20000000
+
+_FRAME_FLAGS_MASK = (
+    _COMPRESSED_FRAME_FLAG | _BINARY_FRAME_FLAG | _FRAGMENT_FRAME_FLAG
+)
+
+_FRAGMENT_HEADER_STRUCT = struct.Struct(
+    '!B',
+)
+
+_FRAGMENT_FRAME_FLAGS_SHIFT = 24
+
+_LAST_FRAGMENT_FLAG = 0x01
+
+# Binary frame payload header: attachment kind code, SHA-256 digest of the
+# whole attachment (which doubles as the attachment ID), total attachment size
+# and offset of the chunk carried by the frame
+_ATTACHMENT_CHUNK_HEADER_STRUCT = struct.Struct(
+    '!B32sII',
+)
+
+_ATTACHMENT_KIND_BY_CODE_MAP: dict[int, str] = {
+    1: 'png',
+}
+
+_ATTACHMENT_CODE_BY_KIND_MAP: dict[str, int] = {
+    attachment_kind: attachment_code
+    for attachment_code, attachment_kind in _ATTACHMENT_KIND_BY_CODE_MAP.items()
+}
+
+# Version advertised in the hello frame. Hello frames without a version are
+# version 1; peers that send no hello at all are treated as version 0
+_PROTOCOL_VERSION = 2
+
+# Protocol features advertised in the hello frame; only the ones advertised by
+# both peers are used
+_FEATURE_NAMES: tuple[str, ...] = (
+    'adaptive_heartbeat',
+    'attachment_chunks',
+    'batching',
+    'fragmentation',
+    'selective_acks',
+)
+
+# Peers that predate the handshake never send a hello, so the wait for it is
+# bounded
+_HANDSHAKE_TIMEOUT = 5.0  # s
+
+# Remote peers must accept at least this frame size, so that attachment chunks
+# always fit into a frame
+_MIN_REMOTE_MAX_FRAME_BYTES_COUNT = 128 * 1024  # B
+
+# Upper bound of JSON payload bytes sent as a single batch frame
+_MAX_RAW_DATA_BATCH_BYTES_COUNT = 64 * 1024  # B
+
+# Supported compression codec names, most preferred first. Both peers walk
+# this same order when picking a codec, so they always agree on one
+_COMPRESSION_CODEC_NAMES: tuple[str, ...] = (
+    ('zstd', 'zlib') if zstandard is not None else ('zlib',)
+)
+
+_DECOMPRESSION_ERROR_TYPES: tuple[type[Exception], ...] = (
+    (zlib.error, zstandard.ZstdError) if zstandard is not None else (zlib.error,)
+)
+
+# Payloads smaller than this are not worth compressing
+_COMPRESSION_THRESHOLD_BYTES_COUNT = 512  # B
+
+_ZLIB_COMPRESSION_LEVEL = 6
+
+_ZSTD_COMPRESSION_LEVEL = 3
+
+
+class _ProtocolError(Exception):
+    pass
+
 
 class Connection(object):
     __slots__ = (
+        '__closed_event',
+        '__compression_codec_name',
+        '__compression_cpu_time',
+        '__compression_input_bytes_count',
+        '__compression_output_bytes_count',
+        '__decompression_cpu_time',
+        '__event_loop',
+        '__feature_names',
+        '__first_unanswered_sent_time',
+        '__flushed_frames_count',
+        '__flushes_count',
+        '__fragmented_frame',
+        '__fragmented_frame_flags',
+        '__handshake_event',
+        '__idle_timeout',
+        '__last_received_time',
+        '__max_frame_bytes_count',
+        '__max_in_memory_frame_bytes_count',
+        '__on_protocol_error_event',
+        '__protocol_error_text',
+        '__protocol_version',
+        '__raw_data_batch_bytes_count',
+        '__raw_data_batch_bytes_list',
+        '__raw_data_batch_priority',
         '__reader',
+        '__received_raw_data_deque',
+        '__received_raw_data_queue',
+        '__remote_max_frame_bytes_count',
+        '__rtt_estimator',
+        '__rtt_histogram',
+        '__send_queue_bytes_count',
+        '__send_queue_high_watermark_bytes_count',
+        '__send_queue_low_watermark_bytes_count',
+        '__send_queue_not_empty_event',
+        '__send_queue_writable_event',
+        '__send_queues',
+        '__token_bucket',
         '__writer',
+        '__writer_exception',
+        '__writer_task',
     )
 
     def __init__(
         self,
         reader: asyncio.StreamReader,
         writer: asyncio.StreamWriter,
+        idle_timeout: float = _DEFAULT_TIMEOUT,
+        max_frame_bytes_count: int = _MAX_FRAME_BYTES_COUNT,
+        max_in_memory_frame_bytes_count: int = _MAX_IN_MEMORY_FRAME_BYTES_COUNT,
+        send_queue_high_watermark_bytes_count: int = (
+            _SEND_QUEUE_HIGH_WATERMARK_BYTES_COUNT
+        ),
+        send_queue_low_watermark_bytes_count: int = (
+            _SEND_QUEUE_LOW_WATERMARK_BYTES_COUNT
+        ),
+        token_bucket: TokenBucket | None = None,
+        event_loop: asyncio.AbstractEventLoop | None = None,
     ) -> None:
         super(Connection, self).__init__()
 
+        assert (
+            send_queue_low_watermark_bytes_count
+            <= send_queue_high_watermark_bytes_count
+        ), (
+            send_queue_low_watermark_bytes_count,
+            send_queue_high_watermark_bytes_count,
+        )
+
+        self.__closed_event = asyncio.Event()
+
+        self.__compression_codec_name: str | None = None
+
+        self.__compression_cpu_time = 0.0
+
+        self.__compression_input_bytes_count = 0
+
+        self.__compression_output_bytes_count = 0
+
+        self.__decompression_cpu_time = 0.0
+
+        # Loop that owns the reader and the writer. Called from another loop,
+        # the public coroutines are handed over to it, and received raw data
+        # come back through a queue. None means the loop of the caller
+
+        self.__event_loop = event_loop
+
+        self.__feature_names: frozenset[str] = frozenset()
+
+        # Time of the earliest traffic sent since the remote peer was last
+        # heard from
+
+        self.__first_unanswered_sent_time: float | None = None
+
+        self.__flushed_frames_count = 0
+
+        self.__flushes_count = 0
+
+        # Payload of the frame whose fragments are being received
+
+        self.__fragmented_frame: (
+            bytearray | tempfile.SpooledTemporaryFile | None
+        ) = None
+
+        self.__fragmented_frame_flags = 0
+
+        self.__handshake_event = asyncio.Event()
+
+        self.__idle_timeout = idle_timeout
+
+        self.__last_received_time = time.monotonic()
+
+        self.__max_frame_bytes_count = max_frame_bytes_count
+
+        self.__max_in_memory_frame_bytes_count = max_in_memory_frame_bytes_count
+
+        self.__on_protocol_error_event = Event(
+            'OnProtocolErrorEvent',
+        )
+
+        self.__protocol_error_text: str | None = None
+
+        self.__protocol_version: int | None = None
+
+        self.__raw_data_batch_bytes_count = 0
+
+        self.__raw_data_batch_bytes_list: list[bytes] = []
+
+        self.__raw_data_batch_priority = _TEXT_PRIORITY
+
         self.__reader = reader
 
+        self.__received_raw_data_deque: deque[typing.Any] = deque()
+
+        self.__received_raw_data_queue: asyncio.Queue[typing.Any] | None = None
+
+        # Until the remote hello says otherwise, the remote peer is assumed to
+        # accept frames as large as the local one does
+
+        self.__remote_max_frame_bytes_count = max_frame_bytes_count
+
+        self.__rtt_estimator = RTTEstimator()
+
+        self.__rtt_histogram = LatencyHistogram()
+
+        self.__send_queue_bytes_count = 0
+
+        self.__send_queue_high_watermark_bytes_count = (
+            send_queue_high_watermark_bytes_count
+        )
+
+        self.__send_queue_low_watermark_bytes_count = (
+            send_queue_low_watermark_bytes_count
+        )
+
+        self.__send_queue_not_empty_event = asyncio.Event()
+
+        send_queue_writable_event = self.__send_queue_writable_event = (
+            asyncio.Event()
+        )
+
+        send_queue_writable_event.set()
+
+        self.__send_queues: tuple[deque[tuple[bytes | memoryview, ...]], ...] = tuple(
+            deque() for _ in range(_PRIORITIES_COUNT)
+        )
+
+        # Shapes the outbound traffic, possibly shared with other connections
+
+        self.__token_bucket = token_bucket
+
         self.__writer = writer
 
+        self.__writer_exception: BaseException | None = None
+
+        self.__writer_task: asyncio.Task | None = None
+
     def close(
         self,
     ) -> None:
+        if not self.__is_in_event_loop():
+            self.__event_loop.call_soon_threadsafe(
+                self.close,
+            )
+
+            return
+
+        writer_task = self.__writer_task
+
+        if writer_task is not None:
+            writer_task.cancel()
+
+            self.__writer_task = None
+
+        fragmented_frame = self.__fragmented_frame
+
+        if isinstance(
+            fragmented_frame,
+            tempfile.SpooledTemporaryFile,
+        ):
+            fragmented_frame.close()
+
+        self.__fragmented_frame = None
+
         self.__writer.close()
 
-    async def read_line(
-            self,
+        self.__closed_event.set()
 
-            timeout: float = _DEFAULT_TIMEOUT,
-    ) -> str | None:
-        line_bytes = await self.__read_line(
-            timeout
+    @staticmethod
+    def decode_raw_data(
+        raw_data_bytes: bytes | bytearray | memoryview,
+    ) -> typing.Any:
+        # orjson accepts any buffer directly, so the frame is never copied
+        # into an intermediate str
+
+        return orjson.loads(
+            raw_data_bytes,
         )
 
-        if line_bytes is None:
-            return None
+    @staticmethod
+    def encode_raw_data(
+        raw_data: dict,
+    ) -> bytes:
+        raw_data_bytes = orjson.dumps(
+            raw_data,
+        )
 
-        return line_bytes.decode()
+        return (
+            _FRAME_HEADER_STRUCT.pack(
+                len(raw_data_bytes),
+            )
+            + raw_data_bytes
+        )
 
-    async def read_raw_data(
+    def get_compression_codec_name(
         self,
-        timeout: float = _DEFAULT_TIMEOUT,
-    ) -> dict | None:
-        line_bytes_count_bytes = await self.__read_exactly(
-            bytes_count=4,
-            timeout=timeout,
-        )
+    ) -> str | None:
+        return self.__compression_codec_name
 
-        if line_bytes_count_bytes is None:
-            return None
+    def get_feature_names(
+        self,
+    ) -> frozenset[str]:
+        return self.__feature_names
 
-        line_bytes_count = struct.unpack(
-            '!I',
-            line_bytes_count_bytes,
-        )[0]
+    def get_idle_timeout(
+        self,
+    ) -> float:
+        if (
+            'adaptive_heartbeat' not in self.__feature_names
+            or not self.__rtt_estimator.get_samples_count()
+        ):
+            # The initial retransmission timeout is only a guess, which must
+            # not make a dead peer noticed later than with the fixed timeout
 
-        logger.debug(
-            'Reading bytes_count: %s',
-            line_bytes_count,
-        )
+            return self.__idle_timeout
+
+        # The remote peer stays silent for at most the idle heartbeat interval
+        # plus its probes; this only backs up the heartbeat, which notices a
+        # dead peer sooner. A slow link must not make it later than the fixed
+        # timeout either
 
-        line_bytes = await self.__read_exactly(
-            bytes_count=line_bytes_count,
-            timeout=timeout,
+        return min(
+            _IDLE_HEARTBEAT_INTERVAL
+            + (_HEARTBEAT_PROBES_COUNT + 1)
+            * self.__rtt_estimator.get_retransmission_timeout(),
+            self.__idle_timeout,
         )
 
-        if line_bytes is None:
-            return None
+    def get_last_received_time(
+        self,
+    ) -> float:
+        """Returns time.monotonic() of the last time any bytes arrived from the remote peer."""
+        return self.__last_received_time
+
+    def get_acknowledgement_timeout(
+        self,
+        bytes_count: int,
+    ) -> float:
+        """
+        Returns how long the acknowledgement of bytes sent, whether still queued or already written, may take.
 
-        line = line_bytes.rstrip().decode()
+        That is a retransmission timeout after the bytes have drained at the
+        measured throughput, so that a slow link does not look like a lossy one.
+        """
+        token_bucket = self.__token_bucket
 
-        raw_data = orjson.loads(
-            line,
+        drain_rate = max(
+            token_bucket.get_rate() if token_bucket is not None else 0.0,
+            _MIN_DRAIN_RATE_BYTES_PER_SECOND,
         )
 
-        logging_raw_data = self.__get_trimmed_data(
-            raw_data,
+        return (
+            self.__rtt_estimator.get_retransmission_timeout()
+            + bytes_count / drain_rate
         )
 
-        logger.debug('Received raw_data: %r', logging_raw_data)
+    def get_metrics(
+        self,
+    ) -> dict[str, typing.Any]:
+        compression_input_bytes_count = self.__compression_input_bytes_count
+        flushes_count = self.__flushes_count
+        flushed_frames_count = self.__flushed_frames_count
+        rtt_estimator = self.__rtt_estimator
+        rtt_histogram = self.__rtt_histogram
+        token_bucket = self.__token_bucket
 
-        return raw_data
+        return {
+            'compression_codec_name': self.__compression_codec_name,
+            'compression_cpu_time': self.__compression_cpu_time,
+            'compression_input_bytes_count': compression_input_bytes_count,
+            'compression_output_bytes_count': self.__compression_output_bytes_count,
+            'compression_ratio': (
+                self.__compression_output_bytes_count / compression_input_bytes_count
+                if compression_input_bytes_count
+                else 1.0
+            ),
+            'decompression_cpu_time': self.__decompression_cpu_time,
+            'feature_list': sorted(self.__feature_names),
+            'flushed_frames_count': flushed_frames_count,
+            'flushes_count': flushes_count,
+            'frames_per_flush': (
+                flushed_frames_count / flushes_count if flushes_count else 0.0
+            ),
+            'protocol_version': self.__protocol_version,
+            'remote_max_frame_bytes_count': self.__remote_max_frame_bytes_count,
+            'retransmission_timeout': rtt_estimator.get_retransmission_timeout(),
+            'rtt_p50': rtt_histogram.get_percentile(50),
+            'rtt_p95': rtt_histogram.get_percentile(95),
+            'rtt_p99': rtt_histogram.get_percentile(99),
+            'rtt_samples_count': rtt_histogram.get_samples_count(),
+            'rtt_variance': rtt_estimator.get_rtt_variance(),
+            'send_queue_bytes_count': self.__send_queue_bytes_count,
+            'send_queue_depth': self.get_send_queue_depth(),
+            'send_queue_depth_by_priority': [
+                len(send_queue) for send_queue in self.__send_queues
+            ],
+            'smoothed_rtt': rtt_estimator.get_smoothed_rtt(),
+            'token_bucket_queue_delay': (
+                token_bucket.get_queue_delay() if token_bucket is not None else 0.0
+            ),
+            'token_bucket_rate': (
+                token_bucket.get_rate() if token_bucket is not None else None
+            ),
+        }
 
-    def send_raw_data(
+    def is_attachment_chunks_supported(
         self,
-        raw_data: dict,
     ) -> bool:
-        """Synchronous fire-and-forget send (no drain). Prefer send_raw_data_async."""
-        raw_data_bytes = orjson.dumps(raw_data)
-        raw_data_bytes_count_bytes = struct.pack('!I', len(raw_data_bytes))
-        writer = self.__writer
-        writer.write(raw_data_bytes_count_bytes)
-        writer.write(raw_data_bytes)
-        logging_raw_data = self.__get_trimmed_data(raw_data)
-        logger.debug('Sent raw data: %r', logging_raw_data)
-        return True
+        return 'attachment_chunks' in self.__feature_names
 
-    async def send_raw_data_async(
+    def is_selective_acks_supported(
         self,
-        raw_data: dict,
     ) -> bool:
-        raw_data_bytes = orjson.dumps(raw_data)
-        raw_data_bytes_count_bytes = struct.pack('!I', len(raw_data_bytes))
-        writer = self.__writer
-        writer.write(raw_data_bytes_count_bytes)
-        writer.write(raw_data_bytes)
-        await writer.drain()
-        logging_raw_data = self.__get_trimmed_data(raw_data)
-        logger.debug('Sent raw data: %r', logging_raw_data)
-        return True
+        return 'selective_acks' in self.__feature_names
 
-    @classmethod
-    def __get_trimmed_data(
-        cls,
-        data: typing.Any,
-    ) -> typing.Any:
-        data_type = type(
-            data,
+    def get_send_queue_depth(
+        self,
+    ) -> int:
+        return sum(
+            map(
+                len,
+                self.__send_queues,
+            ),
         )
 
-        if data_type is str:
-            if len(data) > 64:
-                data = data[:64] + '...'
-        elif data_type is list:
-            return list(
-                map(
-                    cls.__get_trimmed_data,
-                    data,
-                ),
-            )
-        elif data_type is dict:
-            return {
-                key: (
-                    cls.__get_trimmed_data(
-                        value,
-                    )
-                )
-                for key, value in (data.items())
-            }
+    def get_on_protocol_error_event(
+        self,
+    ) -> Event:
+        return self.__on_protocol_error_event
 
-        return data
+    def get_protocol_error_text(
+        self,
+    ) -> str | None:
+        return self.__protocol_error_text
 
-    async def __read_exactly(
+    def get_rtt_estimator(
         self,
+    ) -> RTTEstimator:
+        return self.__rtt_estimator
 
-        bytes_count: int,
-        timeout: float,
-    ) -> bytes | None:
-        reader = self.__reader
+    def get_rtt_histogram(
+        self,
+    ) -> LatencyHistogram:
+        return self.__rtt_histogram
 
-        try:
-            data_bytes = await asyncio.wait_for(
-                reader.readexactly(
-                    bytes_count,
+    def get_protocol_version(
+        self,
+    ) -> int | None:
+        """Returns the negotiated protocol version, 0 for peers without a hello, or None while the handshake is pending."""
+        return self.__protocol_version
+
+    async def read_line(
+            self,
+
+            timeout: float | None = None,
+    ) -> str | None:
+        if not self.__is_in_event_loop():
+            return await self.__run_in_event_loop(
+                self.read_line(
+                    timeout,
                 ),
-                timeout=timeout,
-            )
-        except asyncio.exceptions.IncompleteReadError:
-            logger.warning(
-                'IncompleteReadError',
             )
 
-            return None
-        except asyncio.TimeoutError:
-            logger.warning(
-                'Timeout',
-            )
+        line_bytes = await self.__read_line(
+            timeout
+        )
 
+        if line_bytes is None:
             return None
 
-        assert (
-            len(
-                data_bytes,
-            )
-            == bytes_count
-        ), data_bytes
+        return line_bytes.decode()
 
-        return data_bytes
+    async def read_raw_data(
+        self,
+        timeout: float | None = None,
+    ) -> typing.Any:
+        """
+        Returns decoded JSON, an AttachmentChunkFrame for a binary frame, or None once the connection is closed.
 
-    async def __read_line(
-            self,
+        Called from another loop than the one of the connection, reads through
+        the receiving loop, which ignores the timeout.
+        """
+        if not self.__is_in_event_loop():
+            received_raw_data_queue = self.__received_raw_data_queue
 
-            timeout: float,
-    ) -> bytes | None:
-        reader = self.__reader
+            if received_raw_data_queue is None:
+                received_raw_data_queue = self.__received_raw_data_queue = (
+                    asyncio.Queue(
+                        maxsize=_MAX_READ_AHEAD_RAW_DATA_COUNT,
+                    )
+                )
 
-        try:
-            line_bytes = await asyncio.wait_for(
-                reader.readline(),
-                timeout=timeout,
-            )
-        except asyncio.exceptions.IncompleteReadError:
+                # The receiving loop stops once the connection is closed and
+                # the None has been handed over
+
+                run_coroutine_threadsafe_with_exceptions_logging(
+                    self.__start_receiving_loop(
+                        asyncio.get_running_loop(),
+                        received_raw_data_queue,
+                    ),
+                    self.__event_loop,
+                )
+
+            raw_data = await received_raw_data_queue.get()
+
+            if raw_data is None:
+                # Later calls see the closed connection as well; the None is
+                # the last item, so there is room for it
+
+                received_raw_data_queue.put_nowait(
+                    None,
+                )
+
+            return raw_data
+
+        event_loop = asyncio.get_running_loop()
+
+        received_raw_data_deque = self.__received_raw_data_deque
+
+        while True:
+            if received_raw_data_deque:
+                raw_data = received_raw_data_deque.popleft()
+            else:
+                frame_flags_and_frame_pair = await self.__read_frame(
+                    timeout,
+                )
+
+                if frame_flags_and_frame_pair is None:
+                    return None
+
+                frame_flags, frame = frame_flags_and_frame_pair
+
+                try:
+                    if frame_flags & _FRAGMENT_FRAME_FLAG:
+                        frame_flags_and_frame_pair = self.__on_fragment_frame(
+                            frame,
+                        )
+
+                        if frame_flags_and_frame_pair is None:
+                            continue
+
+                        frame_flags, frame = frame_flags_and_frame_pair
+
+                    if isinstance(
+                        frame,
+                        tempfile.SpooledTemporaryFile,
+                    ):
+                        # Spooled frames are large by definition
+
+                        with frame:
+                            raw_data = await event_loop.run_in_executor(
+                                None,
+                                self.__decode_spooled_frame,
+                                frame_flags,
+                                frame,
+                            )
+                    elif len(frame) > _MAX_INLINE_DECODING_FRAME_BYTES_COUNT:
+                        raw_data = await event_loop.run_in_executor(
+                            None,
+                            self.__decode_frame,
+                            frame_flags,
+                            frame,
+                        )
+                    else:
+                        raw_data = self.__decode_frame(
+                            frame_flags,
+                            frame,
+                        )
+
+                    if type(raw_data) is list and not all(
+                        type(raw_data_item) is dict for raw_data_item in raw_data
+                    ):
+                        raise _ProtocolError(
+                            'некорректный пакетный кадр',
+                        )
+                except _ProtocolError as exception:
+                    self.__on_protocol_error(
+                        str(exception),
+                    )
+
+                    return None
+
+                if type(raw_data) is list:
+                    # Batch frame: its items are handed out one by one
+
+                    received_raw_data_deque.extend(
+                        raw_data,
+                    )
+
+                    continue
+
+            if logger.isEnabledFor(
+                logging.DEBUG,
+            ):
+                logger.debug(
+                    'Received raw_data: %r',
+                    self.__get_trimmed_data(
+                        raw_data,
+                    ),
+                )
+
+            raw_data_type = (
+                raw_data.get('type')
+                if type(raw_data) is dict
+                else None
+            )
+
+            if raw_data_type == 'ping':
+                ping_timestamp_ms = raw_data.get(
+                    'timestamp_ms',
+                )
+
+                # Only pings of peers that measure RTT carry a timestamp, and
+                # it is echoed back as is, so the clocks need not agree
+
+                if ping_timestamp_ms is not None:
+                    self.__enqueue_raw_data(
+                        {
+                            'timestamp_ms': ping_timestamp_ms,
+                            'type': 'pong',
+                        },
+                    )
+            elif raw_data_type == 'pong':
+                self.__on_pong_raw_data(
+                    raw_data,
+                )
+
+                continue
+            elif raw_data_type == 'hello':
+                try:
+                    self.__on_hello_raw_data(
+                        raw_data,
+                    )
+                except _ProtocolError as exception:
+                    self.__on_protocol_error(
+                        str(exception),
+                    )
+
+                    return None
+
+                continue
+
+            return raw_data
+
+    def send_raw_data(
+        self,
+        raw_data: dict,
+    ) -> bool:
+        """Synchronous fire-and-forget send that ignores the high watermark. Prefer send_raw_data_async."""
+        if not self.__is_in_event_loop():
+            self.__event_loop.call_soon_threadsafe(
+                self.send_raw_data,
+                raw_data,
+            )
+
+            return True
+
+        self.__enqueue_raw_data(
+            raw_data,
+        )
+
+        self.__on_traffic_sent()
+
+        return True
+
+    async def send_raw_data_async(
+        self,
+        raw_data: dict,
+    ) -> bool:
+        """Returns once the frame is accepted into the send queue, not when it is written."""
+        if not self.__is_in_event_loop():
+            return await self.__run_in_event_loop(
+                self.send_raw_data_async(
+                    raw_data,
+                ),
+            )
+
+        send_queue_writable_event = self.__send_queue_writable_event
+
+        while not send_queue_writable_event.is_set():
+            self.__raise_if_writer_failed()
+
+            await send_queue_writable_event.wait()
+
+        self.__enqueue_raw_data(
+            raw_data,
+        )
+
+        self.__on_traffic_sent()
+
+        return True
+
+    async def send_attachment_chunk_async(
+        self,
+        attachment_id: str,
+        attachment_kind: str,
+        attachment_bytes: bytes,
+        offset: int,
+        chunk_bytes_count: int,
+    ) -> int:
+        """
+        Sends one chunk of the attachment as a binary frame; only valid when is_attachment_chunks_supported().
+
+        Returns the offset right after the chunk.
+        """
+        if not self.__is_in_event_loop():
+            return await self.__run_in_event_loop(
+                self.send_attachment_chunk_async(
+                    attachment_id,
+                    attachment_kind,
+                    attachment_bytes,
+                    offset,
+                    chunk_bytes_count,
+                ),
+            )
+
+        send_queue_writable_event = self.__send_queue_writable_event
+
+        while not send_queue_writable_event.is_set():
+            self.__raise_if_writer_failed()
+
+            await send_queue_writable_event.wait()
+
+        attachment_bytes_count = len(attachment_bytes)
+
+        next_offset = min(
+            offset + chunk_bytes_count,
+            offset
+            + self.__remote_max_frame_bytes_count
+            - _ATTACHMENT_CHUNK_HEADER_STRUCT.size,
+            attachment_bytes_count,
+        )
+
+        attachment_chunk_header_bytes = _ATTACHMENT_CHUNK_HEADER_STRUCT.pack(
+            _ATTACHMENT_CODE_BY_KIND_MAP[attachment_kind],
+            bytes.fromhex(
+                attachment_id,
+            ),
+            attachment_bytes_count,
+            offset,
+        )
+
+        # JSON frames queued before the chunk must not be overtaken by it
+
+        self.__flush_raw_data_batch()
+
+        self.__enqueue_frame(
+            _BULK_PRIORITY,
+            _BINARY_FRAME_FLAG,
+            attachment_chunk_header_bytes,
+            memoryview(
+                attachment_bytes,
+            )[offset:next_offset],
+        )
+
+        self.__on_traffic_sent()
+
+        logger.debug(
+            'Queued attachment %s chunk [%s, %s) of %s B',
+            attachment_id,
+            offset,
+            next_offset,
+            attachment_bytes_count,
+        )
+
+        return next_offset
+
+    async def start_heartbeat_loop(
+        self,
+    ) -> None:
+        """Pings the remote peer while it is silent; raises BrokenPipeError once it stops answering."""
+        if not self.__is_in_event_loop():
+            await self.__run_in_event_loop(
+                self.start_heartbeat_loop(),
+            )
+
+            return
+
+        await self.wait_for_handshake_async()
+
+        timer_service = g_common_globals.get_timer_service()
+
+        if 'adaptive_heartbeat' not in self.__feature_names:
+            while True:
+                self.__send_ping_raw_data()
+
+                await timer_service.sleep(
+                    _LEGACY_HEARTBEAT_INTERVAL,
+                )
+
+        # The pong yields the first RTT sample, without which the probes below
+        # would be spaced by the initial guess of the retransmission timeout
+
+        self.__send_ping_raw_data()
+
+        rtt_estimator = self.__rtt_estimator
+
+        idle_heartbeat_interval_factor = 1.0
+
+        last_received_time: float | None = None
+
+        last_probe_time = 0.0
+
+        probes_count = 0
+
+        while True:
+            if self.__last_received_time != last_received_time:
+                last_received_time = self.__last_received_time
+
+                idle_heartbeat_interval_factor = 1 - random.uniform(
+                    0.0,
+                    _IDLE_HEARTBEAT_INTERVAL_JITTER,
+                )
+
+                probes_count = 0
+
+            # A dead peer is noticed within the fixed idle timeout of peers that
+            # predate the adaptive heartbeat, however slow the link is or is
+            # guessed to be before a pong arrives: probes are spaced by at most
+            # a share of it, and the idle interval shrinks to leave room for them
+
+            retransmission_timeout = min(
+                rtt_estimator.get_retransmission_timeout(),
+                self.__idle_timeout / (_HEARTBEAT_PROBES_COUNT + 1),
+            )
+
+            idle_heartbeat_interval = idle_heartbeat_interval_factor * min(
+                _IDLE_HEARTBEAT_INTERVAL,
+                self.__idle_timeout - _HEARTBEAT_PROBES_COUNT * retransmission_timeout,
+            )
+
+            first_unanswered_sent_time = self.__first_unanswered_sent_time
+
+            # While traffic flows both ways nothing is sent; traffic that stays
+            # unanswered is probed after one retransmission timeout, an idle
+            # link only after the idle interval
+
+            if probes_count:
+                next_probe_time = last_probe_time + retransmission_timeout
+            elif first_unanswered_sent_time is not None:
+                next_probe_time = first_unanswered_sent_time + retransmission_timeout
+            else:
+                next_probe_time = last_received_time + idle_heartbeat_interval
+
+            current_time = time.monotonic()
+
+            if current_time < next_probe_time:
+                await timer_service.sleep_until(
+                    next_probe_time,
+                )
+
+                continue
+
+            if probes_count >= _HEARTBEAT_PROBES_COUNT:
+                logger.warning(
+                    'Remote peer has not answered %s heartbeat probes',
+                    probes_count,
+                )
+
+                self.close()
+
+                raise BrokenPipeError(
+                    'Remote peer has not answered heartbeat probes',
+                )
+
+            self.__send_ping_raw_data()
+
+            last_probe_time = current_time
+
+            probes_count += 1
+
+    async def send_hello_raw_data_async(
+        self,
+    ) -> None:
+        if not self.__is_in_event_loop():
+            await self.__run_in_event_loop(
+                self.send_hello_raw_data_async(),
+            )
+
+            return
+
+        # Peers that predate the handshake ignore frames of unknown type, and
+        # nothing is compressed or batched until the remote hello arrives
+
+        await self.send_raw_data_async(
+            {
+                'compression_list': list(_COMPRESSION_CODEC_NAMES),
+                'feature_list': list(_FEATURE_NAMES),
+                'max_frame_bytes_count': self.__max_frame_bytes_count,
+                'type': 'hello',
+                'version': _PROTOCOL_VERSION,
+            },
+        )
+
+    async def wait_for_handshake_async(
+        self,
+        timeout: float = _HANDSHAKE_TIMEOUT,
+    ) -> bool:
+        """
+        Waits for the remote hello, which is consumed by read_raw_data(), so somebody has to be reading meanwhile.
+
+        Returns False if the remote peer predates the handshake; the connection then keeps the legacy protocol.
+        """
+        if not self.__is_in_event_loop():
+            return await self.__run_in_event_loop(
+                self.wait_for_handshake_async(
+                    timeout,
+                ),
+            )
+
+        handshake_event = self.__handshake_event
+
+        try:
+            async with asyncio.timeout(
+                timeout,
+            ):
+                await handshake_event.wait()
+        except TimeoutError:
+            if self.__protocol_version is None:
+                logger.info(
+                    'Remote hello has not arrived in time, using protocol version 0',
+                )
+
+                self.__protocol_version = 0
+
+        return handshake_event.is_set()
+
+    def __compress(
+        self,
+        raw_data_bytes: bytes,
+    ) -> bytes | None:
+        compression_codec_name = self.__compression_codec_name
+
+        if (
+            compression_codec_name is None
+            or len(raw_data_bytes) < _COMPRESSION_THRESHOLD_BYTES_COUNT
+        ):
+            return None
+
+        start_cpu_time = time.thread_time()
+
+        if compression_codec_name == 'zstd':
+            compressed_raw_data_bytes = zstandard.ZstdCompressor(
+                level=_ZSTD_COMPRESSION_LEVEL,
+            ).compress(
+                raw_data_bytes,
+            )
+        else:
+            compressed_raw_data_bytes = zlib.compress(
+                raw_data_bytes,
+                _ZLIB_COMPRESSION_LEVEL,
+            )
+
+        self.__compression_cpu_time += time.thread_time() - start_cpu_time
+
+        self.__compression_input_bytes_count += len(raw_data_bytes)
+
+        if len(compressed_raw_data_bytes) >= len(raw_data_bytes):
+            self.__compression_output_bytes_count += len(raw_data_bytes)
+
+            return None
+
+        self.__compression_output_bytes_count += len(compressed_raw_data_bytes)
+
+        return compressed_raw_data_bytes
+
+    def __decode_frame(
+        self,
+        frame_flags: int,
+        frame_bytes: bytes | bytearray | memoryview,
+    ) -> typing.Any:
+        if frame_flags & _COMPRESSED_FRAME_FLAG:
+            frame_bytes = self.__decompress(
+                frame_bytes,
+            )
+
+        if frame_flags & _BINARY_FRAME_FLAG:
+            return self.__decode_attachment_chunk_raw_data(
+                frame_bytes,
+            )
+
+        try:
+            return self.decode_raw_data(
+                frame_bytes,
+            )
+        except orjson.JSONDecodeError as exception:
+            raise _ProtocolError(
+                'некорректный JSON',
+            ) from exception
+
+    @staticmethod
+    def __decode_attachment_chunk_raw_data(
+        frame_bytes: bytes | bytearray | memoryview,
+    ) -> AttachmentChunkFrame:
+        frame_view = memoryview(
+            frame_bytes,
+        )
+
+        if len(frame_view) < _ATTACHMENT_CHUNK_HEADER_STRUCT.size:
+            raise _ProtocolError(
+                'бинарный кадр короче заголовка',
+            )
+
+        (
+            attachment_code,
+            attachment_digest,
+            attachment_bytes_count,
+            offset,
+        ) = _ATTACHMENT_CHUNK_HEADER_STRUCT.unpack_from(
+            frame_view,
+        )
+
+        attachment_kind = _ATTACHMENT_KIND_BY_CODE_MAP.get(
+            attachment_code,
+        )
+
+        if attachment_kind is None:
+            raise _ProtocolError(
+                f'неизвестный тип вложения {attachment_code}',
+            )
+
+        chunk_view = frame_view[_ATTACHMENT_CHUNK_HEADER_STRUCT.size:]
+
+        if offset + len(chunk_view) > attachment_bytes_count:
+            raise _ProtocolError(
+                'фрагмент вложения выходит за его границы',
+            )
+
+        # Chunks are verified as a whole, against the attachment ID, once the
+        # last one has arrived
+
+        return AttachmentChunkFrame(
+            attachment_digest.hex(),
+            attachment_kind,
+            attachment_bytes_count,
+            offset,
+            chunk_view,
+        )
+
+    def __decode_spooled_frame(
+        self,
+        frame_flags: int,
+        frame_file: tempfile.SpooledTemporaryFile,
+    ) -> typing.Any:
+        # The frame is parsed straight from the page cache through a read-only
+        # mapping, so its bytes never have to live on the Python heap
+
+        frame_file.rollover()
+
+        # Bytes written since the rollover may still sit in the buffer of the
+        # file object, where the mapping would not see them
+
+        frame_file.flush()
+
+        with mmap.mmap(
+            frame_file.fileno(),
+            0,
+            access=mmap.ACCESS_READ,
+        ) as frame_mmap:
+            frame_view = memoryview(
+                frame_mmap,
+            )
+
+            try:
+                raw_data = self.__decode_frame(
+                    frame_flags,
+                    frame_view,
+                )
+
+                if frame_flags & _BINARY_FRAME_FLAG:
+                    # The mapping is closed on return, so attachment chunk
+                    # bytes have to be copied out of it
+
+                    raw_data.detach_data()
+
+                return raw_data
+            finally:
+                frame_view.release()
+
+    def __decompress(
+        self,
+        compressed_frame_bytes: bytes | bytearray | memoryview,
+    ) -> bytes:
+        compression_codec_name = self.__compression_codec_name
+
+        if compression_codec_name is None:
+            raise _ProtocolError(
+                'сжатый кадр без согласованного сжатия',
+            )
+
+        # Output is capped at the maximum frame size, so a small compressed
+        # frame cannot expand into an arbitrarily large one
+
+        max_frame_bytes_count = self.__max_frame_bytes_count
+
+        start_cpu_time = time.thread_time()
+
+        try:
+            if compression_codec_name == 'zstd':
+                frame_bytes_list: list[bytes] = []
+
+                frame_bytes_count = 0
+
+                with zstandard.ZstdDecompressor().stream_reader(
+                    compressed_frame_bytes,
+                ) as decompression_reader:
+                    while True:
+                        chunk_bytes = decompression_reader.read(
+                            _READ_CHUNK_BYTES_COUNT,
+                        )
+
+                        if not chunk_bytes:
+                            break
+
+                        frame_bytes_count += len(chunk_bytes)
+
+                        if frame_bytes_count > max_frame_bytes_count:
+                            raise _ProtocolError(
+                                'размер распакованного кадра превышает предел',
+                            )
+
+                        frame_bytes_list.append(
+                            chunk_bytes,
+                        )
+
+                frame_bytes = b''.join(
+                    frame_bytes_list,
+                )
+            else:
+                decompressor = zlib.decompressobj()
+
+                frame_bytes = decompressor.decompress(
+                    compressed_frame_bytes,
+                    max_frame_bytes_count + 1,
+                )
+
+                if (
+                    len(frame_bytes) > max_frame_bytes_count
+                    or decompressor.unconsumed_tail
+                ):
+                    raise _ProtocolError(
+                        'размер распакованного кадра превышает предел',
+                    )
+
+                if not decompressor.eof:
+                    raise _ProtocolError(
+                        'сжатый кадр обрезан',
+                    )
+        except _DECOMPRESSION_ERROR_TYPES as exception:
+            raise _ProtocolError(
+                'не удалось распаковать кадр',
+            ) from exception
+        finally:
+            self.__decompression_cpu_time += time.thread_time() - start_cpu_time
+
+        return frame_bytes
+
+    @classmethod
+    def __get_trimmed_data(
+        cls,
+        data: typing.Any,
+    ) -> typing.Any:
+        data_type = type(
+            data,
+        )
+
+        if data_type is str:
+            if len(data) > 64:
+                data = data[:64] + '...'
+        elif data_type is list:
+            return list(
+                map(
+                    cls.__get_trimmed_data,
+                    data,
+                ),
+            )
+        elif data_type is dict:
+            return {
+                key: (
+                    cls.__get_trimmed_data(
+                        value,
+                    )
+                )
+                for key, value in (data.items())
+            }
+
+        return data
+
+    def __enqueue_frame(
+        self,
+        priority: int,
+        frame_flags: int,
+        *frame_payload_bytes_tuple: bytes | memoryview,
+    ) -> None:
+        self.__raise_if_writer_failed()
+
+        frame_payload_bytes_count = sum(
+            map(
+                len,
+                frame_payload_bytes_tuple,
+            ),
+        )
+
+        if (
+            frame_payload_bytes_count > _MAX_UNFRAGMENTED_FRAME_BYTES_COUNT
+            and 'fragmentation' in self.__feature_names
+        ):
+            frame_bytes_count = self.__enqueue_fragment_frames(
+                frame_flags,
+                frame_payload_bytes_tuple,
+            )
+        else:
+            self.__send_queues[priority].append(
+                (
+                    _FRAME_HEADER_STRUCT.pack(
+                        frame_flags | frame_payload_bytes_count,
+                    ),
+                    *frame_payload_bytes_tuple,
+                ),
+            )
+
+            frame_bytes_count = _FRAME_HEADER_STRUCT.size + frame_payload_bytes_count
+
+        send_queue_bytes_count = self.__send_queue_bytes_count = (
+            self.__send_queue_bytes_count + frame_bytes_count
+        )
+
+        if send_queue_bytes_count >= self.__send_queue_high_watermark_bytes_count:
+            self.__send_queue_writable_event.clear()
+
+        self.__send_queue_not_empty_event.set()
+
+        self.__start_writing_loop_if_needed()
+
+    def __enqueue_fragment_frames(
+        self,
+        frame_flags: int,
+        frame_payload_bytes_tuple: tuple[bytes | memoryview, ...],
+    ) -> int:
+        """Returns the count of queued bytes."""
+        # Fragments of one frame are queued back to back on the bulk queue, so
+        # the remote peer reassembles a single frame at a time, while frames
+        # of higher priority still go out between them
+
+        if len(frame_payload_bytes_tuple) == 1:
+            frame_payload_bytes = frame_payload_bytes_tuple[0]
+        else:
+            frame_payload_bytes = b''.join(
+                frame_payload_bytes_tuple,
+            )
+
+        frame_payload_view = memoryview(
+            frame_payload_bytes,
+        )
+
+        frame_payload_bytes_count = len(frame_payload_view)
+
+        fragment_frame_flags = frame_flags >> _FRAGMENT_FRAME_FLAGS_SHIFT
+
+        bulk_send_queue = self.__send_queues[_BULK_PRIORITY]
+
+        fragment_frames_bytes_count = 0
+
+        for offset in range(
+            0,
+            frame_payload_bytes_count,
+            _FRAGMENT_BYTES_COUNT,
+        ):
+            fragment_view = frame_payload_view[offset:offset + _FRAGMENT_BYTES_COUNT]
+
+            bulk_send_queue.append(
+                (
+                    _FRAME_HEADER_STRUCT.pack(
+                        _FRAGMENT_FRAME_FLAG
+                        | (_FRAGMENT_HEADER_STRUCT.size + len(fragment_view)),
+                    ),
+                    _FRAGMENT_HEADER_STRUCT.pack(
+                        fragment_frame_flags
+                        | (
+                            _LAST_FRAGMENT_FLAG
+                            if offset + len(fragment_view) >= frame_payload_bytes_count
+                            else 0
+                        ),
+                    ),
+                    fragment_view,
+                ),
+            )
+
+            fragment_frames_bytes_count += (
+                _FRAME_HEADER_STRUCT.size
+                + _FRAGMENT_HEADER_STRUCT.size
+                + len(fragment_view)
+            )
+
+        return fragment_frames_bytes_count
+
+    def __enqueue_raw_data(
+        self,
+        raw_data: dict,
+    ) -> None:
+        raw_data_bytes = orjson.dumps(
+            raw_data,
+        )
+
+        priority = (
+            _CONTROL_PRIORITY
+            if raw_data.get('type') in _CONTROL_RAW_DATA_TYPES
+            else _TEXT_PRIORITY
+        )
+
+        if len(raw_data_bytes) > _MAX_RAW_DATA_BATCH_BYTES_COUNT:
+            # Large frames go out on their own, and fragmented if possible
+
+            self.__flush_raw_data_batch()
+
+            self.__enqueue_raw_data_bytes(
+                raw_data_bytes,
+                _BULK_PRIORITY
+                if 'fragmentation' in self.__feature_names
+                else priority,
+            )
+        elif 'batching' in self.__feature_names:
+            self.__raise_if_writer_failed()
+
+            # Raw data queued within one writer tick goes out as a single
+            # JSON array frame, which saves headers and compresses better
+
+            self.__raw_data_batch_bytes_list.append(
+                raw_data_bytes,
+            )
+
+            self.__raw_data_batch_bytes_count += len(raw_data_bytes)
+
+            # The batch goes out with the priority of its most urgent item
+
+            self.__raw_data_batch_priority = min(
+                self.__raw_data_batch_priority,
+                priority,
+            )
+
+            send_queue_bytes_count = self.__send_queue_bytes_count = (
+                self.__send_queue_bytes_count + len(raw_data_bytes)
+            )
+
+            if send_queue_bytes_count >= self.__send_queue_high_watermark_bytes_count:
+                self.__send_queue_writable_event.clear()
+
+            if self.__raw_data_batch_bytes_count >= min(
+                _MAX_RAW_DATA_BATCH_BYTES_COUNT,
+                self.__remote_max_frame_bytes_count // 2,
+            ):
+                self.__flush_raw_data_batch()
+            else:
+                self.__send_queue_not_empty_event.set()
+
+                self.__start_writing_loop_if_needed()
+        else:
+            self.__enqueue_raw_data_bytes(
+                raw_data_bytes,
+                priority,
+            )
+
+        if logger.isEnabledFor(
+            logging.DEBUG,
+        ):
+            logger.debug(
+                'Queued raw data: %r',
+                self.__get_trimmed_data(
+                    raw_data,
+                ),
+            )
+
+    def __enqueue_raw_data_bytes(
+        self,
+        raw_data_bytes: bytes,
+        priority: int,
+    ) -> None:
+        frame_flags = 0
+
+        compressed_raw_data_bytes = self.__compress(
+            raw_data_bytes,
+        )
+
+        if compressed_raw_data_bytes is not None:
+            raw_data_bytes = compressed_raw_data_bytes
+
+            frame_flags |= _COMPRESSED_FRAME_FLAG
+
+        self.__enqueue_frame(
+            priority,
+            frame_flags,
+            raw_data_bytes,
+        )
+
+    def __flush_raw_data_batch(
+        self,
+    ) -> None:
+        raw_data_batch_bytes_list = self.__raw_data_batch_bytes_list
+
+        if not raw_data_batch_bytes_list:
+            return
+
+        self.__raw_data_batch_bytes_list = []
+
+        # The batched bytes are accounted again, as a frame, by
+        # __enqueue_frame()
+
+        self.__send_queue_bytes_count -= self.__raw_data_batch_bytes_count
+
+        self.__raw_data_batch_bytes_count = 0
+
+        raw_data_batch_priority = self.__raw_data_batch_priority
+
+        self.__raw_data_batch_priority = _TEXT_PRIORITY
+
+        if len(raw_data_batch_bytes_list) == 1:
+            raw_data_bytes = raw_data_batch_bytes_list[0]
+        else:
+            raw_data_bytes = b''.join(
+                (
+                    b'[',
+                    b','.join(
+                        raw_data_batch_bytes_list,
+                    ),
+                    b']',
+                ),
+            )
+
+        self.__enqueue_raw_data_bytes(
+            raw_data_bytes,
+            raw_data_batch_priority,
+        )
+
+    @staticmethod
+    def __get_monotonic_timestamp_ms() -> int:
+        return time.monotonic_ns() // 1_000_000
+
+    def __is_in_event_loop(
+        self,
+    ) -> bool:
+        event_loop = self.__event_loop
+
+        if event_loop is None:
+            return True
+
+        try:
+            return asyncio.get_running_loop() is event_loop
+        except RuntimeError:  # no running loop
+            return False
+
+    def __on_traffic_received(
+        self,
+    ) -> None:
+        self.__first_unanswered_sent_time = None
+
+        self.__last_received_time = time.monotonic()
+
+    def __on_traffic_sent(
+        self,
+    ) -> None:
+        if self.__first_unanswered_sent_time is None:
+            self.__first_unanswered_sent_time = time.monotonic()
+
+    def __send_ping_raw_data(
+        self,
+    ) -> None:
+        # Heartbeat frames bypass __on_traffic_sent(), as they must not make
+        # the remote silence look like unanswered traffic
+
+        self.__enqueue_raw_data(
+            {
+                'timestamp_ms': self.__get_monotonic_timestamp_ms(),
+                'type': 'ping',
+            },
+        )
+
+    def __raise_if_writer_failed(
+        self,
+    ) -> None:
+        writer_exception = self.__writer_exception
+
+        if writer_exception is not None:
+            raise BrokenPipeError(
+                'Connection writer has failed',
+            ) from writer_exception
+
+    def __start_writing_loop_if_needed(
+        self,
+    ) -> None:
+        if self.__writer_task is None:
+            self.__writer_task = asyncio.create_task(
+                self.__start_writing_loop(),
+            )
+
+    async def __run_in_event_loop(
+        self,
+        coroutine: typing.Coroutine[typing.Any, typing.Any, typing.Any],
+    ) -> typing.Any:
+        # Exceptions are delivered to the awaiting caller, which handles them
+        # (e.g. BrokenPipeError of the heartbeat), so they are not logged here
+
+        return await asyncio.wrap_future(
+            asyncio.run_coroutine_threadsafe(
+                coroutine,
+                self.__event_loop,
+            ),
+        )
+
+    async def __start_receiving_loop(
+        self,
+        consumer_event_loop: asyncio.AbstractEventLoop,
+        received_raw_data_queue: asyncio.Queue[typing.Any],
+    ) -> None:
+        # Reads ahead of a consumer on another loop, so that pings are answered
+        # and the idle deadline is kept however busy that loop is, though only
+        # up to the size of the queue, which bounds the memory held for it
+
+        closed_event = self.__closed_event
+
+        closed_event_waiting_task = asyncio.create_task(
+            closed_event.wait(),
+        )
+
+        try:
+            while True:
+                raw_data = await self.read_raw_data()
+
+                queue_putting_future = asyncio.run_coroutine_threadsafe(
+                    received_raw_data_queue.put(
+                        raw_data,
+                    ),
+                    consumer_event_loop,
+                )
+
+                # A consumer that is gone leaves the queue full; the put is
+                # then given up on once the connection is closed, rather than
+                # blocking the receiving loop forever
+
+                await asyncio.wait(
+                    (
+                        asyncio.wrap_future(
+                            queue_putting_future,
+                        ),
+                        closed_event_waiting_task,
+                    ),
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+
+                if not queue_putting_future.done():
+                    queue_putting_future.cancel()
+
+                    break
+
+                if raw_data is None:
+                    break
+        finally:
+            closed_event_waiting_task.cancel()
+
+    async def __start_writing_loop(
+        self,
+    ) -> None:
+        send_queues = self.__send_queues
+        send_queue_not_empty_event = self.__send_queue_not_empty_event
+        send_queue_writable_event = self.__send_queue_writable_event
+        token_bucket = self.__token_bucket
+        writer = self.__writer
+
+        try:
+            while True:
+                await send_queue_not_empty_event.wait()
+
+                self.__flush_raw_data_batch()
+
+                # Frames queued since the previous flush go out with a single
+                # writelines() call and a single drain(), up to a bounded batch
+
+                frame_bytes_list: list[bytes | memoryview] = []
+
+                frames_count = 0
+
+                flush_bytes_count = 0
+
+                for priority, send_queue in enumerate(
+                    send_queues,
+                ):
+                    max_flush_bytes_count = (
+                        _MAX_BULK_FLUSH_BYTES_COUNT
+                        if priority == _BULK_PRIORITY
+                        else _FLUSH_BYTES_COUNT
+                    )
+
+                    while send_queue and flush_bytes_count < max_flush_bytes_count:
+                        frame_bytes_tuple = send_queue.popleft()
+
+                        frame_bytes_list.extend(
+                            frame_bytes_tuple,
+                        )
+
+                        frames_count += 1
+
+                        flush_bytes_count += sum(
+                            map(
+                                len,
+                                frame_bytes_tuple,
+                            ),
+                        )
+
+                if not any(
+                    send_queues,
+                ):
+                    send_queue_not_empty_event.clear()
+
+                if token_bucket is not None:
+                    # The flushed bytes stay accounted in the send queue while
+                    # the bucket is in debt, so that senders keep being
+                    # suspended at the high watermark
+
+                    await token_bucket.consume(
+                        flush_bytes_count,
+                    )
+
+                send_queue_bytes_count = self.__send_queue_bytes_count = (
+                    self.__send_queue_bytes_count - flush_bytes_count
+                )
+
+                if send_queue_bytes_count < self.__send_queue_low_watermark_bytes_count:
+                    send_queue_writable_event.set()
+
+                self.__flushes_count += 1
+                self.__flushed_frames_count += frames_count
+
+                writer.writelines(
+                    frame_bytes_list,
+                )
+
+                await writer.drain()
+        except asyncio.CancelledError:
+            raise
+        except Exception as exception:
+            logger.warning(
+                'Connection writer has failed: %r',
+                exception,
+            )
+
+            self.__writer_exception = exception
+
+            # Wake up suspended senders so that they see the failure
+
+            send_queue_writable_event.set()
+
+    async def __read_frame(
+        self,
+
+        timeout: float | None,
+    ) -> tuple[int, bytes | bytearray | tempfile.SpooledTemporaryFile] | None:
+        if timeout is None:
+            timeout = self.get_idle_timeout()
+
+        event_loop = asyncio.get_running_loop()
+
+        reader = self.__reader
+
+        frame_file: tempfile.SpooledTemporaryFile | None = None
+
+        try:
+            # One deadline for the whole frame instead of a wait_for() task
+            # per read; it is pushed forward every time the peer makes progress
+
+            async with asyncio.timeout(
+                timeout,
+            ) as idle_timeout:
+                frame_header_bytes = await reader.readexactly(
+                    _FRAME_HEADER_STRUCT.size,
+                )
+
+                self.__on_traffic_received()
+
+                frame_header: int = _FRAME_HEADER_STRUCT.unpack(
+                    frame_header_bytes,
+                )[0]
+
+                frame_flags = frame_header & _FRAME_FLAGS_MASK
+
+                bytes_count = frame_header & ~_FRAME_FLAGS_MASK
+
+                logger.debug(
+                    'Reading bytes_count: %s',
+                    bytes_count,
+                )
+
+                max_frame_bytes_count = self.__max_frame_bytes_count
+
+                if bytes_count > max_frame_bytes_count:
+                    self.__on_protocol_error(
+                        f'размер кадра {bytes_count} Б'
+                        f' превышает предел {max_frame_bytes_count} Б',
+                    )
+
+                    return None
+
+                idle_timeout.reschedule(
+                    event_loop.time() + timeout,
+                )
+
+                if bytes_count <= _READ_CHUNK_BYTES_COUNT:
+                    return (
+                        frame_flags,
+                        await reader.readexactly(
+                            bytes_count,
+                        ),
+                    )
+
+                frame_bytes_view: memoryview | None
+
+                if bytes_count <= self.__max_in_memory_frame_bytes_count:
+                    frame_bytes = bytearray(
+                        bytes_count,
+                    )
+
+                    frame_bytes_view = memoryview(
+                        frame_bytes,
+                    )
+                else:
+                    frame_bytes = None
+                    frame_bytes_view = None
+
+                    frame_file = tempfile.SpooledTemporaryFile(
+                        max_size=self.__max_in_memory_frame_bytes_count,
+                    )
+
+                offset = 0
+
+                while offset < bytes_count:
+                    chunk_bytes = await reader.read(
+                        min(
+                            bytes_count - offset,
+                            _READ_CHUNK_BYTES_COUNT,
+                        ),
+                    )
+
+                    if not chunk_bytes:
+                        raise asyncio.IncompleteReadError(
+                            partial=b'',
+                            expected=bytes_count,
+                        )
+
+                    next_offset = offset + len(chunk_bytes)
+
+                    if frame_bytes_view is not None:
+                        frame_bytes_view[offset:next_offset] = chunk_bytes
+                    else:
+                        frame_file.write(
+                            chunk_bytes,
+                        )
+
+                    offset = next_offset
+
+                    self.__on_traffic_received()
+
+                    idle_timeout.reschedule(
+                        event_loop.time() + timeout,
+                    )
+
+                if frame_bytes_view is not None:
+                    frame_bytes_view.release()
+
+                    return (
+                        frame_flags,
+                        frame_bytes,
+                    )
+
+                result_frame_file = frame_file
+
+                frame_file = None
+
+                return (
+                    frame_flags,
+                    result_frame_file,
+                )
+        except asyncio.IncompleteReadError:
+            logger.warning(
+                'IncompleteReadError',
+            )
+
+            return None
+        except TimeoutError:
+            logger.warning(
+                'Timeout',
+            )
+
+            return None
+        finally:
+            if frame_file is not None:
+                frame_file.close()
+
+    def __on_hello_raw_data(
+        self,
+        hello_raw_data: dict,
+    ) -> None:
+        remote_protocol_version = hello_raw_data.get(
+            'version',
+            1,
+        )
+
+        if type(remote_protocol_version) is not int or remote_protocol_version < 1:
+            raise _ProtocolError(
+                f'некорректная версия протокола {remote_protocol_version!r}',
+            )
+
+        remote_compression_codec_names = hello_raw_data.get(
+            'compression_list',
+        )
+
+        if type(remote_compression_codec_names) is not list:
+            logger.warning(
+                'Hello raw data has incorrect compression list field type: %r',
+                remote_compression_codec_names,
+            )
+
+            remote_compression_codec_names = []
+
+        remote_feature_names = hello_raw_data.get(
+            'feature_list',
+        )
+
+        if type(remote_feature_names) is not list:
+            logger.warning(
+                'Hello raw data has incorrect feature list field type: %r',
+                remote_feature_names,
+            )
+
+            remote_feature_names = []
+
+        remote_max_frame_bytes_count = hello_raw_data.get(
+            'max_frame_bytes_count',
+            self.__max_frame_bytes_count,
+        )
+
+        if type(remote_max_frame_bytes_count) is not int:
+            raise _ProtocolError(
+                'некорректный предел размера кадра',
+            )
+
+        if remote_max_frame_bytes_count < _MIN_REMOTE_MAX_FRAME_BYTES_COUNT:
+            raise _ProtocolError(
+                f'предел размера кадра {remote_max_frame_bytes_count} Б'
+                f' меньше допустимого {_MIN_REMOTE_MAX_FRAME_BYTES_COUNT} Б',
+            )
+
+        # Each side keeps its own version and features, and the remote peer
+        # picks the same common subset from the local hello
+
+        protocol_version = self.__protocol_version = min(
+            _PROTOCOL_VERSION,
+            remote_protocol_version,
+        )
+
+        feature_names = self.__feature_names = frozenset(
+            _FEATURE_NAMES,
+        ).intersection(
+            remote_feature_name
+            for remote_feature_name in remote_feature_names
+            if type(remote_feature_name) is str
+        )
+
+        self.__remote_max_frame_bytes_count = remote_max_frame_bytes_count
+
+        compression_codec_name = self.__compression_codec_name = next(
+            (
+                compression_codec_name
+                for compression_codec_name in _COMPRESSION_CODEC_NAMES
+                if compression_codec_name in remote_compression_codec_names
+            ),
+            None,
+        )
+
+        self.__handshake_event.set()
+
+        logger.info(
+            'Negotiated protocol version %s, compression codec %r, features: %s,'
+            ' max frame size: %s B',
+            protocol_version,
+            compression_codec_name,
+            sorted(feature_names),
+            self.__remote_max_frame_bytes_count,
+        )
+
+    def __on_fragment_frame(
+        self,
+        fragment_frame_bytes: bytes | bytearray,
+    ) -> tuple[int, bytearray | tempfile.SpooledTemporaryFile] | None:
+        """Collects the fragment; returns the flags and payload of the whole frame once its last fragment has arrived."""
+        if isinstance(
+            fragment_frame_bytes,
+            tempfile.SpooledTemporaryFile,
+        ) or not fragment_frame_bytes:
+            raise _ProtocolError(
+                'некорректный фрагмент кадра',
+            )
+
+        (fragment_header,) = _FRAGMENT_HEADER_STRUCT.unpack_from(
+            fragment_frame_bytes,
+        )
+
+        frame_flags = (
+            fragment_header & ~_LAST_FRAGMENT_FLAG
+        ) << _FRAGMENT_FRAME_FLAGS_SHIFT
+
+        if frame_flags & ~(_COMPRESSED_FRAME_FLAG | _BINARY_FRAME_FLAG):
+            raise _ProtocolError(
+                f'некорректный заголовок фрагмента {fragment_header}',
+            )
+
+        fragment_view = memoryview(
+            fragment_frame_bytes,
+        )[_FRAGMENT_HEADER_STRUCT.size:]
+
+        fragmented_frame = self.__fragmented_frame
+
+        if fragmented_frame is None:
+            fragmented_frame = self.__fragmented_frame = bytearray()
+
+            self.__fragmented_frame_flags = frame_flags
+        elif frame_flags != self.__fragmented_frame_flags:
+            raise _ProtocolError(
+                'флаги фрагментов кадра не совпадают',
+            )
+
+        if isinstance(
+            fragmented_frame,
+            bytearray,
+        ):
+            fragmented_frame_bytes_count = len(fragmented_frame) + len(fragment_view)
+        else:
+            fragmented_frame_bytes_count = fragmented_frame.tell() + len(fragment_view)
+
+        max_frame_bytes_count = self.__max_frame_bytes_count
+
+        if fragmented_frame_bytes_count > max_frame_bytes_count:
+            raise _ProtocolError(
+                f'размер собранного кадра превышает предел {max_frame_bytes_count} Б',
+            )
+
+        if (
+            isinstance(
+                fragmented_frame,
+                bytearray,
+            )
+            and fragmented_frame_bytes_count > self.__max_in_memory_frame_bytes_count
+        ):
+            # Large frames are spooled to a temporary file, as when read whole
+
+            fragmented_frame_file = tempfile.SpooledTemporaryFile(
+                max_size=self.__max_in_memory_frame_bytes_count,
+            )
+
+            fragmented_frame_file.write(
+                fragmented_frame,
+            )
+
+            fragmented_frame = self.__fragmented_frame = fragmented_frame_file
+
+        if isinstance(
+            fragmented_frame,
+            bytearray,
+        ):
+            fragmented_frame.extend(
+                fragment_view,
+            )
+        else:
+            fragmented_frame.write(
+                fragment_view,
+            )
+
+        if not fragment_header & _LAST_FRAGMENT_FLAG:
+            return None
+
+        self.__fragmented_frame = None
+
+        return (
+            frame_flags,
+            fragmented_frame,
+        )
+
+    def __on_pong_raw_data(
+        self,
+        pong_raw_data: dict,
+    ) -> None:
+        ping_timestamp_ms = pong_raw_data.get(
+            'timestamp_ms',
+        )
+
+        current_timestamp_ms = self.__get_monotonic_timestamp_ms()
+
+        if (
+            type(ping_timestamp_ms) is not int
+            or not 0 <= ping_timestamp_ms <= current_timestamp_ms
+        ):
+            logger.warning(
+                'Pong raw data has incorrect timestamp: %r',
+                ping_timestamp_ms,
+            )
+
+            return
+
+        rtt = (current_timestamp_ms - ping_timestamp_ms) / 1000  # s
+
+        self.__rtt_estimator.add_sample(
+            rtt,
+        )
+
+        self.__rtt_histogram.add_sample(
+            rtt,
+        )
+
+    def __on_protocol_error(
+        self,
+        protocol_error_text: str,
+    ) -> None:
+        logger.warning(
+            'Protocol error: %s',
+            protocol_error_text,
+        )
+
+        self.__protocol_error_text = protocol_error_text
+
+        self.__on_protocol_error_event(
+            text=protocol_error_text,
+        )
+
+        self.close()
+
+    async def __read_line(
+            self,
+
+            timeout: float | None,
+    ) -> bytes | None:
+        if timeout is None:
+            timeout = self.__idle_timeout
+
+        reader = self.__reader
+
+        try:
+            async with asyncio.timeout(
+                timeout,
+            ):
+                line_bytes = await reader.readline()
+        except asyncio.IncompleteReadError:
             logger.warning(
                 'IncompleteReadError',
             )
 
             return None
-        except asyncio.TimeoutError:
+        except TimeoutError:
             logger.warning(
                 'Timeout',
             )
@@ -0,0 +1,104 @@
+import asyncio
+import logging
+
+from common import (
+    Constants,
+)
+
+from globals.common import (
+    g_common_globals,
+)
+
+from utils.async_ import (
+    log_exceptions,
+)
+
+
+logger = logging.getLogger(
+    __name__,
+)
+
+
+class Debouncer(object):
+    """
+    Runs the last of a burst of scheduled coroutine functions, once the burst has settled.
+
+    Scheduling again, while the previous run is still waiting or already
+    running, cancels it: work started for a value that has been changed
+    since, such as a SAM handshake for a half-typed address, is abandoned.
+    A run must therefore not schedule on its own debouncer.
+    """
+
+    __slots__ = (
+        '__delay',
+        '__name',
+        '__task',
+    )
+
+    def __init__(
+        self,
+        name: str,
+        delay: float,
+    ) -> None:
+        super(Debouncer, self).__init__()
+
+        self.__delay = delay
+
+        self.__name = name
+
+        self.__task: asyncio.Task | None = None
+
+    def cancel(
+        self,
+    ) -> None:
+        task = self.__task
+
+        if task is None:
+            return
+
+        self.__task = None
+
+        if not task.done():
+            logger.debug(
+                'Cancelling %s',
+                self.__name,
+            )
+
+            task.cancel()
+
+    def is_pending(
+        self,
+    ) -> bool:
+        """Returns whether a run is waiting or running."""
+        task = self.__task
+
+        return task is not None and not task.done()
+
+    def schedule(
+        self,
+        coroutine_function: Constants.AsyncFunctionType,
+    ) -> None:
+        self.cancel()
+
+        # Runs are often cancelled before they even start, so the task must
+        # not wrap the coroutine into another one, which would then never be
+        # awaited
+
+        self.__task = asyncio.create_task(
+            self.__run(
+                coroutine_function,
+            ),
+            name=self.__name,
+        )
+
+    async def __run(
+        self,
+        coroutine_function: Constants.AsyncFunctionType,
+    ) -> None:
+        await g_common_globals.get_timer_service().sleep(
+            self.__delay,
+        )
+
+        await log_exceptions(
+            coroutine_function(),
+        )
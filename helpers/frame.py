@@ -0,0 +1,530 @@
+import typing
+
+from helpers.attachment_store import (
+    AttachmentStore,
+)
+
+
+class FrameError(Exception):
+    pass
+
+
+def _decode_bool(
+    value: typing.Any,
+) -> bool:
+    if type(value) is not bool:
+        raise FrameError(
+            f'expected bool, got {type(value).__name__}',
+        )
+
+    return value
+
+
+def _decode_int(
+    value: typing.Any,
+) -> int:
+    if type(value) is not int:
+        raise FrameError(
+            f'expected int, got {type(value).__name__}',
+        )
+
+    return value
+
+
+def _decode_message_id(
+    value: typing.Any,
+) -> int:
+    if type(value) is not int or value < 0:
+        raise FrameError(
+            f'incorrect message ID: {value!r}',
+        )
+
+    return value
+
+
+def _decode_attachment_id(
+    value: typing.Any,
+) -> str:
+    if type(value) is not str or not AttachmentStore.is_attachment_id_valid(
+        value,
+    ):
+        raise FrameError(
+            f'incorrect attachment ID: {value!r}',
+        )
+
+    return value
+
+
+def _decode_attachment_id_list(
+    value: typing.Any,
+) -> list[str] | None:
+    if type(value) is not list:
+        raise FrameError(
+            f'expected attachment ID list, got {type(value).__name__}',
+        )
+
+    for attachment_id in value:
+        _decode_attachment_id(
+            attachment_id,
+        )
+
+    return value or None
+
+
+def _decode_image_base64_encoded_text_list(
+    value: typing.Any,
+) -> list[str] | None:
+    if type(value) is not list:
+        raise FrameError(
+            f'expected image base64 encoded text list, got {type(value).__name__}',
+        )
+
+    for image_base64_encoded_text in value:
+        if type(image_base64_encoded_text) is not str or not (
+            image_base64_encoded_text
+        ):
+            raise FrameError(
+                'incorrect image base64 encoded text'
+                f': {image_base64_encoded_text!r:.64}',
+            )
+
+    return value or None
+
+
+def _decode_message_id_range_list(
+    value: typing.Any,
+) -> list[list[int]]:
+    if type(value) is not list or not all(
+        type(message_id_range) is list
+        and len(message_id_range) == 2
+        and type(message_id_range[0]) is int
+        and type(message_id_range[1]) is int
+        for message_id_range in value
+    ):
+        raise FrameError(
+            f'incorrect message ID range list: {value!r:.256}',
+        )
+
+    return value
+
+
+def _decode_text(
+    value: typing.Any,
+) -> str | None:
+    if type(value) is not str:
+        raise FrameError(
+            f'expected text, got {type(value).__name__}',
+        )
+
+    return value or None
+
+
+class Frame(object):
+    """
+    Typed frame decoded from raw data.
+
+    Each subclass declares its schema once: the frame type and, for every raw
+    data field, the keyword argument it is passed as and the function that
+    checks and converts its value. Fields missing from the raw data are passed
+    as None, and fields unknown to the schema are ignored.
+    """
+
+    __slots__ = ()
+
+    _TYPE: typing.ClassVar[str]
+
+    _FIELD_SCHEMA_BY_NAME_MAP: typing.ClassVar[
+        dict[str, tuple[str, typing.Callable[[typing.Any], typing.Any]]]
+    ]
+
+    _REQUIRED_FIELD_NAMES: typing.ClassVar[frozenset[str]] = frozenset()
+
+    def _validate(
+        self,
+    ) -> None:
+        """Checks constraints spanning several fields."""
+        pass
+
+
+class AckFrame(Frame):
+    __slots__ = (
+        '__message_id',
+    )
+
+    _TYPE = 'ack'
+
+    _FIELD_SCHEMA_BY_NAME_MAP = {
+        'message_id': ('message_id', _decode_message_id),
+    }
+
+    _REQUIRED_FIELD_NAMES = frozenset(
+        _FIELD_SCHEMA_BY_NAME_MAP,
+    )
+
+    def __init__(
+        self,
+        message_id: int,
+    ) -> None:
+        super(AckFrame, self).__init__()
+
+        self.__message_id = message_id
+
+    def get_message_id(
+        self,
+    ) -> int:
+        return self.__message_id
+
+
+class AttachmentAckFrame(Frame):
+    __slots__ = (
+        '__attachment_id',
+        '__is_rejected',
+        '__offset',
+    )
+
+    _TYPE = 'attachment_ack'
+
+    _FIELD_SCHEMA_BY_NAME_MAP = {
+        'attachment_id': ('attachment_id', _decode_attachment_id),
+        # Set when the remote node will never accept the attachment, e.g. as
+        # it is too large; older peers leave it out
+        'is_rejected': ('is_rejected', _decode_bool),
+        'offset': ('offset', _decode_int),
+    }
+
+    _REQUIRED_FIELD_NAMES = frozenset(
+        (
+            'attachment_id',
+            'offset',
+        ),
+    )
+
+    def __init__(
+        self,
+        attachment_id: str,
+        offset: int,
+        is_rejected: bool | None = None,
+    ) -> None:
+        super(AttachmentAckFrame, self).__init__()
+
+        self.__attachment_id = attachment_id
+
+        self.__is_rejected = bool(is_rejected)
+
+        self.__offset = offset
+
+    def get_attachment_id(
+        self,
+    ) -> str:
+        return self.__attachment_id
+
+    def get_offset(
+        self,
+    ) -> int:
+        return self.__offset
+
+    def is_rejected(
+        self,
+    ) -> bool:
+        return self.__is_rejected
+
+
+class AttachmentChunkFrame(Frame):
+    """
+    Chunk of an attachment, decoded from a binary frame by the connection itself.
+
+    It has no JSON schema: JSON frames claiming to be attachment chunks are
+    rejected by decode_frame(), so a chunk always comes from a binary frame,
+    whose header the connection has already checked.
+    """
+
+    __slots__ = (
+        '__attachment_bytes_count',
+        '__attachment_id',
+        '__attachment_kind',
+        '__data',
+        '__offset',
+    )
+
+    _TYPE = 'attachment_chunk'
+
+    _FIELD_SCHEMA_BY_NAME_MAP = {}
+
+    def __init__(
+        self,
+        attachment_id: str,
+        attachment_kind: str,
+        attachment_bytes_count: int,
+        offset: int,
+        data: bytes | memoryview,
+    ) -> None:
+        super(AttachmentChunkFrame, self).__init__()
+
+        self.__attachment_bytes_count = attachment_bytes_count
+
+        self.__attachment_id = attachment_id
+
+        self.__attachment_kind = attachment_kind
+
+        self.__data = data
+
+        self.__offset = offset
+
+    def detach_data(
+        self,
+    ) -> None:
+        """Copies the data out of the buffer it views, before that buffer is released."""
+        self.__data = bytes(
+            self.__data,
+        )
+
+    def get_attachment_bytes_count(
+        self,
+    ) -> int:
+        return self.__attachment_bytes_count
+
+    def get_attachment_id(
+        self,
+    ) -> str:
+        return self.__attachment_id
+
+    def get_attachment_kind(
+        self,
+    ) -> str:
+        return self.__attachment_kind
+
+    def get_data(
+        self,
+    ) -> bytes | memoryview:
+        return self.__data
+
+    def get_offset(
+        self,
+    ) -> int:
+        return self.__offset
+
+    def __repr__(
+        self,
+    ) -> str:
+        return (
+            f'AttachmentChunkFrame({self.__attachment_id!r}'
+            f', offset={self.__offset}, size={len(self.__data)})'
+        )
+
+
+class MessageFrame(Frame):
+    __slots__ = (
+        '__attachment_id_list',
+        '__image_base64_encoded_text_list',
+        '__message_id',
+        '__text',
+    )
+
+    _TYPE = 'message'
+
+    _FIELD_SCHEMA_BY_NAME_MAP = {
+        'attachment_id_list': ('attachment_id_list', _decode_attachment_id_list),
+        'id': ('message_id', _decode_message_id),
+        'image_base64_encoded_text_list': (
+            'image_base64_encoded_text_list',
+            _decode_image_base64_encoded_text_list,
+        ),
+        'text': ('text', _decode_text),
+    }
+
+    _REQUIRED_FIELD_NAMES = frozenset(
+        ('id',),
+    )
+
+    def __init__(
+        self,
+        message_id: int,
+        attachment_id_list: list[str] | None = None,
+        image_base64_encoded_text_list: list[str] | None = None,
+        text: str | None = None,
+    ) -> None:
+        super(MessageFrame, self).__init__()
+
+        self.__attachment_id_list = attachment_id_list
+
+        # Inline images of peers predating attachment chunks
+
+        self.__image_base64_encoded_text_list = image_base64_encoded_text_list
+
+        self.__message_id = message_id
+
+        self.__text = text
+
+    def get_attachment_id_list(
+        self,
+    ) -> list[str] | None:
+        return self.__attachment_id_list
+
+    def get_image_base64_encoded_text_list(
+        self,
+    ) -> list[str] | None:
+        return self.__image_base64_encoded_text_list
+
+    def get_message_id(
+        self,
+    ) -> int:
+        return self.__message_id
+
+    def get_text(
+        self,
+    ) -> str | None:
+        return self.__text
+
+    def _validate(
+        self,
+    ) -> None:
+        if (
+            self.__text is None
+            and self.__attachment_id_list is None
+            and self.__image_base64_encoded_text_list is None
+        ):
+            raise FrameError(
+                'message has no content',
+            )
+
+
+class PingFrame(Frame):
+    __slots__ = (
+        '__timestamp_ms',
+    )
+
+    _TYPE = 'ping'
+
+    _FIELD_SCHEMA_BY_NAME_MAP = {
+        # Only pings of peers that measure RTT carry it
+        'timestamp_ms': ('timestamp_ms', _decode_int),
+    }
+
+    def __init__(
+        self,
+        timestamp_ms: int | None = None,
+    ) -> None:
+        super(PingFrame, self).__init__()
+
+        self.__timestamp_ms = timestamp_ms
+
+    def get_timestamp_ms(
+        self,
+    ) -> int | None:
+        return self.__timestamp_ms
+
+
+class SelectiveAckFrame(Frame):
+    __slots__ = (
+        '__cumulative_message_id',
+        '__message_id_range_list',
+    )
+
+    _TYPE = 'selective_ack'
+
+    _FIELD_SCHEMA_BY_NAME_MAP = {
+        # -1 when not even the first message was received
+        'cumulative_message_id': ('cumulative_message_id', _decode_int),
+        'range_list': ('message_id_range_list', _decode_message_id_range_list),
+    }
+
+    _REQUIRED_FIELD_NAMES = frozenset(
+        _FIELD_SCHEMA_BY_NAME_MAP,
+    )
+
+    def __init__(
+        self,
+        cumulative_message_id: int,
+        message_id_range_list: list[list[int]],
+    ) -> None:
+        super(SelectiveAckFrame, self).__init__()
+
+        self.__cumulative_message_id = cumulative_message_id
+
+        self.__message_id_range_list = message_id_range_list
+
+    def get_cumulative_message_id(
+        self,
+    ) -> int:
+        return self.__cumulative_message_id
+
+    def get_message_id_range_list(
+        self,
+    ) -> list[list[int]]:
+        return self.__message_id_range_list
+
+
+# Attachment chunks are left out, as they only ever come as binary frames
+_FRAME_CLASS_BY_TYPE_MAP: dict[str, type[Frame]] = {
+    frame_class._TYPE: frame_class  # noqa
+    for frame_class in (
+        AckFrame,
+        AttachmentAckFrame,
+        MessageFrame,
+        PingFrame,
+        SelectiveAckFrame,
+    )
+}
+
+
+def decode_frame(
+    raw_data: typing.Any,
+) -> Frame:
+    """Checks and converts the raw data in a single pass over its fields; raises FrameError if they are incorrect."""
+    if type(raw_data) is not dict:
+        raise FrameError(
+            f'expected object, got {type(raw_data).__name__}',
+        )
+
+    frame_type = raw_data.get(
+        'type',
+    )
+
+    frame_class = _FRAME_CLASS_BY_TYPE_MAP.get(
+        frame_type,
+    )
+
+    if frame_class is None:
+        raise FrameError(
+            f'unknown frame type: {frame_type!r:.64}',
+        )
+
+    field_schema_by_name_map = frame_class._FIELD_SCHEMA_BY_NAME_MAP  # noqa
+
+    argument_by_name_map: dict[str, typing.Any] = {}
+
+    for field_name, field_value in raw_data.items():
+        field_schema = field_schema_by_name_map.get(
+            field_name,
+        )
+
+        if field_schema is None:
+            continue
+
+        argument_name, field_decoder = field_schema
+
+        try:
+            argument_by_name_map[argument_name] = field_decoder(
+                field_value,
+            )
+        except FrameError as exception:
+            raise FrameError(
+                f'{frame_type} frame field {field_name!r}: {exception}',
+            ) from None
+
+    missing_field_names = frame_class._REQUIRED_FIELD_NAMES.difference(  # noqa
+        raw_data,
+    )
+
+    if missing_field_names:
+        raise FrameError(
+            f'{frame_type} frame misses fields: {sorted(missing_field_names)}',
+        )
+
+    frame = frame_class(
+        **argument_by_name_map,
+    )
+
+    frame._validate()  # noqa
+
+    return frame
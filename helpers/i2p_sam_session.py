@@ -1,4 +1,6 @@
+import asyncio
 import logging
+import typing
 import uuid
 
 from ipaddress import (
@@ -12,6 +14,10 @@ from event.async_ import (
     AsyncEvent,
 )
 
+from globals.common import (
+    g_common_globals,
+)
+
 from helpers.connection import (
     Connection,
 )
@@ -24,6 +30,7 @@ logger = logging.getLogger(
 
 class I2PSAMSession(object):
     __slots__ = (
+        '__event_loop',
         '__incoming_data_connection',
         '__incoming_data_connection_status_color',
         '__incoming_data_connection_status_text',
@@ -40,6 +47,11 @@ class I2PSAMSession(object):
     ) -> None:
         super().__init__()
 
+        # Loop of the status update handlers; data connections may run on the
+        # networking loop, whose thread must not call them directly
+
+        self.__event_loop: asyncio.AbstractEventLoop | None = None
+
         self.__incoming_data_connection: (
             Connection | None
         ) = None
@@ -104,6 +116,8 @@ class I2PSAMSession(object):
             ip_address: IPv4Address | IPv6Address | None,
             port: int | None,
     ) -> bool:
+        self.__event_loop = asyncio.get_running_loop()
+
         if ip_address is None:
             self.update_incoming_data_connection_status(
                 new_incoming_data_connection_status_color='red',
@@ -129,9 +143,11 @@ class I2PSAMSession(object):
             (
                 incoming_data_reader,
                 incoming_data_writer,
-            ) = await i2plib.stream_accept(
-                session_name=self.__name,
-                sam_address=ip_address_and_port_pair,
+            ) = await self.__run_in_networking_loop(
+                i2plib.stream_accept(
+                    session_name=self.__name,
+                    sam_address=ip_address_and_port_pair,
+                ),
             )
         except i2plib.exceptions.InvalidId:
             self.update_incoming_data_connection_status(
@@ -149,9 +165,21 @@ class I2PSAMSession(object):
 
             return False
 
-        self.__incoming_data_connection = Connection(
+        incoming_data_connection = self.__incoming_data_connection = Connection(
             incoming_data_reader,
             incoming_data_writer,
+            token_bucket=(
+                g_common_globals.get_outbound_token_bucket()
+            ),
+            event_loop=self.__get_networking_event_loop(),
+        )
+
+        incoming_data_connection_on_protocol_error_event = (
+            incoming_data_connection.get_on_protocol_error_event()
+        )
+
+        incoming_data_connection_on_protocol_error_event += (
+            self.__on_incoming_data_connection_protocol_error
         )
 
         self.update_incoming_data_connection_status(
@@ -168,6 +196,8 @@ class I2PSAMSession(object):
             port: int | None,
             remote_node_address_raw: str | None,
     ) -> bool:
+        self.__event_loop = asyncio.get_running_loop()
+
         if ip_address is None:
             self.update_outgoing_data_connection_status(
                 new_outgoing_data_connection_status_color='red',
@@ -218,10 +248,12 @@ class I2PSAMSession(object):
             (
                 outgoing_data_reader,
                 outgoing_data_writer,
-            ) = await i2plib.stream_connect(
-                destination=remote_node_address_raw,
-                session_name=self.__name,
-                sam_address=local_i2p_node_sam_ip_address_and_port_pair,
+            ) = await self.__run_in_networking_loop(
+                i2plib.stream_connect(
+                    destination=remote_node_address_raw,
+                    session_name=self.__name,
+                    sam_address=local_i2p_node_sam_ip_address_and_port_pair,
+                ),
             )
         except i2plib.exceptions.CantReachPeer:
             self.update_outgoing_data_connection_status(
@@ -251,9 +283,21 @@ class I2PSAMSession(object):
 
             return False
 
-        self.__outgoing_data_connection = Connection(
+        outgoing_data_connection = self.__outgoing_data_connection = Connection(
             outgoing_data_reader,
             outgoing_data_writer,
+            token_bucket=(
+                g_common_globals.get_outbound_token_bucket()
+            ),
+            event_loop=self.__get_networking_event_loop(),
+        )
+
+        outgoing_data_connection_on_protocol_error_event = (
+            outgoing_data_connection.get_on_protocol_error_event()
+        )
+
+        outgoing_data_connection_on_protocol_error_event += (
+            self.__on_outgoing_data_connection_protocol_error
         )
 
         self.update_outgoing_data_connection_status(
@@ -376,6 +420,69 @@ class I2PSAMSession(object):
             text=new_outgoing_data_connection_status_text
         )
 
+    def __on_incoming_data_connection_protocol_error(
+        self,
+        text: str,
+    ) -> None:
+        self.__call_in_event_loop(
+            self.update_incoming_data_connection_status,
+            'red',
+            f'Ошибка протокола: {text}',
+        )
+
+    def __on_outgoing_data_connection_protocol_error(
+        self,
+        text: str,
+    ) -> None:
+        self.__call_in_event_loop(
+            self.update_outgoing_data_connection_status,
+            'red',
+            f'Ошибка протокола: {text}',
+        )
+
+    def __call_in_event_loop(
+        self,
+        callback: typing.Callable[..., None],
+        *args: typing.Any,
+    ) -> None:
+        event_loop = self.__event_loop
+
+        if event_loop is None or event_loop is asyncio.get_running_loop():
+            callback(
+                *args,
+            )
+
+            return
+
+        event_loop.call_soon_threadsafe(
+            callback,
+            *args,
+        )
+
+    @staticmethod
+    def __get_networking_event_loop() -> asyncio.AbstractEventLoop | None:
+        networking_loop = g_common_globals.get_networking_loop()
+
+        if networking_loop is None:
+            return None
+
+        return networking_loop.get_event_loop()
+
+    async def __run_in_networking_loop(
+        self,
+        coroutine: typing.Coroutine[typing.Any, typing.Any, typing.Any],
+    ) -> typing.Any:
+        # The data streams are opened on the loop that is going to run them
+
+        networking_loop = g_common_globals.get_networking_loop()
+
+        if networking_loop is None:
+            return await coroutine
+
+        return await networking_loop.run_async(
+            coroutine,
+        )
+
     @staticmethod
     def __generate_name() -> str:
         return uuid.uuid4().hex
@@ -0,0 +1,89 @@
+import math
+
+
+# Bucket bounds grow geometrically from the minimal latency, so percentiles
+# keep the same relative precision (about 9 %) from milliseconds to minutes
+_MIN_LATENCY = 0.001  # s
+
+_BUCKETS_PER_DOUBLING_COUNT = 8
+
+_DOUBLINGS_COUNT = 18  # up to ~262 s
+
+_BUCKETS_COUNT = _BUCKETS_PER_DOUBLING_COUNT * _DOUBLINGS_COUNT
+
+
+class LatencyHistogram(object):
+    """Fixed-size histogram of latency samples, answering percentile queries."""
+
+    __slots__ = (
+        '__bucket_samples_counts',
+        '__samples_count',
+    )
+
+    def __init__(
+        self,
+    ) -> None:
+        super(LatencyHistogram, self).__init__()
+
+        self.__bucket_samples_counts = [0] * _BUCKETS_COUNT
+
+        self.__samples_count = 0
+
+    def add_sample(
+        self,
+        latency: float,
+    ) -> None:
+        if latency <= _MIN_LATENCY:
+            bucket_index = 0
+        else:
+            bucket_index = min(
+                math.ceil(
+                    math.log2(
+                        latency / _MIN_LATENCY,
+                    )
+                    * _BUCKETS_PER_DOUBLING_COUNT,
+                ),
+                _BUCKETS_COUNT - 1,
+            )
+
+        self.__bucket_samples_counts[bucket_index] += 1
+
+        self.__samples_count += 1
+
+    def get_percentile(
+        self,
+        percentile: float,
+    ) -> float | None:
+        """Returns the upper bound of the bucket holding the percentile (0-100), or None without samples."""
+        samples_count = self.__samples_count
+
+        if not samples_count:
+            return None
+
+        rank = max(
+            math.ceil(
+                samples_count * percentile / 100,
+            ),
+            1,
+        )
+
+        cumulative_samples_count = 0
+
+        for bucket_index, bucket_samples_count in enumerate(
+            self.__bucket_samples_counts,
+        ):
+            cumulative_samples_count += bucket_samples_count
+
+            if cumulative_samples_count >= rank:
+                return _MIN_LATENCY * 2 ** (
+                    bucket_index / _BUCKETS_PER_DOUBLING_COUNT
+                )
+
+        return _MIN_LATENCY * 2 ** (
+            (_BUCKETS_COUNT - 1) / _BUCKETS_PER_DOUBLING_COUNT
+        )
+
+    def get_samples_count(
+        self,
+    ) -> int:
+        return self.__samples_count
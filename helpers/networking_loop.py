@@ -0,0 +1,126 @@
+import asyncio
+import logging
+import threading
+import typing
+
+
+T = typing.TypeVar('T')
+
+logger = logging.getLogger(
+    __name__,
+)
+
+
+class NetworkingLoop(object):
+    """
+    Asyncio event loop running in a background thread.
+
+    Connections whose I/O runs here keep answering pings and reading frames
+    while the GUI loop is busy repainting, and bursts of network traffic do
+    not delay the repaints. Other loops hand coroutines over with run_async().
+    """
+
+    __slots__ = (
+        '__event_loop',
+        '__thread',
+    )
+
+    def __init__(
+        self,
+        event_loop_factory: typing.Callable[[], asyncio.AbstractEventLoop] = (
+            asyncio.new_event_loop
+        ),
+    ) -> None:
+        super(NetworkingLoop, self).__init__()
+
+        self.__event_loop = event_loop_factory()
+
+        self.__thread = threading.Thread(
+            daemon=True,
+            name='NetworkingLoopThread',
+            target=self.__run,
+        )
+
+    def get_event_loop(
+        self,
+    ) -> asyncio.AbstractEventLoop:
+        return self.__event_loop
+
+    async def run_async(
+        self,
+        coroutine: typing.Coroutine[typing.Any, typing.Any, T],
+    ) -> T:
+        """Runs the coroutine on this loop and awaits its result on the calling one; cancellation is propagated."""
+        event_loop = self.__event_loop
+
+        if asyncio.get_running_loop() is event_loop:
+            return await coroutine
+
+        # Exceptions are delivered to the awaiting caller, which handles them,
+        # so they are not logged here
+
+        return await asyncio.wrap_future(
+            asyncio.run_coroutine_threadsafe(
+                coroutine,
+                event_loop,
+            ),
+        )
+
+    def start(
+        self,
+    ) -> None:
+        self.__thread.start()
+
+    def stop(
+        self,
+    ) -> None:
+        """Cancels the tasks left on the loop and waits for the thread to finish."""
+        thread = self.__thread
+
+        if not thread.is_alive():
+            return
+
+        event_loop = self.__event_loop
+
+        event_loop.call_soon_threadsafe(
+            event_loop.stop,
+        )
+
+        thread.join()
+
+    def __run(
+        self,
+    ) -> None:
+        event_loop = self.__event_loop
+
+        asyncio.set_event_loop(
+            event_loop,
+        )
+
+        logger.info(
+            'Networking loop %r has started',
+            type(event_loop).__name__,
+        )
+
+        try:
+            event_loop.run_forever()
+        finally:
+            tasks = asyncio.all_tasks(
+                event_loop,
+            )
+
+            for task in tasks:
+                task.cancel()
+
+            event_loop.run_until_complete(
+                asyncio.gather(
+                    *tasks,
+                    return_exceptions=True,
+                ),
+            )
+
+            event_loop.close()
+
+            logger.info(
+                'Networking loop has stopped',
+            )
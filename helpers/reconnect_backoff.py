@@ -0,0 +1,118 @@
+import asyncio
+import logging
+import random
+
+from globals.common import (
+    g_common_globals,
+)
+
+
+logger = logging.getLogger(
+    __name__,
+)
+
+
+_DEFAULT_MIN_DELAY = 1.0  # s
+
+_DEFAULT_MAX_DELAY = 30.0  # s
+
+# Delays stop doubling past this many failures, so that the power stays
+# convertible to float however long the remote peer is unreachable; the
+# maximum delay is reached long before anyway
+_MAX_BACKOFF_EXPONENT = 16
+
+
+class ReconnectBackoff(object):
+    """
+    Delays between reconnection attempts, doubling with every failure up to a cap.
+
+    Each delay is picked at random between its half and its whole, so that
+    both peers and all loops retrying against the same SAM bridge do not
+    fall into step. A wake() cuts the current delay short and starts over
+    from the shortest one, for events which make a retry likely to succeed,
+    such as an edited address or a restored SAM session.
+    """
+
+    __slots__ = (
+        '__failures_count',
+        '__max_delay',
+        '__min_delay',
+        '__name',
+        '__wake_event',
+    )
+
+    def __init__(
+        self,
+        name: str,
+        min_delay: float = _DEFAULT_MIN_DELAY,
+        max_delay: float = _DEFAULT_MAX_DELAY,
+    ) -> None:
+        super(ReconnectBackoff, self).__init__()
+
+        self.__failures_count = 0
+
+        self.__max_delay = max_delay
+
+        self.__min_delay = min_delay
+
+        self.__name = name
+
+        self.__wake_event = asyncio.Event()
+
+    def get_failures_count(
+        self,
+    ) -> int:
+        return self.__failures_count
+
+    def reset(
+        self,
+    ) -> None:
+        """Starts over from the shortest delay, once a connection has been made."""
+        self.__failures_count = 0
+
+    async def wait(
+        self,
+    ) -> bool:
+        """Waits out the delay of the next attempt; returns True if it was cut short by wake()."""
+        delay = min(
+            self.__min_delay
+            * 2
+            ** min(
+                self.__failures_count,
+                _MAX_BACKOFF_EXPONENT,
+            ),
+            self.__max_delay,
+        )
+
+        delay = random.uniform(
+            delay / 2.0,
+            delay,
+        )
+
+        self.__failures_count += 1
+
+        logger.debug(
+            'Retrying %s in %.1f s, attempt %d',
+            self.__name,
+            delay,
+            self.__failures_count,
+        )
+
+        wake_event = self.__wake_event
+
+        is_woken = await g_common_globals.get_timer_service().wait_for_event(
+            wake_event,
+            delay,
+        )
+
+        wake_event.clear()
+
+        return is_woken
+
+    def wake(
+        self,
+    ) -> None:
+        """Ends the current delay, or skips the next one if no attempt is waiting."""
+        self.__failures_count = 0
+
+        self.__wake_event.set()
@@ -0,0 +1,179 @@
+import typing
+
+
+# Backoff stops doubling past this many attempts; the maximum timeout is
+# reached long before anyway
+_MAX_BACKOFF_EXPONENT = 16
+
+
+class RetransmissionScheduler(object):
+    """
+    Decides which pending messages are due to be sent.
+
+    Unsent messages are due at once while fewer than the in-flight limit are
+    awaiting an acknowledgement. Sent ones are due again once their
+    retransmission timeout expires, and the timeout doubles with every attempt.
+    """
+
+    __slots__ = (
+        '__max_in_flight_messages_count',
+        '__sent_time_and_attempts_count_pair_by_id_map',
+    )
+
+    def __init__(
+        self,
+        max_in_flight_messages_count: int,
+    ) -> None:
+        super(RetransmissionScheduler, self).__init__()
+
+        self.__max_in_flight_messages_count = max_in_flight_messages_count
+
+        self.__sent_time_and_attempts_count_pair_by_id_map: (
+            dict[int, tuple[float, int]]
+        ) = {}
+
+    def clear(
+        self,
+    ) -> None:
+        """Forgets all attempts, e.g. when messages start going over another connection."""
+        self.__sent_time_and_attempts_count_pair_by_id_map.clear()
+
+    def get_due_message_ids(
+        self,
+        pending_message_ids: typing.Iterable[int],
+        retransmission_timeout: float,
+        max_retransmission_timeout: float,
+        current_time: float,
+    ) -> list[int]:
+        sent_time_and_attempts_count_pair_by_id_map = (
+            self.__sent_time_and_attempts_count_pair_by_id_map
+        )
+
+        in_flight_messages_count = len(
+            sent_time_and_attempts_count_pair_by_id_map,
+        )
+
+        due_message_ids: list[int] = []
+
+        for message_id in pending_message_ids:
+            sent_time_and_attempts_count_pair = (
+                sent_time_and_attempts_count_pair_by_id_map.get(
+                    message_id,
+                )
+            )
+
+            if sent_time_and_attempts_count_pair is None:
+                if in_flight_messages_count >= self.__max_in_flight_messages_count:
+                    continue
+
+                in_flight_messages_count += 1
+            elif current_time < self.__get_due_time(
+                sent_time_and_attempts_count_pair,
+                retransmission_timeout,
+                max_retransmission_timeout,
+            ):
+                continue
+
+            due_message_ids.append(
+                message_id,
+            )
+
+        return due_message_ids
+
+    def get_in_flight_messages_count(
+        self,
+    ) -> int:
+        return len(
+            self.__sent_time_and_attempts_count_pair_by_id_map,
+        )
+
+    def get_next_due_time(
+        self,
+        retransmission_timeout: float,
+        max_retransmission_timeout: float,
+    ) -> float | None:
+        return min(
+            (
+                self.__get_due_time(
+                    sent_time_and_attempts_count_pair,
+                    retransmission_timeout,
+                    max_retransmission_timeout,
+                )
+                for sent_time_and_attempts_count_pair in (
+                    self.__sent_time_and_attempts_count_pair_by_id_map.values()
+                )
+            ),
+            default=None,
+        )
+
+    def on_acked(
+        self,
+        message_id: int,
+        current_time: float,
+    ) -> float | None:
+        """
+        Forgets the message.
+
+        Returns its round-trip time, unless it was sent more than once: then the
+        acknowledgement may belong to any of the attempts (Karn's algorithm).
+        """
+        sent_time_and_attempts_count_pair = (
+            self.__sent_time_and_attempts_count_pair_by_id_map.pop(
+                message_id,
+                None,
+            )
+        )
+
+        if sent_time_and_attempts_count_pair is None:
+            return None
+
+        sent_time, attempts_count = sent_time_and_attempts_count_pair
+
+        if attempts_count != 1:
+            return None
+
+        return current_time - sent_time
+
+    def on_sent(
+        self,
+        message_id: int,
+        current_time: float,
+    ) -> None:
+        sent_time_and_attempts_count_pair_by_id_map = (
+            self.__sent_time_and_attempts_count_pair_by_id_map
+        )
+
+        sent_time_and_attempts_count_pair = (
+            sent_time_and_attempts_count_pair_by_id_map.get(
+                message_id,
+            )
+        )
+
+        attempts_count = (
+            sent_time_and_attempts_count_pair[1]
+            if sent_time_and_attempts_count_pair is not None
+            else 0
+        )
+
+        sent_time_and_attempts_count_pair_by_id_map[message_id] = (
+            current_time,
+            attempts_count + 1,
+        )
+
+    @staticmethod
+    def __get_due_time(
+        sent_time_and_attempts_count_pair: tuple[float, int],
+        retransmission_timeout: float,
+        max_retransmission_timeout: float,
+    ) -> float:
+        sent_time, attempts_count = sent_time_and_attempts_count_pair
+
+        return sent_time + min(
+            retransmission_timeout
+            * 2
+            ** min(
+                attempts_count - 1,
+                _MAX_BACKOFF_EXPONENT,
+            ),
+            max_retransmission_timeout,
+        )
@@ -0,0 +1,99 @@
+_RTT_SMOOTHING_FACTOR = 1 / 8
+
+_RTT_VARIANCE_SMOOTHING_FACTOR = 1 / 4
+
+_RTT_VARIANCE_MULTIPLIER = 4
+
+# I2P tunnels routinely take seconds per round trip, so the timeout used
+# before the first sample is far above the 1 s of RFC 6298
+_INITIAL_RETRANSMISSION_TIMEOUT = 5.0  # s
+
+_MIN_RETRANSMISSION_TIMEOUT = 1.0  # s
+
+_MAX_RETRANSMISSION_TIMEOUT = 60.0  # s
+
+
+class RTTEstimator(object):
+    """
+    Smoothed round-trip time and its variance, with the retransmission timeout derived from them as in RFC 6298.
+    """
+
+    __slots__ = (
+        '__retransmission_timeout',
+        '__rtt_variance',
+        '__samples_count',
+        '__smoothed_rtt',
+    )
+
+    def __init__(
+        self,
+    ) -> None:
+        super(RTTEstimator, self).__init__()
+
+        self.__retransmission_timeout = _INITIAL_RETRANSMISSION_TIMEOUT
+
+        self.__rtt_variance: float | None = None
+
+        self.__samples_count = 0
+
+        self.__smoothed_rtt: float | None = None
+
+    def add_sample(
+        self,
+        rtt: float,
+    ) -> None:
+        smoothed_rtt = self.__smoothed_rtt
+
+        if smoothed_rtt is None:
+            smoothed_rtt = rtt
+
+            rtt_variance = rtt / 2
+        else:
+            rtt_variance = (
+                1 - _RTT_VARIANCE_SMOOTHING_FACTOR
+            ) * self.__rtt_variance + _RTT_VARIANCE_SMOOTHING_FACTOR * abs(
+                smoothed_rtt - rtt,
+            )
+
+            smoothed_rtt = (
+                1 - _RTT_SMOOTHING_FACTOR
+            ) * smoothed_rtt + _RTT_SMOOTHING_FACTOR * rtt
+
+        self.__rtt_variance = rtt_variance
+
+        self.__samples_count += 1
+
+        self.__smoothed_rtt = smoothed_rtt
+
+        self.__retransmission_timeout = min(
+            max(
+                smoothed_rtt + _RTT_VARIANCE_MULTIPLIER * rtt_variance,
+                _MIN_RETRANSMISSION_TIMEOUT,
+            ),
+            _MAX_RETRANSMISSION_TIMEOUT,
+        )
+
+    def get_max_retransmission_timeout(
+        self,
+    ) -> float:
+        return _MAX_RETRANSMISSION_TIMEOUT
+
+    def get_retransmission_timeout(
+        self,
+    ) -> float:
+        return self.__retransmission_timeout
+
+    def get_rtt_variance(
+        self,
+    ) -> float | None:
+        return self.__rtt_variance
+
+    def get_samples_count(
+        self,
+    ) -> int:
+        return self.__samples_count
+
+    def get_smoothed_rtt(
+        self,
+    ) -> float | None:
+        return self.__smoothed_rtt
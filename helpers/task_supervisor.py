@@ -0,0 +1,164 @@
+import asyncio
+import logging
+import traceback
+import typing
+
+from common import (
+    Constants,
+)
+
+from globals.common import (
+    g_common_globals,
+)
+
+
+logger = logging.getLogger(
+    __name__,
+)
+
+
+# Restarts of a failing task are delayed by this much, doubling every time
+_MIN_RESTART_DELAY = 1.0  # s
+
+_MAX_RESTART_DELAY = 30.0  # s
+
+
+class RestartPolicy(object):
+    # Any exception of the task stops its group
+    Never = 'never'
+
+    # Unexpected exceptions restart the task after a delay, until it has
+    # failed too many times; a return ends it without affecting the group
+    OnFailure = 'on_failure'
+
+
+class TaskSupervisor(object):
+    """
+    Runs groups of tasks with asyncio.TaskGroup, so that no task outlives its group.
+
+    A group ends once all of its tasks have ended, or as soon as one of them
+    fails for good: the rest are cancelled then. BrokenPipeError, which means
+    the connection served by the group is gone, always stops the group and is
+    not logged; other failures are logged and handled by the restart policy.
+    """
+
+    __slots__ = (
+        '__max_restarts_count',
+        '__restarts_count',
+        '__running_tasks_count',
+    )
+
+    def __init__(
+        self,
+        max_restarts_count: int = 5,
+    ) -> None:
+        super(TaskSupervisor, self).__init__()
+
+        self.__max_restarts_count = max_restarts_count
+
+        self.__restarts_count = 0
+
+        self.__running_tasks_count = 0
+
+    def get_restarts_count(
+        self,
+    ) -> int:
+        return self.__restarts_count
+
+    def get_running_tasks_count(
+        self,
+    ) -> int:
+        """Returns the count of tasks running in all groups, which drops back once they end."""
+        return self.__running_tasks_count
+
+    async def run_group(
+        self,
+        group_name: str,
+        task_name_and_coroutine_function_and_restart_policy_triples: typing.Iterable[
+            tuple[str, Constants.AsyncFunctionType, str]
+        ],
+    ) -> None:
+        """Returns once the group has ended, whatever the reason; only cancellation is raised."""
+        try:
+            async with asyncio.TaskGroup() as task_group:
+                for (
+                    task_name,
+                    coroutine_function,
+                    restart_policy,
+                ) in task_name_and_coroutine_function_and_restart_policy_triples:
+                    task_group.create_task(
+                        self.__run_task(
+                            f'{group_name}/{task_name}',
+                            coroutine_function,
+                            restart_policy,
+                        ),
+                        name=f'{group_name}/{task_name}',
+                    )
+        except* BrokenPipeError:
+            pass
+        except* Exception as exception_group:
+            logger.error(
+                'Task group %r has failed: %s',
+                group_name,
+                ''.join(
+                    traceback.format_exception(
+                        exception_group,
+                    ),
+                ),
+            )
+
+        logger.debug(
+            'Task group %r has ended, %d tasks are running',
+            group_name,
+            self.__running_tasks_count,
+        )
+
+    async def __run_task(
+        self,
+        task_name: str,
+        coroutine_function: Constants.AsyncFunctionType,
+        restart_policy: str,
+    ) -> None:
+        failures_count = 0
+
+        while True:
+            self.__running_tasks_count += 1
+
+            try:
+                await coroutine_function()
+
+                return
+            except (
+                asyncio.CancelledError,
+                BrokenPipeError,
+            ):
+                raise
+            except Exception as exception:
+                if (
+                    restart_policy != RestartPolicy.OnFailure
+                    or failures_count >= self.__max_restarts_count
+                ):
+                    raise
+
+                logger.error(
+                    'Task %r has failed, restarting: %s',
+                    task_name,
+                    ''.join(
+                        traceback.format_exception(
+                            exception,
+                        ),
+                    ),
+                )
+            finally:
+                self.__running_tasks_count -= 1
+
+            await g_common_globals.get_timer_service().sleep(
+                min(
+                    _MIN_RESTART_DELAY * 2**failures_count,
+                    _MAX_RESTART_DELAY,
+                ),
+            )
+
+            failures_count += 1
+
+            self.__restarts_count += 1
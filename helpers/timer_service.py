@@ -0,0 +1,297 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import math
+import time
+import traceback
+import typing
+
+
+logger = logging.getLogger(
+    __name__,
+)
+
+
+# Deadlines are rounded up to a multiple of this, so that timers falling due
+# close to each other fire within a single wakeup of the event loop
+_DEFAULT_GRANULARITY = 0.05  # s
+
+
+class Timer(object):
+    __slots__ = (
+        '__args',
+        '__callback',
+        '__deadline',
+        '__is_cancelled',
+    )
+
+    def __init__(
+        self,
+        deadline: float,
+        callback: typing.Callable[..., typing.Any],
+        args: tuple[typing.Any, ...],
+    ) -> None:
+        super(Timer, self).__init__()
+
+        self.__args = args
+
+        self.__callback = callback
+
+        self.__deadline = deadline
+
+        self.__is_cancelled = False
+
+    def cancel(
+        self,
+    ) -> None:
+        self.__is_cancelled = True
+
+    def get_deadline(
+        self,
+    ) -> float:
+        return self.__deadline
+
+    def is_cancelled(
+        self,
+    ) -> bool:
+        return self.__is_cancelled
+
+    def run(
+        self,
+    ) -> None:
+        self.__callback(
+            *self.__args,
+        )
+
+
+class TimerService(object):
+    """
+    Deadlines of one event loop kept in a heap, served by a single loop timer.
+
+    Only the earliest deadline is scheduled with the event loop, and all timers
+    due by then fire together, so there is at most one wakeup per granularity
+    step however many features wait for a deadline, and none while nothing is
+    due. Deadlines are time.monotonic() values.
+    """
+
+    __slots__ = (
+        '__event_loop',
+        '__granularity',
+        '__handle',
+        '__handle_deadline',
+        '__sequence_numbers',
+        '__timers_heap',
+    )
+
+    def __init__(
+        self,
+        event_loop: asyncio.AbstractEventLoop,
+        granularity: float = _DEFAULT_GRANULARITY,
+    ) -> None:
+        super(TimerService, self).__init__()
+
+        self.__event_loop = event_loop
+
+        self.__granularity = granularity
+
+        self.__handle: asyncio.TimerHandle | None = None
+
+        self.__handle_deadline: float | None = None
+
+        # Break ties between equal deadlines, so that timers are never compared
+
+        self.__sequence_numbers = itertools.count()
+
+        self.__timers_heap: list[tuple[float, int, Timer]] = []
+
+    def call_at(
+        self,
+        deadline: float,
+        callback: typing.Callable[..., typing.Any],
+        *args: typing.Any,
+    ) -> Timer:
+        granularity = self.__granularity
+
+        deadline = math.ceil(
+            deadline / granularity,
+        ) * granularity
+
+        timer = Timer(
+            deadline,
+            callback,
+            args,
+        )
+
+        heapq.heappush(
+            self.__timers_heap,
+            (
+                deadline,
+                next(self.__sequence_numbers),
+                timer,
+            ),
+        )
+
+        handle_deadline = self.__handle_deadline
+
+        if handle_deadline is None or deadline < handle_deadline:
+            self.__schedule_handle(
+                deadline,
+            )
+
+        return timer
+
+    def call_later(
+        self,
+        delay: float,
+        callback: typing.Callable[..., typing.Any],
+        *args: typing.Any,
+    ) -> Timer:
+        return self.call_at(
+            time.monotonic() + delay,
+            callback,
+            *args,
+        )
+
+    def get_timers_count(
+        self,
+    ) -> int:
+        """Returns the count of scheduled timers, including cancelled ones not yet dropped."""
+        return len(
+            self.__timers_heap,
+        )
+
+    async def sleep(
+        self,
+        delay: float,
+    ) -> None:
+        await self.sleep_until(
+            time.monotonic() + delay,
+        )
+
+    async def sleep_until(
+        self,
+        deadline: float,
+    ) -> None:
+        future = self.__event_loop.create_future()
+
+        timer = self.call_at(
+            deadline,
+            self.__set_future_result,
+            future,
+        )
+
+        try:
+            await future
+        finally:
+            timer.cancel()
+
+    async def wait_for_event(
+        self,
+        event: asyncio.Event,
+        timeout: float | None,
+    ) -> bool:
+        """Waits until the event is set or the timeout expires; returns whether the event is set."""
+        if event.is_set():
+            return True
+
+        if timeout is None:
+            await event.wait()
+
+            return True
+
+        future = self.__event_loop.create_future()
+
+        timer = self.call_later(
+            timeout,
+            self.__set_future_result,
+            future,
+        )
+
+        waiting_task = asyncio.ensure_future(
+            event.wait(),
+        )
+
+        waiting_task.add_done_callback(
+            lambda _: self.__set_future_result(future),
+        )
+
+        try:
+            await future
+        finally:
+            timer.cancel()
+
+            waiting_task.cancel()
+
+        return event.is_set()
+
+    def __on_handle(
+        self,
+    ) -> None:
+        self.__handle = None
+        self.__handle_deadline = None
+
+        timers_heap = self.__timers_heap
+
+        current_time = time.monotonic()
+
+        while timers_heap:
+            deadline, _, timer = timers_heap[0]
+
+            if timer.is_cancelled():
+                heapq.heappop(
+                    timers_heap,
+                )
+
+                continue
+
+            if deadline > current_time:
+                self.__schedule_handle(
+                    deadline,
+                )
+
+                break
+
+            heapq.heappop(
+                timers_heap,
+            )
+
+            try:
+                timer.run()
+            except Exception as exception:
+                logger.error(
+                    'Timer callback has failed: %s',
+                    ''.join(
+                        traceback.format_exception(
+                            exception,
+                        ),
+                    ),
+                )
+
+    def __schedule_handle(
+        self,
+        deadline: float,
+    ) -> None:
+        handle = self.__handle
+
+        if handle is not None:
+            handle.cancel()
+
+        self.__handle = self.__event_loop.call_later(
+            max(
+                deadline - time.monotonic(),
+                0.0,
+            ),
+            self.__on_handle,
+        )
+
+        self.__handle_deadline = deadline
+
+    @staticmethod
+    def __set_future_result(
+        future: asyncio.Future,
+    ) -> None:
+        if not future.done():
+            future.set_result(
+                None,
+            )
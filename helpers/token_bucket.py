@@ -0,0 +1,191 @@
+import asyncio
+import threading
+import time
+
+
+# Throughput is measured over windows of this length
+_RATE_WINDOW_DURATION = 1.0  # s
+
+
+class TokenBucket(object):
+    """
+    Token bucket rate limiter of outbound bytes with a burst allowance.
+
+    Tokens refill at the rate up to the burst size. Consuming more tokens than
+    available puts the bucket into debt, and the consumer sleeps until the debt
+    is paid off, so callers queue up in order and frames larger than the burst
+    size still pass. Without a rate nothing is ever delayed.
+
+    The bucket is shared by the GUI loop and the networking loop, so its state
+    is only changed under a lock; sleeping is done outside of it.
+    """
+
+    __slots__ = (
+        '__burst_bytes_count',
+        '__last_refill_time',
+        '__lock',
+        '__rate',
+        '__rate_bytes_per_second',
+        '__rate_window_bytes_count',
+        '__rate_window_start_time',
+        '__tokens_count',
+    )
+
+    def __init__(
+        self,
+        rate_bytes_per_second: float | None,
+        burst_bytes_count: int,
+    ) -> None:
+        super(TokenBucket, self).__init__()
+
+        current_time = time.monotonic()
+
+        self.__burst_bytes_count = burst_bytes_count
+
+        self.__last_refill_time = current_time
+
+        self.__lock = threading.Lock()
+
+        self.__rate = 0.0
+
+        self.__rate_bytes_per_second = rate_bytes_per_second
+
+        self.__rate_window_bytes_count = 0
+
+        self.__rate_window_start_time = current_time
+
+        self.__tokens_count = float(
+            burst_bytes_count,
+        )
+
+    async def consume(
+        self,
+        bytes_count: int,
+    ) -> None:
+        rate_bytes_per_second = self.__rate_bytes_per_second
+
+        with self.__lock:
+            current_time = time.monotonic()
+
+            self.__measure_rate(
+                bytes_count,
+                current_time,
+            )
+
+            if not rate_bytes_per_second:
+                return
+
+            self.__refill(
+                current_time,
+            )
+
+            tokens_count = self.__tokens_count = self.__tokens_count - bytes_count
+
+        if tokens_count < 0:
+            await asyncio.sleep(
+                -tokens_count / rate_bytes_per_second,
+            )
+
+    def get_burst_bytes_count(
+        self,
+    ) -> int:
+        return self.__burst_bytes_count
+
+    def get_queue_delay(
+        self,
+    ) -> float:
+        """Returns how long bytes consumed now would be delayed by the debt of earlier consumers."""
+        rate_bytes_per_second = self.__rate_bytes_per_second
+
+        if not rate_bytes_per_second:
+            return 0.0
+
+        with self.__lock:
+            self.__refill(
+                time.monotonic(),
+            )
+
+            tokens_count = self.__tokens_count
+
+        return max(
+            -tokens_count / rate_bytes_per_second,
+            0.0,
+        )
+
+    def get_rate(
+        self,
+    ) -> float:
+        """Returns the measured throughput in bytes per second."""
+        with self.__lock:
+            if (
+                time.monotonic() - self.__rate_window_start_time
+                >= 2 * _RATE_WINDOW_DURATION
+            ):
+                # Nothing was consumed for a whole window
+
+                return 0.0
+
+            return self.__rate
+
+    def get_rate_bytes_per_second(
+        self,
+    ) -> float | None:
+        return self.__rate_bytes_per_second
+
+    async def wait_for_tokens(
+        self,
+        bytes_count: int,
+    ) -> None:
+        """Waits without consuming until the bytes could pass without delay, e.g. before queueing optional traffic."""
+        rate_bytes_per_second = self.__rate_bytes_per_second
+
+        if not rate_bytes_per_second:
+            return
+
+        bytes_count = min(
+            bytes_count,
+            self.__burst_bytes_count,
+        )
+
+        while True:
+            with self.__lock:
+                self.__refill(
+                    time.monotonic(),
+                )
+
+                missing_tokens_count = bytes_count - self.__tokens_count
+
+            if missing_tokens_count <= 0:
+                return
+
+            await asyncio.sleep(
+                missing_tokens_count / rate_bytes_per_second,
+            )
+
+    def __measure_rate(  # called under the lock
+        self,
+        bytes_count: int,
+        current_time: float,
+    ) -> None:
+        rate_window_duration = current_time - self.__rate_window_start_time
+
+        if rate_window_duration >= _RATE_WINDOW_DURATION:
+            self.__rate = self.__rate_window_bytes_count / rate_window_duration
+
+            self.__rate_window_bytes_count = 0
+
+            self.__rate_window_start_time = current_time
+
+        self.__rate_window_bytes_count += bytes_count
+
+    def __refill(  # called under the lock
+        self,
+        current_time: float,
+    ) -> None:
+        self.__tokens_count = min(
+            self.__tokens_count
+            + (current_time - self.__last_refill_time) * self.__rate_bytes_per_second,
+            self.__burst_bytes_count,
+        )
+
+        self.__last_refill_time = current_time
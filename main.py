@@ -21,6 +21,10 @@ from common import (
     Constants,
 )
 
+from globals.common import (
+    g_common_globals,
+)
+
 from gui.main_window import (
     MainWindow,
 )
@@ -48,6 +52,19 @@ def _parse_bool_env(name: str, default: bool = False) -> bool:
 
 _IS_DEBUG = _parse_bool_env('IS_DEBUG', default=False)
 
+# Runs the data connections on their own event loop in a background thread,
+# so that a busy GUI does not delay pings and acknowledgements
+_IS_NETWORKING_THREAD_ENABLED = _parse_bool_env(
+    'IS_NETWORKING_THREAD_ENABLED',
+    default=False,
+)
+
+# Runs the networking loop on uvloop; the GUI loop is always the Qt one
+_IS_UVLOOP_ENABLED = _parse_bool_env(
+    'IS_UVLOOP_ENABLED',
+    default=False,
+)
+
 
 logger = logging.getLogger(
     __name__,
@@ -78,13 +95,14 @@ async def run_application(
 
     window = MainWindow()
 
-    window.show()
+    application.aboutToQuit.connect(  # noqa
+        window.fini,
+    )
 
-    # Step 1: create destination if needed
+    window.show()
 
-    asyncio.create_task(
-        window.update_local_i2p_node_destination(),
-    )
+    # The window creates the destination if needed, and the SAM session,
+    # once its configuration has been read
 
     # application.exec()
 
@@ -151,11 +169,35 @@ def main() -> None:
         py_qt_event_loop,
     )
 
-    py_qt_event_loop.run_until_complete(
-        run_application(
-            application,
+    if _IS_NETWORKING_THREAD_ENABLED:
+        event_loop_factory = asyncio.new_event_loop
+
+        if _IS_UVLOOP_ENABLED:
+            try:
+                import uvloop
+            except ImportError:  # optional dependency, not available on Windows
+                logger.warning(
+                    'uvloop is not installed, using the default networking loop',
+                )
+            else:
+                event_loop_factory = uvloop.new_event_loop
+
+        g_common_globals.start_networking_loop(
+            event_loop_factory,
         )
-    )
+    elif _IS_UVLOOP_ENABLED:
+        logger.warning(
+            'uvloop only runs the networking loop, which is not enabled',
+        )
+
+    try:
+        py_qt_event_loop.run_until_complete(
+            run_application(
+                application,
+            )
+        )
+    finally:
+        g_common_globals.stop_networking_loop()
 
     # asyncio.run(
     #     run_application(
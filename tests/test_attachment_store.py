@@ -0,0 +1,23 @@
+import pytest
+
+from helpers.attachment_store import (
+    AttachmentStore,
+)
+
+
+def test_write_chunk_with_incorrect_attachment_id(
+    tmp_path,
+) -> None:
+    attachment_store = AttachmentStore(
+        str(tmp_path / 'attachments'),
+    )
+
+    with pytest.raises(ValueError):
+        attachment_store.write_chunk(
+            '../' + 61 * 'a',
+            1,
+            0,
+            b'a',
+        )
+
+    assert not (tmp_path / ('a' * 61)).exists()
@@ -0,0 +1,107 @@
+import asyncio
+import pathlib
+
+import orjson
+
+from helpers.config_store import (
+    ConfigStore,
+)
+
+
+def test_reads_existing_config(
+    tmp_path: pathlib.Path,
+) -> None:
+    config_file_path = tmp_path / 'config.json'
+
+    config_file_path.write_bytes(
+        orjson.dumps(
+            {
+                'key': 'value',
+            },
+        ),
+    )
+
+    config_store = ConfigStore(
+        str(config_file_path),
+    )
+
+    assert config_store.get_raw_data() == {
+        'key': 'value',
+    }
+
+    config_store.close()
+
+
+def test_changes_are_written_together_after_delay(
+    tmp_path: pathlib.Path,
+) -> None:
+    config_file_path = tmp_path / 'config.json'
+
+    config_store = ConfigStore(
+        str(config_file_path),
+        write_delay=0.05,
+    )
+
+    async def run() -> None:
+        raw_data = config_store.get_raw_data()
+
+        for value in range(3):
+            raw_data['key'] = value
+
+            config_store.save()
+
+        assert not config_file_path.exists()
+
+        await asyncio.sleep(
+            0.3,
+        )
+
+        assert config_file_path.exists()
+
+    asyncio.run(
+        run(),
+    )
+
+    # Waits for the write
+
+    config_store.close()
+
+    assert orjson.loads(
+        config_file_path.read_bytes(),
+    ) == {
+        'key': 2,
+    }
+
+    assert list(tmp_path.iterdir()) == [
+        config_file_path,
+    ]
+
+
+def test_close_writes_pending_changes(
+    tmp_path: pathlib.Path,
+) -> None:
+    config_file_path = tmp_path / 'config.json'
+
+    config_store = ConfigStore(
+        str(config_file_path),
+        write_delay=60.0,
+    )
+
+    async def run() -> None:
+        config_store.get_raw_data()['key'] = 'value'
+
+        config_store.save()
+
+    asyncio.run(
+        run(),
+    )
+
+    # No event loop is running anymore
+
+    config_store.close()
+
+    assert orjson.loads(
+        config_file_path.read_bytes(),
+    ) == {
+        'key': 'value',
+    }
@@ -0,0 +1,498 @@
+import asyncio
+import hashlib
+import socket
+import struct
+
+import orjson
+
+from helpers.connection import (
+    Connection,
+)
+
+from helpers.frame import (
+    AttachmentChunkFrame,
+)
+
+
+_FRAME_HEADER_STRUCT = struct.Struct(
+    '!I',
+)
+
+# The event loop only keeps weak references to tasks
+_reading_tasks: set[asyncio.Task] = set()
+
+
+async def _create_connection_pair(
+    **kwargs,
+) -> tuple[Connection, Connection]:
+    left_socket, right_socket = socket.socketpair()
+
+    left_reader, left_writer = await asyncio.open_connection(
+        sock=left_socket,
+    )
+
+    right_reader, right_writer = await asyncio.open_connection(
+        sock=right_socket,
+    )
+
+    return (
+        Connection(
+            left_reader,
+            left_writer,
+            **kwargs,
+        ),
+        Connection(
+            right_reader,
+            right_writer,
+            **kwargs,
+        ),
+    )
+
+
+def _start_reading(
+    connection: Connection,
+) -> asyncio.Queue:
+    """Hands the raw data read from the connection over to a queue, which gets None once the connection is closed."""
+    received_raw_data_queue: asyncio.Queue = asyncio.Queue()
+
+    async def read() -> None:
+        while True:
+            raw_data = await connection.read_raw_data()
+
+            received_raw_data_queue.put_nowait(
+                raw_data,
+            )
+
+            if raw_data is None:
+                return
+
+    reading_task = asyncio.create_task(
+        read(),
+    )
+
+    _reading_tasks.add(
+        reading_task,
+    )
+
+    reading_task.add_done_callback(
+        _reading_tasks.discard,
+    )
+
+    return received_raw_data_queue
+
+
+async def _create_handshaken_connection_pair(
+    **kwargs,
+) -> tuple[Connection, asyncio.Queue, Connection, asyncio.Queue]:
+    left_connection, right_connection = await _create_connection_pair(
+        **kwargs,
+    )
+
+    # Hellos are consumed by read_raw_data(), so both sides read meanwhile
+
+    left_received_raw_data_queue = _start_reading(
+        left_connection,
+    )
+
+    right_received_raw_data_queue = _start_reading(
+        right_connection,
+    )
+
+    for connection in (
+        left_connection,
+        right_connection,
+    ):
+        await connection.send_hello_raw_data_async()
+
+    for connection in (
+        left_connection,
+        right_connection,
+    ):
+        assert await connection.wait_for_handshake_async()
+
+    return (
+        left_connection,
+        left_received_raw_data_queue,
+        right_connection,
+        right_received_raw_data_queue,
+    )
+
+
+def _close(
+    *connections: Connection,
+) -> None:
+    for connection in connections:
+        connection.close()
+
+
+def test_handshake_negotiates_all_features() -> None:
+    async def run() -> None:
+        (
+            left_connection,
+            _,
+            right_connection,
+            _,
+        ) = await _create_handshaken_connection_pair()
+
+        for connection in (
+            left_connection,
+            right_connection,
+        ):
+            assert connection.get_protocol_version() == 2
+            assert connection.get_compression_codec_name() is not None
+            assert {
+                'attachment_chunks',
+                'batching',
+                'fragmentation',
+            } <= connection.get_feature_names()
+
+        _close(
+            left_connection,
+            right_connection,
+        )
+
+    asyncio.run(
+        run(),
+    )
+
+
+def test_round_trip_of_compressed_frame() -> None:
+    raw_data = {
+        'id': 1,
+        'text': 16 * 1024 * 'Compressible text. ',
+        'type': 'message',
+    }
+
+    async def run() -> None:
+        (
+            left_connection,
+            _,
+            right_connection,
+            right_received_raw_data_queue,
+        ) = await _create_handshaken_connection_pair()
+
+        await left_connection.send_raw_data_async(
+            raw_data,
+        )
+
+        assert await right_received_raw_data_queue.get() == raw_data
+
+        metrics = left_connection.get_metrics()
+
+        assert metrics['compression_ratio'] < 0.1
+
+        _close(
+            left_connection,
+            right_connection,
+        )
+
+    asyncio.run(
+        run(),
+    )
+
+
+def test_round_trip_of_fragmented_frame() -> None:
+    # Hashes do not compress, so the frame stays larger than a fragment
+
+    raw_data = {
+        'id': 1,
+        'text': ''.join(
+            hashlib.sha256(
+                str(index).encode(),
+            ).hexdigest()
+            for index in range(16 * 1024)
+        ),
+        'type': 'message',
+    }
+
+    async def run() -> None:
+        (
+            left_connection,
+            _,
+            right_connection,
+            right_received_raw_data_queue,
+        ) = await _create_handshaken_connection_pair()
+
+        flushed_frames_count = left_connection.get_metrics()['flushed_frames_count']
+
+        await left_connection.send_raw_data_async(
+            raw_data,
+        )
+
+        assert await right_received_raw_data_queue.get() == raw_data
+
+        assert (
+            left_connection.get_metrics()['flushed_frames_count']
+            - flushed_frames_count
+            > 1
+        )
+
+        _close(
+            left_connection,
+            right_connection,
+        )
+
+    asyncio.run(
+        run(),
+    )
+
+
+def test_round_trip_of_batched_frames() -> None:
+    raw_data_list = [
+        {
+            'id': message_id,
+            'text': f'Message {message_id}',
+            'type': 'message',
+        }
+        for message_id in range(100)
+    ]
+
+    async def run() -> None:
+        (
+            left_connection,
+            _,
+            right_connection,
+            right_received_raw_data_queue,
+        ) = await _create_handshaken_connection_pair()
+
+        flushed_frames_count = left_connection.get_metrics()['flushed_frames_count']
+
+        for raw_data in raw_data_list:
+            left_connection.send_raw_data(
+                raw_data,
+            )
+
+        for raw_data in raw_data_list:
+            assert await right_received_raw_data_queue.get() == raw_data
+
+        assert (
+            left_connection.get_metrics()['flushed_frames_count']
+            - flushed_frames_count
+            < len(raw_data_list)
+        )
+
+        _close(
+            left_connection,
+            right_connection,
+        )
+
+    asyncio.run(
+        run(),
+    )
+
+
+def test_round_trip_of_spooled_attachment_chunk() -> None:
+    attachment_bytes = b''.join(
+        hashlib.sha256(
+            str(index).encode(),
+        ).digest()
+        for index in range(8 * 1024)
+    )
+
+    attachment_id = hashlib.sha256(
+        attachment_bytes,
+    ).hexdigest()
+
+    async def run() -> None:
+        # The chunk is larger than frames kept in memory, so it is read
+        # through a temporary file
+
+        (
+            left_connection,
+            _,
+            right_connection,
+            right_received_raw_data_queue,
+        ) = await _create_handshaken_connection_pair(
+            max_in_memory_frame_bytes_count=64 * 1024,
+        )
+
+        offset = await left_connection.send_attachment_chunk_async(
+            attachment_id,
+            'png',
+            attachment_bytes,
+            0,
+            len(attachment_bytes),
+        )
+
+        assert offset == len(attachment_bytes)
+
+        frame = await right_received_raw_data_queue.get()
+
+        assert isinstance(frame, AttachmentChunkFrame)
+        assert frame.get_attachment_id() == attachment_id
+        assert frame.get_attachment_bytes_count() == len(attachment_bytes)
+        assert frame.get_attachment_kind() == 'png'
+        assert frame.get_offset() == 0
+        assert frame.get_data() == attachment_bytes
+
+        _close(
+            left_connection,
+            right_connection,
+        )
+
+    asyncio.run(
+        run(),
+    )
+
+
+async def _create_legacy_peer_connection_pair() -> tuple[
+    Connection,
+    asyncio.StreamReader,
+    asyncio.StreamWriter,
+]:
+    left_socket, right_socket = socket.socketpair()
+
+    left_reader, left_writer = await asyncio.open_connection(
+        sock=left_socket,
+    )
+
+    right_reader, right_writer = await asyncio.open_connection(
+        sock=right_socket,
+    )
+
+    return (
+        Connection(
+            left_reader,
+            left_writer,
+        ),
+        right_reader,
+        right_writer,
+    )
+
+
+async def _read_legacy_raw_data(
+    reader: asyncio.StreamReader,
+) -> dict:
+    (frame_bytes_count,) = _FRAME_HEADER_STRUCT.unpack(
+        await reader.readexactly(
+            _FRAME_HEADER_STRUCT.size,
+        ),
+    )
+
+    # Any of the flags in the high bits would make the length huge
+
+    return orjson.loads(
+        await reader.readexactly(
+            frame_bytes_count,
+        ),
+    )
+
+
+def test_hello_fallback_with_peer_without_hello() -> None:
+    raw_data = {
+        'id': 1,
+        'text': 16 * 1024 * 'Compressible text. ',
+        'type': 'message',
+    }
+
+    async def run() -> None:
+        (
+            connection,
+            legacy_reader,
+            legacy_writer,
+        ) = await _create_legacy_peer_connection_pair()
+
+        received_raw_data_queue = _start_reading(
+            connection,
+        )
+
+        await connection.send_hello_raw_data_async()
+
+        # Peers that predate the handshake just ignore the hello
+
+        assert (await _read_legacy_raw_data(legacy_reader))['type'] == 'hello'
+
+        legacy_writer.write(
+            Connection.encode_raw_data(
+                {
+                    'id': 1,
+                    'text': 'Hello',
+                    'type': 'message',
+                },
+            ),
+        )
+
+        assert (await received_raw_data_queue.get())['text'] == 'Hello'
+
+        assert not await connection.wait_for_handshake_async(
+            timeout=0.1,
+        )
+
+        assert connection.get_protocol_version() == 0
+        assert connection.get_compression_codec_name() is None
+        assert not connection.get_feature_names()
+
+        # Neither compressed nor batched
+
+        await connection.send_raw_data_async(
+            raw_data,
+        )
+
+        assert await _read_legacy_raw_data(legacy_reader) == raw_data
+
+        connection.close()
+
+        legacy_writer.close()
+
+    asyncio.run(
+        run(),
+    )
+
+
+def test_hello_fallback_with_peer_with_first_hello_version() -> None:
+    async def run() -> None:
+        (
+            connection,
+            legacy_reader,
+            legacy_writer,
+        ) = await _create_legacy_peer_connection_pair()
+
+        _start_reading(
+            connection,
+        )
+
+        await connection.send_hello_raw_data_async()
+
+        # The first hello carried neither a version nor features
+
+        legacy_writer.write(
+            Connection.encode_raw_data(
+                {
+                    'compression_list': [
+                        'zlib',
+                    ],
+                    'type': 'hello',
+                },
+            ),
+        )
+
+        assert await connection.wait_for_handshake_async()
+
+        assert connection.get_protocol_version() == 1
+        assert connection.get_compression_codec_name() == 'zlib'
+        assert not connection.get_feature_names()
+        assert not connection.is_attachment_chunks_supported()
+
+        for message_id in range(2):
+            await connection.send_raw_data_async(
+                {
+                    'id': message_id,
+                    'text': 'Hello',
+                    'type': 'message',
+                },
+            )
+
+        # One frame per raw data, as the batching is not negotiated
+
+        assert (await _read_legacy_raw_data(legacy_reader))['type'] == 'hello'
+
+        for message_id in range(2):
+            assert (await _read_legacy_raw_data(legacy_reader))['id'] == message_id
+
+        connection.close()
+
+        legacy_writer.close()
+
+    asyncio.run(
+        run(),
+    )
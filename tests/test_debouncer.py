@@ -0,0 +1,137 @@
+import asyncio
+
+from helpers.debouncer import (
+    Debouncer,
+)
+
+
+_DELAY = 0.05  # s
+
+
+def test_only_last_of_burst_runs() -> None:
+    async def run() -> list[int]:
+        debouncer = Debouncer(
+            'test',
+            _DELAY,
+        )
+
+        values: list[int] = []
+
+        for value in range(5):
+
+            async def append(
+                value: int = value,
+            ) -> None:
+                values.append(
+                    value,
+                )
+
+            debouncer.schedule(
+                append,
+            )
+
+        assert debouncer.is_pending()
+
+        await asyncio.sleep(
+            4 * _DELAY,
+        )
+
+        assert not debouncer.is_pending()
+
+        return values
+
+    assert asyncio.run(
+        run(),
+    ) == [
+        4,
+    ]
+
+
+def test_schedule_cancels_running_coroutine_function() -> None:
+    async def run() -> list[str]:
+        debouncer = Debouncer(
+            'test',
+            _DELAY,
+        )
+
+        events: list[str] = []
+
+        async def run_slowly() -> None:
+            events.append(
+                'started',
+            )
+
+            try:
+                await asyncio.sleep(
+                    10.0,
+                )
+            except asyncio.CancelledError:
+                events.append(
+                    'cancelled',
+                )
+
+                raise
+
+        async def run_quickly() -> None:
+            events.append(
+                'finished',
+            )
+
+        debouncer.schedule(
+            run_slowly,
+        )
+
+        await asyncio.sleep(
+            4 * _DELAY,
+        )
+
+        debouncer.schedule(
+            run_quickly,
+        )
+
+        await asyncio.sleep(
+            4 * _DELAY,
+        )
+
+        return events
+
+    assert asyncio.run(
+        run(),
+    ) == [
+        'started',
+        'cancelled',
+        'finished',
+    ]
+
+
+def test_cancel() -> None:
+    async def run() -> list[str]:
+        debouncer = Debouncer(
+            'test',
+            _DELAY,
+        )
+
+        events: list[str] = []
+
+        async def append() -> None:
+            events.append(
+                'run',
+            )
+
+        debouncer.schedule(
+            append,
+        )
+
+        debouncer.cancel()
+
+        assert not debouncer.is_pending()
+
+        await asyncio.sleep(
+            4 * _DELAY,
+        )
+
+        return events
+
+    assert not asyncio.run(
+        run(),
+    )
@@ -0,0 +1,104 @@
+import pytest
+
+from helpers.frame import (
+    AttachmentAckFrame,
+    FrameError,
+    PingFrame,
+    decode_frame,
+)
+
+
+def test_decode_ping_frame() -> None:
+    frame = decode_frame(
+        {
+            'timestamp_ms': 1234,
+            'type': 'ping',
+        },
+    )
+
+    assert isinstance(frame, PingFrame)
+    assert frame.get_timestamp_ms() == 1234
+
+
+def test_decode_legacy_ping_frame() -> None:
+    frame = decode_frame(
+        {
+            'type': 'ping',
+        },
+    )
+
+    assert isinstance(frame, PingFrame)
+    assert frame.get_timestamp_ms() is None
+
+
+def test_decode_ping_frame_with_incorrect_timestamp() -> None:
+    with pytest.raises(FrameError):
+        decode_frame(
+            {
+                'timestamp_ms': '1234',
+                'type': 'ping',
+            },
+        )
+
+
+def test_decode_rejecting_attachment_ack_frame() -> None:
+    attachment_id = 64 * 'a'
+
+    frame = decode_frame(
+        {
+            'attachment_id': attachment_id,
+            'is_rejected': True,
+            'offset': 0,
+            'type': 'attachment_ack',
+        },
+    )
+
+    assert isinstance(frame, AttachmentAckFrame)
+    assert frame.get_attachment_id() == attachment_id
+    assert frame.is_rejected()
+
+    frame = decode_frame(
+        {
+            'attachment_id': attachment_id,
+            'offset': 1024,
+            'type': 'attachment_ack',
+        },
+    )
+
+    assert isinstance(frame, AttachmentAckFrame)
+    assert not frame.is_rejected()
+
+
+@pytest.mark.parametrize(
+    'raw_data',
+    (
+        None,
+        1,
+        'ping',
+        [
+            'ping',
+        ],
+    ),
+)
+def test_decode_frame_from_non_object(
+    raw_data: object,
+) -> None:
+    with pytest.raises(FrameError):
+        decode_frame(
+            raw_data,
+        )
+
+
+def test_decode_json_attachment_chunk_frame() -> None:
+    # Attachment chunks only ever come as binary frames
+
+    with pytest.raises(FrameError):
+        decode_frame(
+            {
+                'data': '',
+                'id': '../../config',
+                'offset': 0,
+                'size': 0,
+                'type': 'attachment_chunk',
+            },
+        )
@@ -0,0 +1,145 @@
+import asyncio
+
+import pytest
+
+from globals.common import (
+    g_common_globals,
+)
+
+from helpers.reconnect_backoff import (
+    ReconnectBackoff,
+)
+
+
+class _InstantTimerService(object):
+    """Records the timeouts waited for instead of waiting."""
+
+    def __init__(
+        self,
+    ) -> None:
+        self.timeouts: list[float] = []
+
+    async def wait_for_event(
+        self,
+        event: asyncio.Event,
+        timeout: float | None,
+    ) -> bool:
+        self.timeouts.append(
+            timeout,
+        )
+
+        return event.is_set()
+
+
+@pytest.fixture
+def timer_service(
+    monkeypatch: pytest.MonkeyPatch,
+) -> _InstantTimerService:
+    timer_service = _InstantTimerService()
+
+    monkeypatch.setattr(
+        type(g_common_globals),
+        'get_timer_service',
+        lambda _: timer_service,
+    )
+
+    return timer_service
+
+
+def test_delays_double_up_to_max_delay(
+    timer_service: _InstantTimerService,
+) -> None:
+    reconnect_backoff = ReconnectBackoff(
+        'test',
+        min_delay=1.0,
+        max_delay=8.0,
+    )
+
+    async def run() -> None:
+        for _ in range(6):
+            assert not await reconnect_backoff.wait()
+
+    asyncio.run(
+        run(),
+    )
+
+    for timeout, max_timeout in zip(
+        timer_service.timeouts,
+        (1.0, 2.0, 4.0, 8.0, 8.0, 8.0),
+    ):
+        assert max_timeout / 2 <= timeout <= max_timeout
+
+
+def test_long_outage_does_not_overflow(
+    timer_service: _InstantTimerService,
+) -> None:
+    reconnect_backoff = ReconnectBackoff(
+        'test',
+    )
+
+    async def run() -> None:
+        for _ in range(2000):
+            await reconnect_backoff.wait()
+
+    asyncio.run(
+        run(),
+    )
+
+    assert reconnect_backoff.get_failures_count() == 2000
+    assert 15.0 <= timer_service.timeouts[-1] <= 30.0
+
+
+def test_wake_starts_over_from_min_delay(
+    timer_service: _InstantTimerService,
+) -> None:
+    reconnect_backoff = ReconnectBackoff(
+        'test',
+        min_delay=1.0,
+        max_delay=30.0,
+    )
+
+    async def run() -> bool:
+        for _ in range(5):
+            await reconnect_backoff.wait()
+
+        reconnect_backoff.wake()
+
+        return await reconnect_backoff.wait()
+
+    assert asyncio.run(
+        run(),
+    )
+
+    assert timer_service.timeouts[-1] <= 1.0
+
+    # The wake-up was consumed by the wait it cut short
+
+    asyncio.run(
+        reconnect_backoff.wait(),
+    )
+
+    assert timer_service.timeouts[-1] <= 2.0
+
+
+def test_reset_starts_over_from_min_delay(
+    timer_service: _InstantTimerService,
+) -> None:
+    reconnect_backoff = ReconnectBackoff(
+        'test',
+        min_delay=1.0,
+        max_delay=30.0,
+    )
+
+    async def run() -> None:
+        for _ in range(5):
+            await reconnect_backoff.wait()
+
+        reconnect_backoff.reset()
+
+        await reconnect_backoff.wait()
+
+    asyncio.run(
+        run(),
+    )
+
+    assert timer_service.timeouts[-1] <= 1.0
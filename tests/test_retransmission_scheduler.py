@@ -0,0 +1,165 @@
+from helpers.retransmission_scheduler import (
+    RetransmissionScheduler,
+)
+
+
+_RETRANSMISSION_TIMEOUT = 1.0  # s
+
+_MAX_RETRANSMISSION_TIMEOUT = 4.0  # s
+
+
+def test_unsent_messages_are_due_up_to_in_flight_limit() -> None:
+    retransmission_scheduler = RetransmissionScheduler(
+        2,
+    )
+
+    assert retransmission_scheduler.get_due_message_ids(
+        range(5),
+        _RETRANSMISSION_TIMEOUT,
+        _MAX_RETRANSMISSION_TIMEOUT,
+        0.0,
+    ) == [
+        0,
+        1,
+    ]
+
+    retransmission_scheduler.on_sent(
+        0,
+        0.0,
+    )
+
+    assert retransmission_scheduler.get_in_flight_messages_count() == 1
+
+    assert retransmission_scheduler.get_due_message_ids(
+        range(5),
+        _RETRANSMISSION_TIMEOUT,
+        _MAX_RETRANSMISSION_TIMEOUT,
+        0.0,
+    ) == [
+        1,
+    ]
+
+
+def test_retransmission_timeout_doubles_up_to_max() -> None:
+    retransmission_scheduler = RetransmissionScheduler(
+        1,
+    )
+
+    sent_time = 0.0
+
+    for expected_timeout in (1.0, 2.0, 4.0, 4.0):
+        retransmission_scheduler.on_sent(
+            0,
+            sent_time,
+        )
+
+        assert retransmission_scheduler.get_next_due_time(
+            _RETRANSMISSION_TIMEOUT,
+            _MAX_RETRANSMISSION_TIMEOUT,
+        ) == sent_time + expected_timeout
+
+        assert not retransmission_scheduler.get_due_message_ids(
+            [
+                0,
+            ],
+            _RETRANSMISSION_TIMEOUT,
+            _MAX_RETRANSMISSION_TIMEOUT,
+            sent_time + expected_timeout - 0.1,
+        )
+
+        sent_time += expected_timeout
+
+        assert retransmission_scheduler.get_due_message_ids(
+            [
+                0,
+            ],
+            _RETRANSMISSION_TIMEOUT,
+            _MAX_RETRANSMISSION_TIMEOUT,
+            sent_time,
+        ) == [
+            0,
+        ]
+
+
+def test_many_attempts_do_not_overflow() -> None:
+    retransmission_scheduler = RetransmissionScheduler(
+        1,
+    )
+
+    for _ in range(2000):
+        retransmission_scheduler.on_sent(
+            0,
+            0.0,
+        )
+
+    assert retransmission_scheduler.get_next_due_time(
+        _RETRANSMISSION_TIMEOUT,
+        _MAX_RETRANSMISSION_TIMEOUT,
+    ) == _MAX_RETRANSMISSION_TIMEOUT
+
+
+def test_rtt_is_only_measured_for_single_attempt() -> None:
+    retransmission_scheduler = RetransmissionScheduler(
+        2,
+    )
+
+    retransmission_scheduler.on_sent(
+        0,
+        10.0,
+    )
+
+    assert retransmission_scheduler.on_acked(
+        0,
+        10.5,
+    ) == 0.5
+
+    # The acknowledgement may belong to either attempt (Karn's algorithm)
+
+    for sent_time in (20.0, 21.0):
+        retransmission_scheduler.on_sent(
+            1,
+            sent_time,
+        )
+
+    assert retransmission_scheduler.on_acked(
+        1,
+        21.5,
+    ) is None
+
+    # Unknown and already acknowledged messages
+
+    assert retransmission_scheduler.on_acked(
+        1,
+        22.0,
+    ) is None
+
+    assert not retransmission_scheduler.get_in_flight_messages_count()
+
+
+def test_clear_makes_all_messages_due() -> None:
+    retransmission_scheduler = RetransmissionScheduler(
+        2,
+    )
+
+    for message_id in range(2):
+        retransmission_scheduler.on_sent(
+            message_id,
+            0.0,
+        )
+
+    retransmission_scheduler.clear()
+
+    assert retransmission_scheduler.get_next_due_time(
+        _RETRANSMISSION_TIMEOUT,
+        _MAX_RETRANSMISSION_TIMEOUT,
+    ) is None
+
+    assert retransmission_scheduler.get_due_message_ids(
+        range(2),
+        _RETRANSMISSION_TIMEOUT,
+        _MAX_RETRANSMISSION_TIMEOUT,
+        0.0,
+    ) == [
+        0,
+        1,
+    ]
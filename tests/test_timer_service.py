@@ -0,0 +1,222 @@
+import asyncio
+import logging
+import math
+import time
+
+import pytest
+
+from helpers.timer_service import (
+    TimerService,
+)
+
+
+def test_timers_fire_in_deadline_order() -> None:
+    async def run() -> list[str]:
+        timer_service = TimerService(
+            asyncio.get_running_loop(),
+        )
+
+        callback_names: list[str] = []
+
+        timer_service.call_later(
+            0.2,
+            callback_names.append,
+            'second',
+        )
+
+        timer_service.call_later(
+            0.1,
+            callback_names.append,
+            'first',
+        )
+
+        await timer_service.sleep(
+            0.3,
+        )
+
+        assert not timer_service.get_timers_count()
+
+        return callback_names
+
+    assert asyncio.run(
+        run(),
+    ) == [
+        'first',
+        'second',
+    ]
+
+
+def test_deadlines_are_rounded_up_to_granularity() -> None:
+    granularity = 0.25
+
+    async def run() -> None:
+        timer_service = TimerService(
+            asyncio.get_running_loop(),
+            granularity=granularity,
+        )
+
+        deadline = time.monotonic() + 0.1
+
+        timer = timer_service.call_at(
+            deadline,
+            lambda: None,
+        )
+
+        timer.cancel()
+
+        assert deadline <= timer.get_deadline() < deadline + granularity
+        assert math.isclose(
+            timer.get_deadline() / granularity,
+            round(timer.get_deadline() / granularity),
+        )
+
+    asyncio.run(
+        run(),
+    )
+
+
+def test_cancelled_timer_does_not_fire() -> None:
+    async def run() -> list[str]:
+        timer_service = TimerService(
+            asyncio.get_running_loop(),
+        )
+
+        callback_names: list[str] = []
+
+        timer = timer_service.call_later(
+            0.05,
+            callback_names.append,
+            'cancelled',
+        )
+
+        timer.cancel()
+
+        assert timer.is_cancelled()
+
+        await timer_service.sleep(
+            0.2,
+        )
+
+        return callback_names
+
+    assert not asyncio.run(
+        run(),
+    )
+
+
+def test_failing_callback_does_not_stop_other_timers(
+    caplog: pytest.LogCaptureFixture,
+) -> None:
+    def fail() -> None:
+        raise ValueError('test')
+
+    async def run() -> list[str]:
+        timer_service = TimerService(
+            asyncio.get_running_loop(),
+        )
+
+        callback_names: list[str] = []
+
+        timer_service.call_later(
+            0.05,
+            fail,
+        )
+
+        timer_service.call_later(
+            0.05,
+            callback_names.append,
+            'after_failure',
+        )
+
+        await timer_service.sleep(
+            0.2,
+        )
+
+        return callback_names
+
+    with caplog.at_level(
+        logging.ERROR,
+    ):
+        assert asyncio.run(
+            run(),
+        ) == [
+            'after_failure',
+        ]
+
+    assert 'Timer callback has failed' in caplog.text
+
+
+def test_wait_for_event() -> None:
+    async def run() -> None:
+        timer_service = TimerService(
+            asyncio.get_running_loop(),
+        )
+
+        event = asyncio.Event()
+
+        assert not await timer_service.wait_for_event(
+            event,
+            0.05,
+        )
+
+        asyncio.get_running_loop().call_later(
+            0.05,
+            event.set,
+        )
+
+        start_time = time.monotonic()
+
+        assert await timer_service.wait_for_event(
+            event,
+            10.0,
+        )
+
+        assert time.monotonic() - start_time < 5.0
+
+        # Already set
+
+        assert await timer_service.wait_for_event(
+            event,
+            0.0,
+        )
+
+    asyncio.run(
+        run(),
+    )
+
+
+def test_cancelled_sleep_cancels_its_timer() -> None:
+    async def run() -> None:
+        timer_service = TimerService(
+            asyncio.get_running_loop(),
+        )
+
+        sleeping_task = asyncio.create_task(
+            timer_service.sleep(
+                10.0,
+            ),
+        )
+
+        await asyncio.sleep(
+            0,
+        )
+
+        assert timer_service.get_timers_count() == 1
+
+        sleeping_task.cancel()
+
+        with pytest.raises(asyncio.CancelledError):
+            await sleeping_task
+
+        # The cancelled timer is dropped by the next wakeup, and nothing is
+        # left scheduled
+
+        await timer_service.sleep(
+            0.05,
+        )
+
+        assert not timer_service.get_timers_count()
+
+    asyncio.run(
+        run(),
+    )
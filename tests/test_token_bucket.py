@@ -0,0 +1,216 @@
+import asyncio
+
+import pytest
+
+from helpers import (
+    token_bucket as token_bucket_module,
+)
+
+from helpers.token_bucket import (
+    TokenBucket,
+)
+
+
+class _FakeClock(object):
+    """Stands in for both time.monotonic() and asyncio.sleep() of the token bucket module."""
+
+    def __init__(
+        self,
+    ) -> None:
+        self.current_time = 1000.0
+
+        self.delays: list[float] = []
+
+        self.is_sleep_advancing_time = True
+
+    def monotonic(
+        self,
+    ) -> float:
+        return self.current_time
+
+    async def sleep(
+        self,
+        delay: float,
+    ) -> None:
+        self.delays.append(
+            delay,
+        )
+
+        if self.is_sleep_advancing_time:
+            self.current_time += delay
+
+
+@pytest.fixture
+def clock(
+    monkeypatch: pytest.MonkeyPatch,
+) -> _FakeClock:
+    clock = _FakeClock()
+
+    monkeypatch.setattr(
+        token_bucket_module,
+        'asyncio',
+        clock,
+    )
+
+    monkeypatch.setattr(
+        token_bucket_module,
+        'time',
+        clock,
+    )
+
+    return clock
+
+
+def test_without_rate_nothing_is_delayed(
+    clock: _FakeClock,
+) -> None:
+    token_bucket = TokenBucket(
+        None,
+        1024,
+    )
+
+    asyncio.run(
+        token_bucket.consume(
+            1024 * 1024,
+        ),
+    )
+
+    assert not clock.delays
+    assert token_bucket.get_queue_delay() == 0.0
+
+
+def test_burst_passes_and_debt_is_slept_off(
+    clock: _FakeClock,
+) -> None:
+    token_bucket = TokenBucket(
+        1000.0,
+        500,
+    )
+
+    asyncio.run(
+        token_bucket.consume(
+            500,
+        ),
+    )
+
+    assert not clock.delays
+
+    asyncio.run(
+        token_bucket.consume(
+            250,
+        ),
+    )
+
+    assert clock.delays == [
+        0.25,
+    ]
+
+    # Refilled up to the burst size only
+
+    clock.current_time += 10.0
+
+    asyncio.run(
+        token_bucket.consume(
+            600,
+        ),
+    )
+
+    assert clock.delays[-1] == pytest.approx(0.1)
+
+
+def test_consumers_queue_up_behind_debt(
+    clock: _FakeClock,
+) -> None:
+    clock.is_sleep_advancing_time = False
+
+    token_bucket = TokenBucket(
+        1000.0,
+        500,
+    )
+
+    asyncio.run(
+        token_bucket.consume(
+            750,
+        ),
+    )
+
+    assert token_bucket.get_queue_delay() == pytest.approx(0.25)
+
+    asyncio.run(
+        token_bucket.consume(
+            100,
+        ),
+    )
+
+    assert clock.delays == pytest.approx(
+        [
+            0.25,
+            0.35,
+        ],
+    )
+
+
+def test_wait_for_tokens_does_not_consume(
+    clock: _FakeClock,
+) -> None:
+    token_bucket = TokenBucket(
+        1000.0,
+        500,
+    )
+
+    asyncio.run(
+        token_bucket.consume(
+            500,
+        ),
+    )
+
+    asyncio.run(
+        token_bucket.wait_for_tokens(
+            100,
+        ),
+    )
+
+    assert clock.delays == [
+        pytest.approx(0.1),
+    ]
+
+    # The tokens waited for are still there
+
+    asyncio.run(
+        token_bucket.consume(
+            100,
+        ),
+    )
+
+    assert len(clock.delays) == 1
+
+
+def test_rate_is_measured_per_window(
+    clock: _FakeClock,
+) -> None:
+    token_bucket = TokenBucket(
+        None,
+        1024,
+    )
+
+    asyncio.run(
+        token_bucket.consume(
+            3000,
+        ),
+    )
+
+    clock.current_time += 1.5
+
+    asyncio.run(
+        token_bucket.consume(
+            0,
+        ),
+    )
+
+    assert token_bucket.get_rate() == pytest.approx(2000.0)
+
+    # Nothing consumed for a whole window
+
+    clock.current_time += 3.0
+
+    assert token_bucket.get_rate() == 0.0
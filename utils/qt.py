@@ -28,6 +28,10 @@ from PySide6.QtWidgets import (
 
 _HTML_IMAGE_SOURCE_PNG_BASE_64_PREFIX = 'data:image/png;base64,'
 
+# Images that are stored as attachments are referenced by ID and resolved by
+# the text edit through QTextEdit.loadResource()
+_HTML_IMAGE_SOURCE_ATTACHMENT_PREFIX = 'attachment:'
+
 
 logger = logging.getLogger(
     __name__,
@@ -70,9 +74,41 @@ class QtUtils(object):
             label.setStyleSheet('')
 
     @staticmethod
+    def get_attachment_id(
+        image_html_source: str,
+    ) -> str | None:
+        if not image_html_source.startswith(
+            _HTML_IMAGE_SOURCE_ATTACHMENT_PREFIX,
+        ):
+            return None
+
+        return image_html_source.removeprefix(
+            _HTML_IMAGE_SOURCE_ATTACHMENT_PREFIX,
+        )
+
+    @staticmethod
+    def get_attachment_image_html_text(
+        attachment_id: str,
+    ) -> str:
+        return (
+            f'<img src="{_HTML_IMAGE_SOURCE_ATTACHMENT_PREFIX}{attachment_id}" />'
+        )
+
+    @classmethod
     def get_image_base64_encoded_text(
+        cls,
         image: QImage,
     ) -> str:
+        return b64encode(
+            cls.get_image_png_bytes(
+                image,
+            ),
+        ).decode()
+
+    @staticmethod
+    def get_image_png_bytes(
+        image: QImage,
+    ) -> bytes:
         image_buffer = QBuffer()
 
         image.save(
@@ -80,9 +116,7 @@ class QtUtils(object):
             format=b'png',
         )
 
-        return b64encode(
-            image_buffer.data().data(),
-        ).decode()
+        return image_buffer.data().data()
 
     @classmethod
     def get_image_html_text(
@@ -95,9 +129,11 @@ class QtUtils(object):
             ' />'
         )
 
-    @staticmethod
+    @classmethod
     def parse_html(
+        cls,
         html_text: str,
+        get_attachment_bytes: typing.Callable[[str], bytes | None] | None = None,
     ) -> dict[str, typing.Any]:
         parser = etree.HTMLParser(
             remove_comments=True,
@@ -174,6 +210,39 @@ class QtUtils(object):
                     if images is None:
                         images = []
 
+                    images.append(
+                        image,
+                    )
+                elif (
+                    get_attachment_bytes is not None
+                    and (
+                        attachment_id := cls.get_attachment_id(
+                            image_source,
+                        )
+                    )
+                    is not None
+                ):
+                    attachment_bytes = get_attachment_bytes(
+                        attachment_id,
+                    )
+
+                    image = QImage()
+
+                    if attachment_bytes is None or not (
+                        image.loadFromData(
+                            attachment_bytes,
+                            format=b'png',
+                        )
+                    ):
+                        logger.warning(
+                            f'Could not load image with attachment ID {attachment_id!r}',
+                        )
+
+                        continue
+
+                    if images is None:
+                        images = []
+
                     images.append(
                         image,
                     )